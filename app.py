@@ -1,4 +1,8 @@
-from flask import Flask, render_template, redirect, url_for
+import json
+import os
+
+import click
+from flask import Flask, render_template, redirect, url_for, jsonify
 from flask_login import LoginManager, current_user
 from config import Config
 from models import db, User
@@ -6,13 +10,25 @@ from blueprints.auth import bp as auth_bp
 from blueprints.bookings import bp as bookings_bp
 from blueprints.guard import bp as guard_bp
 from blueprints.admin import bp as admin_bp
-from blueprints.luggage import bp as luggage_bp
+from blueprints.luggage import bp as luggage_bp, split_status_log, STATUS_LOG_SPLIT
 from blueprints.mpesa import bp as mpesa_bp
 from blueprints.billing import bp as billing_bp
-from sqlalchemy import and_, func, or_
-from models import db, User, Booking, Room, Property, Luggage  
+from blueprints.events import bp as events_bp
+from blueprints.reports import bp as reports_bp
+from blueprints.search import bp as search_bp
+from blueprints.uploads import bp as uploads_bp
+from utils import schema
+from utils.occupancy import occupancy, rebuild_from_log
+from utils.passback import passback
+from utils.dashboard import dashboard_counts, owned_property_ids
+from utils.plates import backfill_plate_keys, reset_plate_keys, PLATE_FOLD
+from utils.search import index as search_index
+from utils.tasks import enqueue
+from utils.retention import run_retention
+from utils.rollups import catch_up
+from utils.payments import reconcile as reconcile_payments, expire_subscriptions
 import pytz
-from datetime import datetime, date, time as dt_time
+from datetime import datetime
 NAIROBI_TZ = pytz.timezone("Africa/Nairobi")
 
 def create_app():
@@ -23,6 +39,14 @@ def create_app():
     db.init_app(app)
     with app.app_context():
         db.create_all()
+        schema.upgrade()  # columns/indexes added to existing tables since they were created
+        schema.run_once(PLATE_FOLD, reset_plate_keys)  # keys saved under an older fold
+        schema.run_once(STATUS_LOG_SPLIT, split_status_log)  # host actions logged as scans
+        backfill_plate_keys()
+        rebuild_from_log()
+        if os.getenv("SEARCH_WARM", "1") == "1":
+            enqueue(search_index.warm)
+        passback.load()
 
     login_manager = LoginManager()
     login_manager.login_view = "auth.login_page"
@@ -38,83 +62,60 @@ def create_app():
     app.register_blueprint(luggage_bp)
     app.register_blueprint(mpesa_bp)
     app.register_blueprint(billing_bp)
+    app.register_blueprint(events_bp)
+    app.register_blueprint(reports_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(uploads_bp)
 
-    @app.get("/")
-    def home():
-        if not current_user.is_authenticated:
-            return redirect(url_for("auth.login_page"))
-
+    def _dashboard_tiles():
         # --- Work in Nairobi-local *naive* time to match your DB values ---
         tz = pytz.timezone("Africa/Nairobi")
         now_naive = datetime.now(tz).replace(tzinfo=None)  # e.g. 2025-08-28 14:30:00
-        today = now_naive.date()
-        day_start = datetime.combine(today, dt_time.min)   # 2025-08-28 00:00:00
-        day_end   = datetime.combine(today, dt_time.max)   # 2025-08-28 23:59:59.999999
-
-        # Base filters
-        active_filter = and_(
-            Booking.check_in <= now_naive,
-            Booking.check_out >= now_naive,
-            Booking.status != "cancelled",
-        )
-        today_checkins_filter = and_(
-            Booking.check_in >= day_start,
-            Booking.check_in <= day_end,
-            Booking.status != "cancelled",
-        )
-
-        # Scope by role:
+
+        # one aggregated query per scope, cached for a few seconds
+        tiles = dict(dashboard_counts(current_user, now_naive))
+
+        # live headcount comes from in-memory counters, not the access log
         if current_user.role == "host":
-            # host sees: rooms in properties they own OR rooms with no property
-            # (rooms can be nullable property_id in your schema)
-            active_q = (
-                db.session.query(Booking)
-                .join(Room, Room.id == Booking.room_id)
-                .outerjoin(Property, Property.id == Room.property_id)
-                .filter(
-                    active_filter,
-                    or_(Property.owner_id == current_user.id, Room.property_id.is_(None)),
-                )
-            )
-
-            todays_q = (
-                db.session.query(Booking)
-                .join(Room, Room.id == Booking.room_id)
-                .outerjoin(Property, Property.id == Room.property_id)
-                .filter(
-                    today_checkins_filter,
-                    or_(Property.owner_id == current_user.id, Room.property_id.is_(None)),
-                )
-            )
-
-            luggage_pending_q = (
-                db.session.query(Luggage)
-                .join(Booking, Booking.id == Luggage.booking_id)
-                .join(Room, Room.id == Booking.room_id)
-                .outerjoin(Property, Property.id == Room.property_id)
-                .filter(
-                    Luggage.status == "pending",
-                    or_(Property.owner_id == current_user.id, Room.property_id.is_(None)),
-                )
-            )
+            tiles["inside_now"] = sum(occupancy.properties(owned_property_ids(current_user.id)).values())
         else:
-            # admin sees all
-            active_q = db.session.query(Booking).filter(active_filter)
-            todays_q = db.session.query(Booking).filter(today_checkins_filter)
-            luggage_pending_q = db.session.query(Luggage).filter(Luggage.status == "pending")
-
-        active_stays = active_q.count()
-        todays_checkins = todays_q.count()
-        luggage_pending = luggage_pending_q.count()
-
-        return render_template(
-            "dashboard.html",
-            user=current_user,
-            active_stays=active_stays or 0,
-            todays_checkins=todays_checkins or 0,
-            luggage_pending=luggage_pending or 0,
-        )
+            tiles["inside_now"] = sum(occupancy.properties().values())
+        return tiles
+
+    @app.get("/")
+    def home():
+        if not current_user.is_authenticated:
+            return redirect(url_for("auth.login_page"))
+
+        if current_user.role == "guard":
+            # guard dashboard has no tiles
+            return render_template("dashboard.html", user=current_user)
+
+        return render_template("dashboard.html", user=current_user, **_dashboard_tiles())
+
+    @app.get("/dashboard/counts")
+    def dashboard_counts_json():
+        """Tile values for live refresh (pushed via /events/stream, no timer polling)."""
+        if not current_user.is_authenticated or current_user.role == "guard":
+            return jsonify({"ok": False, "error": "Unauthorized"}), 403
+        return jsonify({"ok": True, **_dashboard_tiles()})
+
+
+    @app.cli.command("retention")
+    @click.option("--dry-run", is_flag=True, help="Report what would be removed without changing anything.")
+    def retention_command(dry_run):
+        """Archive old scan logs to monthly JSONL.gz files and age out upload artifacts."""
+        click.echo(json.dumps(run_retention(dry_run=dry_run), indent=2))
+
+    @app.cli.command("rollups")
+    def rollups_command():
+        """Catch the hourly gate rollups up with the access log."""
+        click.echo(f"{catch_up()} rollup rows written")
 
+    @app.cli.command("mpesa-reconcile")
+    def mpesa_reconcile_command():
+        """Settle M-Pesa payments stuck mid-flight and expire lapsed subscriptions (run every few minutes)."""
+        click.echo(json.dumps({"payments": reconcile_payments(), "subscriptions": expire_subscriptions()}, indent=2))
 
     return app
 
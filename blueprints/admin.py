@@ -1,12 +1,22 @@
 # blueprints/admin.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import json
+from datetime import datetime
+
+from flask import (
+    Blueprint, render_template, request, redirect, url_for, flash,
+    jsonify, abort, Response, stream_with_context,
+)
 from flask_login import login_required, current_user
-from sqlalchemy import asc
 from sqlalchemy import or_
 from models import (
     db, User, Property, Room, Checkpoint,
     ROLE_ADMIN, ROLE_HOST, ROLE_GUARD
 )
+from utils.passback import passback, CHECKPOINT_MODES, MODE_BOTH
+from utils.dashboard import owned_property_ids
+from utils.logs import SOURCES, parse_filters, page, export_csv, export_jsonl
+from utils.retention import load_index, search_archive
+from utils.listing import Listing
 
 bp = Blueprint("admin", __name__, url_prefix="/admin")
 
@@ -26,7 +36,22 @@ def _can_manage():
     return current_user.is_authenticated and current_user.role in (ROLE_ADMIN, ROLE_HOST)
 
 
+def _render_list(template, rows_template, **ctx):
+    """Full page, or just the <tbody> rows when HTMX is paging/sorting/searching."""
+    if request.headers.get("HX-Request") and request.headers.get("HX-Target") == "rows":
+        return render_template(rows_template, **ctx)
+    return render_template(template, **ctx)
+
+
 # ========== PROPERTIES ==========
+_PROPERTY_LIST = Listing(
+    Property.id,
+    {"name": Property.name, "id": Property.id},
+    default_sort="name",
+    search_cols=(Property.name,),
+)
+
+
 @bp.get("/properties")
 @login_required
 def properties_index():
@@ -34,15 +59,17 @@ def properties_index():
         flash("Unauthorized", "error")
         return redirect(url_for("home"))
 
-    if _is_admin():
-        props = Property.query.order_by(asc(Property.name)).all()
-        owners = {u.id: u.name for u in User.query.order_by(asc(User.name)).all()}
-    else:
-        props = Property.query.filter(Property.owner_id == current_user.id)\
-                              .order_by(asc(Property.name)).all()
-        owners = {current_user.id: current_user.name}
+    q = db.session.query(Property.id.label("id"), Property.name, Property.address, Property.owner_id)
+    if not _is_admin():
+        q = q.filter(Property.owner_id == current_user.id)
+    page = _PROPERTY_LIST.page(q, request.args)
+
+    # owner names for this page only
+    owner_ids = {p.owner_id for p in page.rows}
+    owners = dict(db.session.query(User.id, User.name).filter(User.id.in_(owner_ids))) if owner_ids else {}
 
-    return render_template("admin_properties_list.html", properties=props, owners=owners)
+    return _render_list("admin_properties_list.html", "admin_properties_rows.html",
+                        page=page, properties=page.rows, owners=owners)
 
 
 @bp.get("/properties/new")
@@ -166,6 +193,15 @@ def properties_delete(prop_id):
 
 
 # ========== ROOMS (Property optional) ==========
+_ROOM_LIST = Listing(
+    Room.id,
+    {"id": Room.id, "name": Room.name},
+    default_sort="id",
+    default_dir="desc",
+    search_cols=(Room.name,),
+)
+
+
 @bp.get("/rooms")
 @login_required
 def rooms_index():
@@ -177,7 +213,8 @@ def rooms_index():
     prop_id = request.args.get("property_id", type=int)
 
     # OUTER JOIN so rooms with property_id == NULL are included
-    q = db.session.query(Room).outerjoin(Property, Property.id == Room.property_id)
+    q = (db.session.query(Room.id.label("id"), Room.name, Room.desc, Property.name.label("property_name"))
+         .outerjoin(Property, Property.id == Room.property_id))
 
     if _is_admin():
         # Admin sees everything; optional filter by property if provided
@@ -194,12 +231,13 @@ def rooms_index():
         if prop_id:
             q = q.filter(Room.property_id == prop_id)
 
-    rooms = q.order_by(Room.id.desc()).all()
+    page = _ROOM_LIST.page(q, request.args)
 
     # If your template no longer needs properties, passing [] is fine
-    return render_template(
-        "admin_rooms_list.html",
-        rooms=rooms,
+    return _render_list(
+        "admin_rooms_list.html", "admin_rooms_rows.html",
+        page=page,
+        rooms=page.rows,
         properties=[],              # keeps old templates happy
         current_property_id=prop_id
     )
@@ -307,6 +345,20 @@ def rooms_delete(room_id):
 
 
 # ========== CHECKPOINTS ==========
+_CHECKPOINT_LIST = Listing(
+    Checkpoint.id,
+    {"name": Checkpoint.name, "property": Property.name, "id": Checkpoint.id},
+    default_sort="property",
+    search_cols=(Checkpoint.name,),
+)
+
+
+def _checkpoint_mode(raw):
+    """Validate the direction mode posted by the checkpoint form."""
+    raw = (raw or "").strip()
+    return raw if raw in dict(CHECKPOINT_MODES) else MODE_BOTH
+
+
 @bp.get("/checkpoints")
 @login_required
 def checkpoints_index():
@@ -314,18 +366,15 @@ def checkpoints_index():
         flash("Unauthorized", "error")
         return redirect(url_for("home"))
 
-    if _is_admin():
-        props = Property.query.order_by(Property.name.asc()).all()
-        cps = Checkpoint.query.order_by(Checkpoint.property_id.asc(), Checkpoint.name.asc()).all()
-    else:
-        props = Property.query.filter(Property.owner_id == current_user.id)\
-                              .order_by(Property.name.asc()).all()
-        cps = (Checkpoint.query.join(Property, Property.id == Checkpoint.property_id)
-               .filter(Property.owner_id == current_user.id)
-               .order_by(Checkpoint.property_id.asc(), Checkpoint.name.asc())
-               .all())
+    q = (db.session.query(Checkpoint.id.label("id"), Checkpoint.name, Checkpoint.direction_mode,
+                          Property.name.label("property_name"))
+         .join(Property, Property.id == Checkpoint.property_id))
+    if not _is_admin():
+        q = q.filter(Property.owner_id == current_user.id)
+    page = _CHECKPOINT_LIST.page(q, request.args)
 
-    return render_template("admin_checkpoints_list.html", checkpoints=cps, properties=props)
+    return _render_list("admin_checkpoints_list.html", "admin_checkpoints_rows.html",
+                        page=page, checkpoints=page.rows)
 
 
 @bp.get("/checkpoints/new")
@@ -344,7 +393,7 @@ def checkpoints_new():
             flash("Create a property first.", "error")
             return redirect(url_for("admin.properties_new"))
 
-    return render_template("admin_checkpoint_form.html", props=props, cp=None)
+    return render_template("admin_checkpoint_form.html", props=props, cp=None, modes=CHECKPOINT_MODES)
 
 
 @bp.post("/checkpoints/new")
@@ -355,6 +404,7 @@ def checkpoints_create():
         return redirect(url_for("admin.checkpoints_index"))
 
     name = (request.form.get("name") or "").strip()
+    direction_mode = _checkpoint_mode(request.form.get("direction_mode"))
     try:
         property_id = int(request.form.get("property_id", 0) or 0)
     except ValueError:
@@ -369,9 +419,10 @@ def checkpoints_create():
         flash("Unauthorized property selection.", "error")
         return redirect(url_for("admin.checkpoints_new"))
 
-    cp = Checkpoint(name=name, property_id=property_id)
+    cp = Checkpoint(name=name, property_id=property_id, direction_mode=direction_mode)
     db.session.add(cp)
     db.session.commit()
+    passback.set_checkpoint(cp.id, cp.direction_mode)
     flash("Checkpoint created.", "success")
     return redirect(url_for("admin.checkpoints_index"))
 
@@ -395,7 +446,7 @@ def checkpoints_edit(cp_id):
         props = Property.query.filter(Property.owner_id == current_user.id)\
                               .order_by(Property.name.asc()).all()
 
-    return render_template("admin_checkpoint_form.html", props=props, cp=cp)
+    return render_template("admin_checkpoint_form.html", props=props, cp=cp, modes=CHECKPOINT_MODES)
 
 
 @bp.post("/checkpoints/<int:cp_id>/edit")
@@ -412,6 +463,7 @@ def checkpoints_update(cp_id):
         return redirect(url_for("admin.checkpoints_index"))
 
     cp.name = (request.form.get("name") or "").strip()
+    cp.direction_mode = _checkpoint_mode(request.form.get("direction_mode", cp.direction_mode))
 
     try:
         new_prop_id = int(request.form.get("property_id", cp.property_id) or cp.property_id)
@@ -434,6 +486,7 @@ def checkpoints_update(cp_id):
         return redirect(url_for("admin.checkpoints_edit", cp_id=cp.id))
 
     db.session.commit()
+    passback.set_checkpoint(cp.id, cp.direction_mode)
     flash("Checkpoint updated.", "success")
     return redirect(url_for("admin.checkpoints_index"))
 
@@ -453,19 +506,31 @@ def checkpoints_delete(cp_id):
 
     db.session.delete(cp)
     db.session.commit()
+    passback.forget_checkpoint(cp_id)
     flash("Checkpoint deleted.", "success")
     return redirect(url_for("admin.checkpoints_index"))
 
 
 # ========== USERS (Admin only) ==========
+_USER_LIST = Listing(
+    User.id,
+    {"name": User.name, "email": User.email, "created": User.id},
+    default_sort="name",
+    search_cols=(User.name, User.email),
+)
+
+
 @bp.get("/users")
 @login_required
 def users_index():
     if not _is_admin():
         flash("Unauthorized", "error")
         return redirect(url_for("home"))
-    users = User.query.order_by(User.role.asc(), User.name.asc()).all()
-    return render_template("admin_users_list.html", users=users)
+    q = db.session.query(User.id.label("id"), User.name, User.email, User.role, User.created_at)
+    if request.args.get("role") in (ROLE_ADMIN, ROLE_HOST, ROLE_GUARD):
+        q = q.filter(User.role == request.args["role"])
+    page = _USER_LIST.page(q, request.args)
+    return _render_list("admin_users_list.html", "admin_users_rows.html", page=page, users=page.rows)
 
 
 @bp.get("/users/new")
@@ -563,3 +628,84 @@ def users_delete(user_id):
     db.session.commit()
     flash("User deleted.", "success")
     return redirect(url_for("admin.users_index"))
+
+
+# ========== ACCESS LOGS ==========
+def _log_scope():
+    """Filters for the current user: hosts only see checkpoints at their own properties."""
+    filters = parse_filters(request.args)
+    if _is_host():
+        filters["checkpoint_ids"] = [
+            cid for (cid,) in db.session.query(Checkpoint.id)
+            .filter(Checkpoint.property_id.in_(owned_property_ids(current_user.id)))
+        ]
+    return filters
+
+
+def _log_source():
+    return SOURCES.get(request.args.get("source"), SOURCES["access"])
+
+
+@bp.get("/logs")
+@login_required
+def logs_index():
+    if not _can_view():
+        flash("Unauthorized", "error")
+        return redirect(url_for("home"))
+
+    source = _log_source()
+    filters = _log_scope()
+    rows, next_cursor = page(source, filters, request.args.get("cursor"),
+                             request.args.get("limit", type=int))
+
+    cp_q = Checkpoint.query.order_by(Checkpoint.name.asc())
+    if filters.get("checkpoint_ids") is not None:
+        cp_q = cp_q.filter(Checkpoint.id.in_(filters["checkpoint_ids"]))
+    guards = User.query.filter(User.role == ROLE_GUARD).order_by(User.name.asc()).all()
+
+    # carry the filters (not the cursor) into pager/export links
+    args = {k: v for k, v in request.args.items() if k != "cursor" and v}
+    return render_template(
+        "admin_logs_list.html",
+        source=source, rows=rows, next_cursor=next_cursor, args=args,
+        checkpoints=cp_q.all(), guards=guards, archived=sorted(load_index(source.key).items()),
+    )
+
+
+@bp.get("/logs/export.<fmt>")
+@login_required
+def logs_export(fmt):
+    if not _can_view():
+        return jsonify({"ok": False, "error": "Unauthorized"}), 403
+    if fmt not in ("csv", "jsonl"):
+        abort(404)
+
+    source = _log_source()
+    filters = _log_scope()
+    body = export_csv(source, filters) if fmt == "csv" else export_jsonl(source, filters)
+    fname = f"{source.key}_log_{datetime.utcnow():%Y%m%d_%H%M%S}.{fmt}"
+    return Response(
+        stream_with_context(body),
+        mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{fname}"',
+                 "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.get("/logs/archive")
+@login_required
+def logs_archive():
+    """Search archived months (see utils/retention.py) with the explorer's filters; streams JSONL."""
+    if not _can_view():
+        return jsonify({"ok": False, "error": "Unauthorized"}), 403
+
+    source = _log_source()
+    filters = _log_scope()
+    limit = request.args.get("limit", type=int)
+
+    def body():
+        for row in search_archive(source.key, filters, limit=limit):
+            yield json.dumps(row, separators=(",", ":")) + "\n"
+
+    return Response(stream_with_context(body()), mimetype="application/x-ndjson",
+                    headers={"X-Accel-Buffering": "no"})
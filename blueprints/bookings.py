@@ -3,20 +3,27 @@ import os
 import io
 import smtplib
 import secrets
+from bisect import bisect_left
 from datetime import datetime, date, timedelta
 from email.message import EmailMessage
 from email.utils import formatdate, make_msgid
 from mimetypes import guess_type
 
+import pytz
 from flask import (
     Blueprint, render_template, request, redirect, url_for,
-    flash, jsonify, current_app, send_file, send_from_directory
+    flash, jsonify, current_app, send_file, abort
 )
 from flask_login import login_required, current_user
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, insert, update, bindparam
 
+from config import Config
 from models import db, Room, Booking, Guest, Property, ROLE_ADMIN, ROLE_HOST
 from utils.plan_gate import require_plan, require_paid  # optional gates
+from utils.tasks import enqueue, map_parallel
+from utils.events import publish_event
+from utils.plates import normalize_plate
+from utils import storage
 
 # ----- QR REQUIRED -----
 try:
@@ -31,12 +38,21 @@ bp = Blueprint("bookings", __name__, url_prefix="/bookings")
 
 # ---------------- Helpers ----------------
 def _parse_dt(value: str) -> datetime:
+    """Parse a form/API datetime to naive local time; offsets ("Z", "+03:00") are converted, then dropped."""
     s = (value or "").strip().replace("T", " ")
     s = " ".join(s.split())
+    if s.endswith(("Z", "z")):
+        s = s[:-1] + "+00:00"  # fromisoformat only learns "Z" in 3.11
     try:
-        return datetime.fromisoformat(s)
+        dt = datetime.fromisoformat(s)
     except ValueError:
         pass
+    else:
+        if dt.tzinfo is not None:
+            # stored times are naive Africa/Nairobi; comparing against an aware value raises TypeError
+            dt = dt.astimezone(pytz.timezone(Config.TIMEZONE)).replace(tzinfo=None)
+        return dt
+        pass
     for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
         try:
             return datetime.strptime(s, fmt)
@@ -55,23 +71,28 @@ def _can_create():
 
 def _ensure_booking_qr(booking: Booking) -> str:
     """
-    Generate and save PNG QR for the booking. Returns absolute file path.
+    Generate and store the PNG QR for the booking. Returns absolute file path.
     Sets booking.qr_token and booking.qr_path (WEB path).
     """
     if not booking.qr_token:
         booking.qr_token = secrets.token_urlsafe(16)
 
-    upload_dir = os.path.join(current_app.root_path, "uploads", "bookings")
-    os.makedirs(upload_dir, exist_ok=True)
+    blob = storage.put("bookings", _render_qr_png(booking.qr_token), "png", "image/png")
+    booking.qr_path = f"/uploads/bookings/{blob.path}"
+    return os.path.join(storage.bucket_dir("bookings"), blob.path)
 
-    fname = f"booking_{booking.id}.png"
-    abs_path = os.path.join(upload_dir, fname)
 
-    img = qrcode.make(booking.qr_token, image_factory=PilImage, box_size=8, border=2)
-    img.save(abs_path)
+def _render_qr_png(token: str) -> bytes:
+    img = qrcode.make(token, image_factory=PilImage, box_size=8, border=2)
+    bio = io.BytesIO()
+    img.save(bio)
+    return bio.getvalue()
 
-    booking.qr_path = f"/uploads/bookings/{fname}"
-    return abs_path
+
+def _write_qr_blob(job) -> storage.Blob:
+    """Render one (bucket root, token) QR into the content-addressed store. Safe to run on a worker thread."""
+    root, token = job
+    return storage.write_blob(root, _render_qr_png(token), "png")
 
 
 # ---------------- Email helpers ----------------
@@ -512,6 +533,10 @@ def create_booking():
     qr_abs_path = _ensure_booking_qr(booking)
 
     db.session.commit()
+    publish_event("booking", {
+        "action": "created", "booking_id": booking.id, "guest": guest.full_name,
+        "room": room.name, "check_in": booking.check_in.isoformat(),
+    }, host_id=current_user.id, property_id=room.property_id)
 
     # Send email (best-effort; won't block UX)
     try:
@@ -523,6 +548,239 @@ def create_booking():
     return redirect(url_for("bookings.detail", booking_id=booking.id))
 
 
+# ---------------- Bulk API ----------------
+BULK_MAX_ITEMS = int(os.getenv("BULK_BOOKINGS_MAX", "500"))
+
+
+def _email_booking(booking_id: int):
+    """Background job: reload the booking in this worker's session and email the guest."""
+    booking = Booking.query.get(booking_id)
+    if not booking:
+        return
+    guest = Guest.query.get(booking.guest_id)
+    room = Room.query.get(booking.room_id)
+    prop = Property.query.get(room.property_id) if (room and room.property_id) else None
+    qr_abs_path = os.path.join(current_app.root_path, booking.qr_path.lstrip("/"))
+    _send_booking_email(guest, booking, room, prop, qr_abs_path)
+
+
+def _parse_bulk_item(raw) -> dict:
+    """Validate one JSON booking; returns clean fields or raises ValueError."""
+    if not isinstance(raw, dict):
+        raise ValueError("Item must be an object.")
+
+    guest_name = str(raw.get("guest_name") or "").strip()
+    if not guest_name:
+        raise ValueError("guest_name is required.")
+
+    try:
+        room_id = int(raw.get("room_id") or 0)
+    except (TypeError, ValueError):
+        room_id = 0
+    if room_id <= 0:
+        raise ValueError("room_id is required.")
+
+    check_in = _parse_dt(str(raw.get("check_in") or ""))
+    check_out = _parse_dt(str(raw.get("check_out") or ""))
+    if check_out <= check_in:
+        raise ValueError("check_out must be after check_in.")
+
+    try:
+        guests_count = max(1, int(raw.get("guests_count") or 1))
+    except (TypeError, ValueError):
+        raise ValueError("guests_count must be a number.")
+
+    owns_vehicle = bool(raw.get("owns_vehicle"))
+    vehicle_plate = str(raw.get("vehicle_plate") or "").strip() or None
+    if owns_vehicle and not vehicle_plate:
+        raise ValueError("vehicle_plate required when owns_vehicle is set.")
+
+    return {
+        "guest": {
+            "full_name": guest_name,
+            "national_id_number": str(raw.get("national_id") or "").strip(),
+            "phone": str(raw.get("phone") or "").strip(),
+            "email": str(raw.get("email") or "").strip(),
+        },
+        "room_id": room_id,
+        "check_in": check_in,
+        "check_out": check_out,
+        "guests_count": guests_count,
+        "owns_vehicle": owns_vehicle,
+        "vehicle_plate": vehicle_plate,
+    }
+
+
+def _allowed_room_ids(room_ids) -> set[int]:
+    """One query: which of these rooms may the current user book?"""
+    q = db.session.query(Room.id).filter(Room.id.in_(room_ids))
+    if current_user.role == ROLE_HOST:
+        q = (
+            q.outerjoin(Property, Property.id == Room.property_id)
+             .filter(or_(Property.owner_id == current_user.id, Room.property_id.is_(None)))
+        )
+    return {rid for (rid,) in q.all()}
+
+
+def _find_overlaps(items: dict[int, dict]) -> dict[int, str]:
+    """
+    Check candidate bookings (index -> fields) against existing bookings and
+    against each other. Existing rows are loaded with one query for the whole
+    batch window; each room is then resolved with a bisect + one sorted sweep.
+    Returns {index: error} for rejected candidates.
+    """
+    if not items:
+        return {}
+
+    lo = min(it["check_in"] for it in items.values())
+    hi = max(it["check_out"] for it in items.values())
+    existing_rows = (
+        db.session.query(Booking.room_id, Booking.check_in, Booking.check_out)
+        .filter(
+            Booking.room_id.in_({it["room_id"] for it in items.values()}),
+            Booking.status != "cancelled",
+            Booking.check_in < hi,
+            Booking.check_out > lo,
+        )
+        .order_by(Booking.room_id, Booking.check_in)
+        .all()
+    )
+
+    # per room: sorted starts + running max of ends (prefix max)
+    existing: dict[int, tuple[list, list]] = {}
+    for room_id, ci, co in existing_rows:
+        starts, max_ends = existing.setdefault(room_id, ([], []))
+        starts.append(ci)
+        max_ends.append(max(co, max_ends[-1]) if max_ends else co)
+
+    errors: dict[int, str] = {}
+    by_room: dict[int, list] = {}
+    for idx, it in items.items():
+        starts, max_ends = existing.get(it["room_id"], ([], []))
+        # existing bookings starting before our check_out; any ending after our check_in clashes
+        k = bisect_left(starts, it["check_out"])
+        if k and max_ends[k - 1] > it["check_in"]:
+            errors[idx] = "Overlaps an existing booking for this room."
+            continue
+        by_room.setdefault(it["room_id"], []).append(idx)
+
+    for idxs in by_room.values():
+        idxs.sort(key=lambda i: (items[i]["check_in"], i))
+        last_end = None
+        for idx in idxs:
+            if last_end is not None and items[idx]["check_in"] < last_end:
+                errors[idx] = "Overlaps another booking in this batch."
+                continue
+            last_end = items[idx]["check_out"]
+    return errors
+
+
+def _insert_guests(rows: list[dict]) -> list[int]:
+    """Insert guests in one executemany; returns their ids in input order."""
+    if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+        res = db.session.execute(
+            insert(Guest).returning(Guest.id, sort_by_parameter_order=True), rows
+        )
+        return list(res.scalars())
+
+    # Dialects without INSERT..RETURNING (MySQL): let the ORM batch the flush.
+    guests = [Guest(**r) for r in rows]
+    db.session.add_all(guests)
+    db.session.flush()
+    return [g.id for g in guests]
+
+
+@bp.post("/bulk")
+@login_required
+def bulk_create():
+    """
+    JSON body: {"bookings": [{guest_name, national_id, phone, email, room_id,
+                              check_in, check_out, guests_count, owns_vehicle,
+                              vehicle_plate}, ...]}
+    Creates every valid item in one transaction and returns per-item results.
+    """
+    if not _can_create():
+        return jsonify({"ok": False, "error": "Only hosts can add bookings"}), 403
+
+    payload = request.get_json(silent=True) or {}
+    raw_items = payload.get("bookings")
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({"ok": False, "error": "Provide a non-empty 'bookings' list."}), 400
+    if len(raw_items) > BULK_MAX_ITEMS:
+        return jsonify({"ok": False, "error": f"At most {BULK_MAX_ITEMS} bookings per request."}), 413
+
+    results: list[dict] = [{"index": i, "ok": False} for i in range(len(raw_items))]
+    valid: dict[int, dict] = {}
+    for i, raw in enumerate(raw_items):
+        try:
+            valid[i] = _parse_bulk_item(raw)
+        except ValueError as e:
+            results[i]["error"] = str(e)
+
+    allowed = _allowed_room_ids({it["room_id"] for it in valid.values()}) if valid else set()
+    for i in [i for i, it in valid.items() if it["room_id"] not in allowed]:
+        results[i]["error"] = "Invalid room selection."
+        del valid[i]
+
+    for i, err in _find_overlaps(valid).items():
+        results[i]["error"] = err
+        del valid[i]
+
+    order = sorted(valid)
+    if order:
+        guest_ids = _insert_guests([valid[i]["guest"] for i in order])
+        tokens = [secrets.token_urlsafe(16) for _ in order]
+        db.session.execute(insert(Booking), [
+            {
+                "guest_id": gid,
+                "room_id": valid[i]["room_id"],
+                "check_in": valid[i]["check_in"],
+                "check_out": valid[i]["check_out"],
+                "status": "booked",
+                "guests_count": valid[i]["guests_count"],
+                "owns_vehicle": valid[i]["owns_vehicle"],
+                "vehicle_plate": valid[i]["vehicle_plate"],
+                "plate_key": normalize_plate(valid[i]["vehicle_plate"]),  # core insert skips @validates
+                "qr_token": tok,
+            }
+            for i, gid, tok in zip(order, guest_ids, tokens)
+        ])
+
+        # qr_token is unique, so one IN query maps tokens back to booking ids
+        id_by_token = dict(
+            db.session.query(Booking.qr_token, Booking.id).filter(Booking.qr_token.in_(tokens)).all()
+        )
+
+        root = storage.bucket_dir("bookings")
+        blobs = map_parallel(_write_qr_blob, [(root, tok) for tok in tokens])
+        storage.register("bookings", blobs, "image/png")
+
+        db.session.execute(
+            update(Booking.__table__)
+            .where(Booking.__table__.c.id == bindparam("b_id"))
+            .values(qr_path=bindparam("b_path")),
+            [{"b_id": id_by_token[tok], "b_path": f"/uploads/bookings/{blob.path}"} for tok, blob in zip(tokens, blobs)],
+        )
+        db.session.commit()
+
+        for i, tok in zip(order, tokens):
+            bid = id_by_token[tok]
+            results[i].update(ok=True, booking_id=bid, qr_token=tok)
+            if valid[i]["guest"]["email"]:
+                enqueue(_email_booking, bid)
+
+        publish_event("booking", {
+            "action": "bulk_created", "count": len(order), "booking_ids": sorted(id_by_token.values()),
+        }, host_id=current_user.id)
+
+    return jsonify({
+        "ok": True,
+        "created": len(order),
+        "failed": len(raw_items) - len(order),
+        "results": results,
+    })
+
+
 @bp.get("/<int:booking_id>")
 @login_required
 def detail(booking_id: int):
@@ -597,5 +855,17 @@ def booking_qr_download(token: str):
 @bp.get("/uploads/bookings/<path:fname>")
 @login_required
 def booking_qr_uploads(fname: str):
-    folder = os.path.join(current_app.root_path, "uploads", "bookings")
-    return send_from_directory(folder, fname)
+    # only the owning host (or an admin) may fetch a booking's QR; one probe of ix_booking_qr_path.
+    # Same rule as the booking list: the host's properties, or rooms with no property.
+    if current_user.role != ROLE_ADMIN:
+        visible = (
+            db.session.query(Booking.id)
+            .join(Room, Booking.room_id == Room.id)
+            .outerjoin(Property, Room.property_id == Property.id)
+            .filter(Booking.qr_path == f"/uploads/bookings/{fname}")
+            .filter(or_(Property.owner_id == current_user.id, Room.property_id.is_(None)))
+            .first()
+        )
+        if visible is None:
+            abort(404)
+    return storage.send("bookings", fname, immutable=storage.is_blob(fname))
@@ -0,0 +1,44 @@
+# blueprints/events.py
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_login import login_required, current_user
+
+from models import ROLE_ADMIN, ROLE_HOST, ROLE_GUARD
+from utils.dashboard import owned_property_ids
+from utils.events import sse_stream, CH_ALL, host_channel, property_channel, checkpoint_channel
+
+bp = Blueprint("events", __name__, url_prefix="/events")
+
+
+@bp.get("/stream")
+@login_required
+def stream():
+    """
+    Server-Sent Events feed of booking, luggage and scan events.
+    Hosts get their own events (or one owned ?property_id=); admins and guards
+    get everything unless narrowed with ?checkpoint_id= or ?property_id=.
+    Each response ends after SSE_MAX_AGE seconds; EventSource reconnects by itself.
+    """
+    property_id = request.args.get("property_id", type=int)
+    checkpoint_id = request.args.get("checkpoint_id", type=int)
+
+    if current_user.role == ROLE_HOST:
+        if property_id:
+            if property_id not in owned_property_ids(current_user.id):
+                return jsonify({"ok": False, "error": "Unauthorized"}), 403
+            channels = [property_channel(property_id)]
+        else:
+            channels = [host_channel(current_user.id)]
+    elif current_user.role in (ROLE_ADMIN, ROLE_GUARD):
+        if checkpoint_id:
+            channels = [checkpoint_channel(checkpoint_id)]
+        elif property_id:
+            channels = [property_channel(property_id)]
+        else:
+            channels = [CH_ALL]
+    else:
+        return jsonify({"ok": False, "error": "Unauthorized"}), 403
+
+    resp = Response(stream_with_context(sse_stream(channels)), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return resp
@@ -1,16 +1,33 @@
 import os
+import time
 from datetime import datetime, time as dt_time
 import pytz
 
-from flask import Blueprint, render_template, request, jsonify, current_app, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, current_app, flash, redirect, url_for, g
 from flask_login import login_required, current_user
+from sqlalchemy import update, func
 from werkzeug.utils import secure_filename
 
-from models import db, Booking, Guest, Room, Property, AccessLog, Checkpoint, ROLE_GUARD
-from ocr import extract_id_text
+from models import db, Booking, Guest, Room, Property, AccessLog, Checkpoint, ROLE_GUARD, ROLE_HOST, ROLE_ADMIN
+from ocr import extract_id_text, extract_plate_text
+from utils.occupancy import occupancy
+from utils.dashboard import owned_property_ids
+from utils.events import publish_event
+from utils.manifest import manifests, booking_rows
+from utils.passback import passback, enforcement, MODE_BOTH
+from utils.plates import normalize_plate
+from utils import resumable
 
 bp = Blueprint("guard", __name__, url_prefix="/guard")
 
+@bp.before_request
+def _start_clock():
+    g.scan_started = time.perf_counter()
+
+def _elapsed_ms():
+    """Decision latency for AccessLog.latency_ms (request start -> log write)."""
+    return int((time.perf_counter() - g.scan_started) * 1000)
+
 def _guard_only():
     return current_user.is_authenticated and current_user.role == ROLE_GUARD
 
@@ -22,15 +39,104 @@ def scan_page():
         return redirect(url_for("home"))
     checkpoints = Checkpoint.query.all()
     return render_template("guard_scan.html", checkpoints=checkpoints)
-def _safe_checkpoint_id(raw):
-    """Return a valid checkpoint id or None."""
+def _safe_checkpoint(raw):
+    """Return (checkpoint id, direction mode) from the in-memory cache; (None, 'both') if invalid."""
     try:
         cid = int(raw)
     except (TypeError, ValueError):
-        return None
+        return None, MODE_BOTH
     if cid <= 0:
+        return None, MODE_BOTH
+    mode = passback.checkpoint_mode(cid)
+    return (cid, mode) if mode else (None, MODE_BOTH)
+
+def _publish_scan(decision, direction, flag, row, checkpoint_id, guest_name=None):
+    """Push a gate scan to the host's dashboard and the guard stations."""
+    row = row or {}
+    publish_event("scan", {
+        "decision": decision, "direction": direction, "flag": flag, "booking_id": row.get("booking_id"),
+        "guest_name": row.get("guest_name", guest_name), "property": row.get("property"),
+        "room": row.get("room"), "checkpoint_id": checkpoint_id,
+    }, host_id=row.get("owner_id"),
+       property_id=row.get("property_id"),
+       checkpoint_id=checkpoint_id)
+
+def _booking_info(row):
+    return {
+        "guest_name": row["guest_name"] or "",
+        "national_id": row["national_id"] or "",
+        "property": row["property"] or "",
+        "room": row["room"] or "",
+        "check_in": row["check_in"].isoformat(),
+        "check_out": row["check_out"].isoformat(),
+        "booking_id": row["booking_id"],
+        "guests_count": row["guests_count"],
+        "owns_vehicle": row["owns_vehicle"],
+        "vehicle_plate": row["vehicle_plate"],
+    }
+
+def _passback_message(direction):
+    return ("Already inside: second entry in a row (anti-passback)." if direction == "in"
+            else "Already exited: second exit in a row (anti-passback).")
+
+def _active_now(at):
+    """Criteria for a booking that admits people at `at` (the DB's answer, not the manifest's)."""
+    return (Booking.status != "cancelled", Booking.check_in <= at, Booking.check_out >= at)
+
+def _is_active(booking_id, at):
+    """
+    Re-check a manifest hit against the row: manifests are per process and can
+    trail another worker's cancel/shorten by up to MANIFEST_MAX_AGE.
+    """
+    return db.session.query(Booking.id).filter(Booking.id == booking_id, *_active_now(at)).first() is not None
+
+def _move_group_counter(booking_id, direction, at):
+    """
+    Atomically move one guest of a booking in or out.
+    A single conditional UPDATE keeps inside_count within 0..guests_count even
+    when two gates scan the same QR at once, and only while the booking is
+    active at `at`. Returns the new count, or None if the move was refused
+    (inactive booking / group full on entry / nobody inside on exit).
+    """
+    cap = func.coalesce(Booking.guests_count, 1)
+    if direction == "in":
+        stmt = (update(Booking)
+                .where(Booking.id == booking_id, Booking.inside_count < cap, *_active_now(at))
+                .values(inside_count=Booking.inside_count + 1))
+    else:
+        stmt = (update(Booking)
+                .where(Booking.id == booking_id, Booking.inside_count > 0, *_active_now(at))
+                .values(inside_count=Booking.inside_count - 1))
+    # inside_count feeds no cache, so skip the write hooks (utils/write_hooks.py)
+    res = db.session.execute(stmt.execution_options(synchronize_session=False, write_hooks=False))
+    if res.rowcount == 0:
         return None
-    return Checkpoint.query.get(cid).id if Checkpoint.query.get(cid) else None
+    return db.session.query(Booking.inside_count).filter(Booking.id == booking_id).scalar()
+
+def _admit(row, credential, direction, checkpoint_id, now):
+    """
+    Decide an ID or plate hit on an active booking: anti-passback on the
+    credential, then one guest through the booking's group counter (shared
+    with QR scans, so mixing them can't exceed guests_count). Both moves sit
+    in a savepoint that is dropped when the scan ends up denied.
+    Returns (decision, flag, reason, message, inside).
+    """
+    enforce = enforcement()
+    total = row["guests_count"] or 1
+    sp = db.session.begin_nested()
+    if not passback.move(db.session, credential, direction, checkpoint_id, force=enforce == "off"):
+        sp.rollback()
+        # soft mode lets them through flagged, without counting them twice
+        return ("deny" if enforce == "hard" else "allow"), "passback", "passback", _passback_message(direction), None
+    inside = _move_group_counter(row["booking_id"], direction, now)
+    if inside is None and direction == "in":
+        sp.rollback()
+        return "deny", None, "group_full", f"All {total} guests already inside.", None
+    sp.commit()
+    if inside is None and enforce != "off":
+        message = "No guests from this booking are inside (anti-passback)."
+        return ("deny" if enforce == "hard" else "allow"), "passback", "passback", message, None
+    return "allow", None, None, None, inside
 
 @bp.post("/scan")
 @login_required
@@ -38,8 +144,9 @@ def scan_post():
     if not _guard_only():
         return jsonify({"ok": False, "error": "Unauthorized"}), 403
 
-    checkpoint_id = _safe_checkpoint_id(request.form.get("checkpoint_id"))
+    checkpoint_id, mode = _safe_checkpoint(request.form.get("checkpoint_id"))
     national_id = (request.form.get("detected_id") or "").strip()
+    direction = passback.resolve_direction(mode, request.form.get("direction"))
 
     if not national_id:
         # no manual and client didn’t OCR anything
@@ -54,55 +161,66 @@ def scan_post():
     tz = pytz.timezone('Africa/Nairobi')
     now = datetime.now(tz).replace(tzinfo=None)  # naive to match typical MySQL DATETIME
 
-    guest = Guest.query.filter_by(national_id_number=national_id).first()
-    booking = None
-    decision = "deny"
-    if guest:
-        booking = (
-            Booking.query
-            .filter(
-                Booking.guest_id == guest.id,
-                Booking.check_in <= now,
-                Booking.check_out >= now,
-                Booking.status != "cancelled",
-            )
-            .order_by(Booking.check_out.desc())
-            .first()
+    # today's gate manifest answers most scans without touching the DB
+    manifest = manifests.for_checkpoint(checkpoint_id)
+    row = manifest.active_for_nid(national_id, now) if manifest else None
+    if row is not None and not _is_active(row["booking_id"], now):
+        row = None  # stale manifest entry; look again in the DB
+    if row is None:
+        rows = booking_rows(
+            Guest.national_id_number == national_id,
+            Booking.check_in <= now,
+            Booking.check_out >= now,
+            Booking.status != "cancelled",
         )
-        if booking:
-            decision = "allow"
+        row = max(rows, key=lambda r: r["check_out"]) if rows else None
+
+    guest_id = row["guest_id"] if row else None
+    guest_name = row["guest_name"] if row else None
+    if row is None:
+        guest = Guest.query.filter_by(national_id_number=national_id).first()
+        if guest:
+            guest_id, guest_name = guest.id, guest.full_name
+
+    decision = "deny"
+    flag = reason = message = inside = None
+    if row:
+        decision, flag, reason, message, inside = _admit(row, f"nid:{national_id}", direction, checkpoint_id, now)
 
     # log every attempt
     log = AccessLog(
         guard_id=current_user.id,
         checkpoint_id=checkpoint_id,
-        guest_id=(guest.id if guest else None),
-        booking_id=(booking.id if booking else None),
+        guest_id=guest_id,
+        booking_id=(row["booking_id"] if row else None),
         national_id_number=national_id,
         decision=decision,
+        direction=direction,
+        flag=flag,
         image_path=None,
-        ocr_text="[client_or_manual]"
+        ocr_text="[client_or_manual]",
+        latency_ms=_elapsed_ms(),
     )
     db.session.add(log)
     db.session.commit()
 
-    if booking:
-        room = Room.query.get(booking.room_id)
-        prop = Property.query.get(room.property_id)
-        info = {
-            "guest_name": guest.full_name,
-            "national_id": guest.national_id_number,
-            "property": prop.name,
-            "room": room.name,
-            "check_in": booking.check_in.isoformat(),
-            "check_out": booking.check_out.isoformat(),
-            "booking_id": booking.id,
-            "guests_count": booking.guests_count,
-            "owns_vehicle": booking.owns_vehicle,
-            "vehicle_plate": booking.vehicle_plate,
-        }
-        return jsonify({"ok": True, "decision": "allow", "info": info, "debug": {"extracted_national_id": national_id}})
+    if row:
+        if decision == "allow" and not flag:
+            occupancy.record(row["property_id"], row["booking_id"], direction)
+        if inside is None:
+            inside = db.session.query(Booking.inside_count).filter(Booking.id == row["booking_id"]).scalar() or 0
+        resp = {"ok": True, "decision": decision, "direction": direction, "info": _booking_info(row),
+                "group": {"inside": inside, "total": row["guests_count"] or 1},
+                "occupancy": {"property": occupancy.property_count(row["property_id"])},
+                "debug": {"extracted_national_id": national_id}}
+        if flag:
+            resp["flag"] = flag
+        if reason:
+            resp.update(reason=reason, message=message)
+        _publish_scan(decision, direction, flag, row, checkpoint_id)
+        return jsonify(resp)
 
+    _publish_scan(decision, direction, None, None, checkpoint_id, guest_name=guest_name)
     return jsonify({
         "ok": True,
         "decision": "deny",
@@ -129,14 +247,17 @@ def booking_scan_post():
     if not _guard_only():
         return jsonify({"ok": False, "error": "Unauthorized"}), 403
 
-    checkpoint_id = _safe_checkpoint_id(request.form.get("checkpoint_id"))
+    checkpoint_id, mode = _safe_checkpoint(request.form.get("checkpoint_id"))
     token = (request.form.get("qr_token") or "").strip()
     if not token:
         return jsonify({"ok": True, "decision": "deny", "reason": "no_qr",
                         "message": "No QR token provided."})
 
-    booking = Booking.query.filter_by(qr_token=token).first()
-    if not booking:
+    manifest = manifests.for_checkpoint(checkpoint_id)
+    row = manifest.by_token(token) if manifest else None
+    if row is None:
+        row = next(iter(booking_rows(Booking.qr_token == token)), None)
+    if not row:
         db.session.add(AccessLog(
             guard_id=current_user.id,
             checkpoint_id=checkpoint_id,
@@ -145,40 +266,235 @@ def booking_scan_post():
             national_id_number=None,
             decision="deny",
             image_path=None,
-            ocr_text="[booking_qr_not_found]"
+            ocr_text="[booking_qr_not_found]",
+            latency_ms=_elapsed_ms(),
         ))
         db.session.commit()
+        _publish_scan("deny", None, None, None, checkpoint_id)
         return jsonify({"ok": True, "decision": "deny", "message": "QR not recognized."})
 
     now = datetime.utcnow()
-    decision = "allow" if (booking.status != "cancelled" and booking.check_in <= now <= booking.check_out) else "deny"
+    direction = passback.resolve_direction(mode, request.form.get("direction"))
+    total = row["guests_count"] or 1
+    message = None
+    flag = None
 
-    guest = Guest.query.get(booking.guest_id)
-    room  = Room.query.get(booking.room_id)
-    prop  = Property.query.get(room.property_id) if room else None
+    # The manifest row is for display only: status and dates are enforced by
+    # the counter's UPDATE. A refused move on an active booking means one entry
+    # (or exit) too many for the party size. Entries beyond guests_count are
+    # always refused; the anti-passback mode only adds the flag (and decides
+    # about surplus exits).
+    inside = _move_group_counter(row["booking_id"], direction, now)
+    decision = "allow" if inside is not None or _is_active(row["booking_id"], now) else "deny"
+    reason = None
+    if decision == "allow" and inside is None:
+        enforce = enforcement()
+        if enforce != "off":
+            flag = reason = "passback"
+        if direction == "in":
+            decision = "deny"
+            reason = reason or "group_full"
+            message = f"All {total} guests already inside" + (" (anti-passback)." if flag else ".")
+        elif flag:
+            message = "No guests from this booking are inside (anti-passback)."
+            if enforce == "hard":
+                decision = "deny"
+    if inside is None:
+        # the counter lives on the row, not in the manifest
+        inside = db.session.query(Booking.inside_count).filter(Booking.id == row["booking_id"]).scalar() or 0
 
     db.session.add(AccessLog(
         guard_id=current_user.id,
         checkpoint_id=checkpoint_id,
-        guest_id=guest.id if guest else None,
-        booking_id=booking.id,
-        national_id_number=guest.national_id_number if guest else None,
+        guest_id=row["guest_id"],
+        booking_id=row["booking_id"],
+        national_id_number=row["national_id"],
         decision=decision,
+        direction=direction,
+        flag=flag,
         image_path=None,
-        ocr_text="[booking_qr]"
+        ocr_text="[booking_qr]",
+        latency_ms=_elapsed_ms(),
     ))
     db.session.commit()
+    if decision == "allow" and not flag:
+        occupancy.record(row["property_id"], row["booking_id"], direction)
 
-    info = {
-        "guest_name": guest.full_name if guest else "",
-        "national_id": guest.national_id_number if guest else "",
-        "property": prop.name if prop else "",
-        "room": room.name if room else "",
-        "check_in": booking.check_in.isoformat(),
-        "check_out": booking.check_out.isoformat(),
-        "booking_id": booking.id,
-        "guests_count": booking.guests_count,
-        "owns_vehicle": booking.owns_vehicle,
-        "vehicle_plate": booking.vehicle_plate,
+    info = _booking_info(row)
+    resp = {
+        "ok": True,
+        "decision": decision,
+        "direction": direction,
+        "group": {"inside": inside, "total": total},
+        "info": info,
+        "occupancy": {"property": occupancy.property_count(row["property_id"])},
     }
-    return jsonify({"ok": True, "decision": decision, "info": info})
\ No newline at end of file
+    if flag:
+        resp["flag"] = flag
+    if reason:
+        resp["reason"] = reason
+    if message:
+        resp["message"] = message
+    _publish_scan(decision, direction, flag, row, checkpoint_id)
+    return jsonify(resp)
+
+
+# --- Vehicle gate: resolve a plate (typed or OCR'd crop) to an active booking ---
+@bp.get("/plate-scan")
+@login_required
+def plate_scan_page():
+    if not _guard_only():
+        flash("Unauthorized", "error")
+        return redirect(url_for("home"))
+    checkpoints = Checkpoint.query.all()
+    return render_template("guard_plate_scan.html", checkpoints=checkpoints)
+
+@bp.post("/plate-scan")
+@login_required
+def plate_scan_post():
+    if not _guard_only():
+        return jsonify({"ok": False, "error": "Unauthorized"}), 403
+
+    checkpoint_id, mode = _safe_checkpoint(request.form.get("checkpoint_id"))
+    direction = passback.resolve_direction(mode, request.form.get("direction"))
+    plate = (request.form.get("plate") or "").strip()
+    image_path = None
+    ocr_text = "[plate_manual]"
+
+    crop = request.files.get("plate_image")
+    crop_upload_id = (request.form.get("plate_upload_id") or "").strip()
+    if not plate and (crop_upload_id or (crop and crop.filename)):
+        upload_dir = os.path.join(current_app.root_path, "uploads", "plates")
+        os.makedirs(upload_dir, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S_")
+        if crop_upload_id:
+            # finished resumable upload (/upload/...): move it into place instead of re-sending
+            try:
+                meta = resumable.claim(crop_upload_id, current_user.id, "plate",
+                                       os.path.join(upload_dir, f"{stamp}{crop_upload_id[:8]}.part"))
+            except resumable.UploadError as e:
+                return jsonify({"ok": False, "error": str(e)}), e.status
+            fname = stamp + (secure_filename(meta["filename"]) or "plate.jpg")
+            full = os.path.join(upload_dir, fname)
+            os.replace(meta["path"], full)
+        else:
+            fname = stamp + secure_filename(crop.filename)
+            full = os.path.join(upload_dir, fname)
+            crop.save(full)
+        image_path = f"/uploads/plates/{fname}"
+        try:
+            ocr_text, plate = extract_plate_text(full)
+        except Exception as e:  # tesseract missing/misconfigured
+            current_app.logger.warning("plate OCR failed: %s", e)
+            ocr_text, plate = "[plate_ocr_failed]", None
+        plate = plate or ""
+
+    key = normalize_plate(plate)
+    if not key:
+        return jsonify({"ok": True, "decision": "deny", "reason": "no_plate",
+                        "message": "No plate number provided or detected."})
+
+    tz = pytz.timezone('Africa/Nairobi')
+    now = datetime.now(tz).replace(tzinfo=None)
+
+    manifest = manifests.for_checkpoint(checkpoint_id)
+    row = manifest.active_for_plate(key, now) if manifest else None
+    if row is not None and not _is_active(row["booking_id"], now):
+        row = None  # stale manifest entry; look again in the DB
+    if row is None:
+        # one probe of ix_booking_plate_key_check_out
+        rows = booking_rows(
+            Booking.plate_key == key,
+            Booking.check_out >= now,
+            Booking.check_in <= now,
+            Booking.owns_vehicle.is_(True),
+            Booking.status != "cancelled",
+        )
+        row = max(rows, key=lambda r: r["check_out"]) if rows else None
+
+    decision = "deny"
+    flag = reason = message = inside = None
+    if row:
+        # same passback / group counter / occupancy path as ID and QR scans
+        decision, flag, reason, message, inside = _admit(row, f"plate:{key}", direction, checkpoint_id, now)
+    db.session.add(AccessLog(
+        guard_id=current_user.id,
+        checkpoint_id=checkpoint_id,
+        guest_id=row["guest_id"] if row else None,
+        booking_id=row["booking_id"] if row else None,
+        national_id_number=row["national_id"] if row else None,
+        decision=decision,
+        direction=direction,
+        flag=flag,
+        image_path=image_path,
+        ocr_text=f"[plate:{key}] {ocr_text}".strip(),
+        latency_ms=_elapsed_ms(),
+    ))
+    db.session.commit()
+    if decision == "allow" and not flag:
+        occupancy.record(row["property_id"], row["booking_id"], direction)
+    _publish_scan(decision, direction, flag, row, checkpoint_id)
+
+    if not row:
+        return jsonify({"ok": True, "decision": "deny", "reason": "no_active_booking",
+                        "plate": plate, "plate_key": key,
+                        "message": "No active booking for this plate at the current time."})
+    if inside is None:
+        inside = db.session.query(Booking.inside_count).filter(Booking.id == row["booking_id"]).scalar() or 0
+    resp = {"ok": True, "decision": decision, "direction": direction,
+            "plate": plate, "plate_key": key, "info": _booking_info(row),
+            "group": {"inside": inside, "total": row["guests_count"] or 1},
+            "occupancy": {"property": occupancy.property_count(row["property_id"])}}
+    if flag:
+        resp["flag"] = flag
+    if reason:
+        resp.update(reason=reason, message=message)
+    return jsonify(resp)
+
+
+# --- Gate manifest: who to expect at this checkpoint today ---
+@bp.get("/manifest")
+@login_required
+def manifest_json():
+    """Today's manifest for a checkpoint's property as one cached JSON payload (ETag'd by version)."""
+    if not _guard_only() and current_user.role != ROLE_ADMIN:
+        return jsonify({"ok": False, "error": "Unauthorized"}), 403
+    checkpoint_id, _ = _safe_checkpoint(request.args.get("checkpoint_id"))
+    manifest = manifests.for_checkpoint(checkpoint_id)
+    if manifest is None:
+        return jsonify({"ok": False, "error": "Unknown checkpoint"}), 404
+
+    etag = f'"m{manifest.property_id}-{manifest.day.isoformat()}-{manifest.version}"'
+    if request.if_none_match.contains(etag.strip('"')):
+        return current_app.response_class(status=304, headers={"ETag": etag})
+    return current_app.response_class(
+        manifest.payload(), mimetype="application/json",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
+
+
+# --- Live headcount (process-local counters, no log aggregation) ---
+@bp.get("/occupancy")
+@login_required
+def occupancy_json():
+    """Current headcount per property; hosts only see their own properties."""
+    if current_user.role == ROLE_HOST:
+        counts = occupancy.properties(owned_property_ids(current_user.id))
+    else:
+        counts = occupancy.properties()
+
+    data = {"ok": True, "properties": counts, "total": sum(counts.values())}
+    booking_id = request.args.get("booking_id", type=int)
+    if booking_id and current_user.role == ROLE_HOST:
+        owner_id = (
+            db.session.query(Property.owner_id)
+            .join(Room, Room.property_id == Property.id)
+            .join(Booking, Booking.room_id == Room.id)
+            .filter(Booking.id == booking_id)
+            .scalar()
+        )
+        if owner_id is not None and owner_id != current_user.id:
+            booking_id = None
+    if booking_id:
+        data["booking"] = {"id": booking_id, "inside": occupancy.booking_count(booking_id)}
+    return jsonify(data)
@@ -6,17 +6,27 @@ from datetime import datetime
 
 from flask import (
     Blueprint, render_template, request, redirect, url_for,
-    flash, jsonify, current_app, send_file, send_from_directory
+    flash, jsonify, current_app, send_file, abort
 )
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
+from sqlalchemy import case, delete as sa_delete, or_, insert, select, update
+from markupsafe import escape
 
 from models import (
-    db, ROLE_ADMIN, ROLE_HOST, ROLE_GUARD,
-    Booking, Luggage, LuggageScanLog, Checkpoint, Room, Guest, Property, User
+    db, ROLE_ADMIN, ROLE_HOST, ROLE_GUARD, LUGGAGE_EXITABLE,
+    Booking, Luggage, LuggageScanLog, LuggageStatusLog, Checkpoint, Room, Guest, Property, User
 )
 from utils.plan_gate import require_plan
 from utils.mailer import send_email_html
+from utils.events import publish_event
+from utils.images import ImageTooLarge, MAX_PIXELS, store_upload, store_upload_file, render_variants, content_key, ensure_variant, is_hashed, photo_url, luggage_dir, row_photo_path
+from utils.tasks import enqueue
+from utils import scan_cards
+from utils.write_hooks import touch
+from utils.labels import label_sheet, qr_pngs, LABEL_SHEET_MAX
+from utils import resumable, storage
+from utils.manifest import local_now
+from utils.search import index as search_index
 
 
 # Optional QR lib (PNG generation)
@@ -44,6 +54,14 @@ def _can_view():
     return current_user.is_authenticated and current_user.role in (ROLE_ADMIN, ROLE_HOST)
 
 
+def _publish_luggage(lug: Luggage, action: str, property_id=None, checkpoint_id=None):
+    """Push a luggage change to the registering host's dashboard and the guard stations."""
+    publish_event("luggage", {
+        "action": action, "luggage_id": lug.id, "label": lug.label,
+        "status": lug.status, "booking_id": lug.booking_id,
+    }, host_id=lug.host_id, property_id=property_id, checkpoint_id=checkpoint_id)
+
+
 # ================== Admin/Host: list & detail ==================
 
 @bp.get("/")
@@ -110,12 +128,25 @@ def detail(lug_id: int):
         .all()
     )
 
+    changes = (
+        db.session.query(LuggageStatusLog, User.name)
+        .outerjoin(User, User.id == LuggageStatusLog.actor_id)
+        .filter(LuggageStatusLog.luggage_id == lug_id)
+        .order_by(LuggageStatusLog.id.desc())
+        .limit(50)
+        .all()
+    )
+
     luggage, booking, room, guest, prop, host_user = data
+    photo = None
+    if luggage.photo_path:
+        photo = {f"{v}_{ext}": photo_url(luggage.photo_path, v, ext)
+                 for v in ("display", "thumb") for ext in ("webp", "jpg")}
 
     return render_template(
         "admin_luggage_detail.html",
         luggage=luggage, booking=booking, room=room, guest=guest, prop=prop,
-        host_user=host_user, scans=scans
+        host_user=host_user, scans=scans, changes=changes, photo=photo
     )
 
 
@@ -129,22 +160,82 @@ def new():
         flash("Only hosts can register luggage.", "error")
         return redirect(url_for("luggage.list_"))
 
-    # Show only THIS host's recent/upcoming bookings
-    bookings = (
-        db.session.query(Booking, Room, Guest, Property)
+    # bookings are picked via the typeahead; here we only need to know there are any
+    has_bookings = (
+        db.session.query(Booking.id)
         .join(Room, Booking.room_id == Room.id)
-        .join(Guest, Booking.guest_id == Guest.id)
         .join(Property, Room.property_id == Property.id)
         .filter(Property.owner_id == current_user.id)
-        .order_by(Booking.check_in.desc())
-        .limit(300)
-        .all()
+        .first()
     )
-    if not bookings:
+    if not has_bookings:
         flash("You have no bookings yet. Create a booking first.", "error")
         return redirect(url_for("bookings.new_booking"))
 
-    return render_template("admin_luggage_new.html", bookings=bookings)
+    # ?booking_id= preselects (e.g. coming from a booking page)
+    selected = None
+    booking_id = request.args.get("booking_id", type=int)
+    if booking_id:
+        row = _picker_query().filter(Booking.id == booking_id).first()
+        selected = _picker_item(row) if row else None
+
+    return render_template("admin_luggage_new.html", selected=selected)
+
+
+# ---------------- Host: booking picker (typeahead) ----------------
+PICKER_LIMIT = 10
+_CLOSED_BOOKING = ("cancelled", "checked_out")
+
+
+def _picker_query():
+    """This host's bookings, projected to what the picker shows."""
+    return (
+        db.session.query(Booking.id, Booking.status, Booking.check_in, Booking.check_out,
+                         Guest.full_name, Room.name.label("room"), Property.name.label("property"))
+        .join(Room, Booking.room_id == Room.id)
+        .join(Guest, Booking.guest_id == Guest.id)
+        .join(Property, Room.property_id == Property.id)
+        .filter(Property.owner_id == current_user.id)
+    )
+
+
+def _picker_item(r) -> dict:
+    return {
+        "id": r.id, "guest": r.full_name, "property": r.property, "room": r.room, "status": r.status,
+        "check_in": r.check_in.isoformat(), "check_out": r.check_out.isoformat(),
+        "label": f"#{r.id} — {r.full_name} • {r.property} / {r.room} "
+                 f"({r.check_in:%d %b} → {r.check_out:%d %b %Y})",
+    }
+
+
+@bp.get("/bookings/typeahead")
+@login_required
+@require_plan("premium")
+def booking_typeahead():
+    """Active and upcoming bookings matching ?q= (guest, phone, ID, plate, room); soonest first when q is empty."""
+    if not _is_host():
+        return jsonify({"ok": False, "error": "Only hosts can register luggage."}), 403
+
+    q = (request.args.get("q") or "").strip()
+    now = local_now()
+    if q:
+        uid = current_user.id
+        docs = search_index.search(
+            q, {uid}, kinds=("booking",), limit=PICKER_LIMIT,
+            # bags are registered on the host's own properties only, not on property-less rooms
+            where=lambda d: uid in d.owners and d.row.check_out >= now and d.row.status not in _CLOSED_BOOKING,
+        )
+        items = [_picker_item(d.row) for d in docs]
+    else:
+        rows = (_picker_query()
+                .filter(Booking.check_out >= now, Booking.status.notin_(_CLOSED_BOOKING))
+                .order_by(Booking.check_in.asc())
+                .limit(PICKER_LIMIT))
+        items = [_picker_item(r) for r in rows]
+
+    if request.headers.get("HX-Request"):
+        return render_template("luggage_booking_options.html", items=items, q=q)
+    return jsonify({"ok": True, "results": items})
 
 
 @bp.post("/new")
@@ -159,6 +250,7 @@ def create():
     label = (request.form.get("label") or "").strip()
     size = (request.form.get("size") or "medium").strip().lower()
     photo = request.files.get("photo")
+    photo_upload_id = (request.form.get("photo_upload_id") or "").strip()
 
     if not booking_id:
         flash("Booking is required.", "error")
@@ -185,15 +277,34 @@ def create():
     # generate QR token
     qr_token = secrets.token_urlsafe(16)
 
-    # optional photo upload -> store WEB path (/uploads/luggage/...)
-    photo_path = None
-    if photo and photo.filename:
-        upload_dir = os.path.join(current_app.root_path, "uploads", "luggage")
-        os.makedirs(upload_dir, exist_ok=True)
-        fname = datetime.utcnow().strftime("%Y%m%d%H%M%S_") + secure_filename(photo.filename)
-        full = os.path.join(upload_dir, fname)
-        photo.save(full)
-        photo_path = f"/uploads/luggage/{fname}"
+    # optional photo: parked under its content hash; thumbnails/WebP are rendered in the background
+    photo_path = photo_key = None
+    if photo_upload_id:
+        # finished resumable upload (/upload/...): already on disk, just move it into place
+        try:
+            part = resumable.claim(photo_upload_id, current_user.id, "luggage",
+                                   os.path.join(luggage_dir(), "incoming", f"{photo_upload_id}.upload"))
+            photo_path, photo_key = store_upload_file(part["path"])
+        except resumable.UploadError as e:
+            flash(f"Photo upload failed: {e}", "error")
+            return redirect(url_for("luggage.new"))
+        except ImageTooLarge:
+            flash(f"The photo is too large (over {MAX_PIXELS // 1_000_000} megapixels).", "error")
+            return redirect(url_for("luggage.new"))
+        except ValueError:
+            flash("The photo could not be read as an image.", "error")
+            return redirect(url_for("luggage.new"))
+    elif photo and photo.filename:
+        data = photo.read()
+        try:
+            photo_path = store_upload(data)
+        except ImageTooLarge:
+            flash(f"The photo is too large (over {MAX_PIXELS // 1_000_000} megapixels).", "error")
+            return redirect(url_for("luggage.new"))
+        except ValueError:
+            flash("The photo could not be read as an image.", "error")
+            return redirect(url_for("luggage.new"))
+        photo_key = content_key(data)
 
     lug = Luggage(
         booking_id=booking.id,
@@ -206,70 +317,13 @@ def create():
     )
     db.session.add(lug)
     db.session.commit()
+    if photo_key:
+        enqueue(render_variants, photo_key)
+    _publish_luggage(lug, "created")
 
-     # --- Email the guest (if booking.guest.email is present) ---
+    # --- Email the guest (if booking.guest.email is present) ---
     try:
-        # Build/ensure QR PNG bytes for inline <img cid:...>
-        # You already created `qr_token`; generate a fresh PNG in-memory for email:
-        qr_png_bytes = None
-        if qrcode is not None:
-            img = qrcode.make(qr_token, image_factory=PilImage, box_size=8, border=2)
-            bio = io.BytesIO()
-            img.save(bio, format="PNG")
-            qr_png_bytes = bio.getvalue()
-
-        # Lookup joined context for email
-        booking = Booking.query.get(booking_id)
-        room    = Room.query.get(booking.room_id) if booking else None
-        prop    = Property.query.get(room.property_id) if (room and room.property_id) else None
-        guest   = Guest.query.get(booking.guest_id) if booking else None
-
-        if guest and guest.email:
-            # Use a stable cid id
-            qr_cid = f"luggageqr-{lug.id}"
-
-            html = f"""
-<!doctype html>
-<html lang="en">
-  <body style="margin:0;background:#f6f7fb;padding:24px;font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,Helvetica,Arial">
-    <table role="presentation" width="100%" cellspacing="0" cellpadding="0" style="max-width:640px;margin:0 auto;background:#ffffff;border-radius:16px;overflow:hidden;border:1px solid #e5e7eb">
-      <tr>
-        <td style="padding:18px 22px;border-bottom:1px solid #e5e7eb">
-          <div style="font-weight:600;font-size:18px;color:#0f172a">Luggage Pass Ready</div>
-          <div style="font-size:13px;color:#475569;margin-top:2px">Show this QR at the gate when exiting with luggage.</div>
-        </td>
-      </tr>
-      <tr>
-        <td style="padding:18px 22px">
-          <div style="font-size:14px;color:#0f172a;margin-bottom:8px"><strong>Guest</strong>: {guest.full_name}</div>
-          <div style="font-size:12px;color:#475569">Label: {label}</div>
-          <div style="font-size:12px;color:#475569">Size: {size.capitalize()}</div>
-          {"<div style='font-size:12px;color:#475569'>Property / Room: " + (prop.name if prop else "—") + " · " + (room.name if room else "—") + "</div>"}
-          <div style="height:16px"></div>
-          <div style="font-size:13px;color:#0f172a;margin-bottom:6px"><strong>Luggage QR</strong></div>
-          <img src="cid:{qr_cid}" alt="Luggage QR"
-               style="display:block;width:180px;height:180px;object-fit:contain;border:1px solid #e5e7eb;border-radius:12px;padding:8px;background:#fff" />
-          <div style="height:8px"></div>
-          <div style="font-size:12px;color:#64748b">The guard will scan this to authorize your luggage to exit.</div>
-        </td>
-      </tr>
-      <tr>
-        <td style="padding:14px 22px;background:#f8fafc;border-top:1px solid #e5e7eb;font-size:12px;color:#64748b">
-          Luggage #{lug.id} · Generated {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}
-        </td>
-      </tr>
-    </table>
-  </body>
-</html>
-""".strip()
-
-            inline = {qr_cid: qr_png_bytes} if qr_png_bytes else None
-            send_email_html(
-                subject="Your Luggage Pass (QR)",
-                to_email=guest.email,
-                html=html,
-                inline=inline
-            )
+        _send_luggage_email(booking.id, [lug.id])
     except Exception as e:
         current_app.logger.warning(f"Failed to send luggage email: {e}")
 
@@ -294,34 +348,153 @@ def _host_owns_luggage(lug: Luggage) -> bool:
     return owner_id == current_user.id
 
 
+# ---------------- Host: status transitions (one bag or a whole batch) ----------------
+# action -> (statuses it applies to, resulting status)
+TRANSITIONS = {
+    "clear":   (("pending",), "cleared"),              # pre-cleared for exit by the host
+    "block":   (LUGGAGE_EXITABLE, "blocked"),
+    "unblock": (("blocked",), "pending"),
+    "exit":    (LUGGAGE_EXITABLE, "exited"),           # left without a gate scan
+}
+BULK_STATUS_MAX = int(os.getenv("BULK_LUGGAGE_STATUS_MAX", "500"))
+_EXITABLE = TRANSITIONS["exit"][0]
+STATUS_LOG_SPLIT = "luggage_status_log_v1"
+
+
+def split_status_log():
+    """One-off data step: host status changes once written to LuggageScanLog move to LuggageStatusLog."""
+    scan = LuggageScanLog.__table__
+    moved = (scan.c.decision.in_(list(TRANSITIONS)), scan.c.luggage_id.isnot(None))
+    status = case({a: to for a, (_, to) in TRANSITIONS.items()}, value=scan.c.decision)
+    db.session.execute(
+        insert(LuggageStatusLog.__table__).from_select(
+            ["created_at", "luggage_id", "actor_id", "action", "status"],
+            select(scan.c.created_at, scan.c.luggage_id, scan.c.guard_id, scan.c.decision, status).where(*moved),
+        )
+    )
+    db.session.execute(sa_delete(scan).where(*moved))
+    db.session.commit()
+
+
+def _transition(action: str, ids=None, booking_id=None) -> list[int]:
+    """
+    Apply `action` to the given bags (or every bag on `booking_id`) that this
+    user may manage and whose status allows it: one ownership-scoped SELECT
+    (row-locked where the database supports it), one set-based UPDATE, one
+    multi-row LuggageStatusLog insert. Returns the ids that actually changed.
+    """
+    from_statuses, to_status = TRANSITIONS[action]
+    q = db.session.query(Luggage.id).filter(Luggage.status.in_(from_statuses))
+    if ids is not None:
+        q = q.filter(Luggage.id.in_(ids))
+    if booking_id is not None:
+        q = q.filter(Luggage.booking_id == booking_id)
+    if not _is_admin():
+        # bookings on the host's properties — no join on luggage itself, so MySQL accepts it in the UPDATE too
+        owned = (
+            select(Booking.id)
+            .join(Room, Booking.room_id == Room.id)
+            .join(Property, Room.property_id == Property.id)
+            .where(Property.owner_id == current_user.id)
+        )
+        q = q.filter(Luggage.booking_id.in_(owned))
+    changed = [i for (i,) in q.with_for_update().limit(BULK_STATUS_MAX).all()]
+    if not changed:
+        return []
+
+    db.session.execute(
+        update(Luggage.__table__)
+        .where(Luggage.__table__.c.id.in_(changed), Luggage.__table__.c.status.in_(from_statuses))
+        .values(status=to_status)
+        .execution_options(write_hooks=False)
+    )
+    touch(db.session, Luggage, changed)  # listeners get the exact ids rather than "everything"
+    now = datetime.utcnow()
+    db.session.execute(insert(LuggageStatusLog.__table__), [
+        {"created_at": now, "luggage_id": i, "actor_id": current_user.id, "action": action, "status": to_status}
+        for i in changed
+    ])
+    db.session.commit()
+
+    # guard screens listen on the firehose; hosts on their own channel
+    publish_event("luggage", {
+        "action": to_status if len(changed) == 1 else f"bulk_{action}",
+        "luggage_id": changed[0] if len(changed) == 1 else None,
+        "luggage_ids": changed, "count": len(changed), "status": to_status, "booking_id": booking_id,
+    }, host_id=current_user.id)
+    return changed
+
+
+def _single_transition(lug_id: int, action: str, done_msg: str):
+    if not (_is_host() or _is_admin()):
+        flash("Unauthorized", "error")
+        return redirect(url_for("luggage.list_"))
+    if _transition(action, ids=[lug_id]):
+        flash(done_msg, "success")
+    elif db.session.get(Luggage, lug_id) is None:
+        abort(404)
+    else:
+        flash("No change: not your item, or its status doesn't allow that.", "error")
+    return redirect(url_for("luggage.detail", lug_id=lug_id))
+
+
 @bp.post("/<int:lug_id>/block")
 @login_required
 @require_plan("premium")
 def block(lug_id: int):
-    lug = Luggage.query.get_or_404(lug_id)
-    if not _host_owns_luggage(lug):
-        flash("Unauthorized", "error")
-        return redirect(url_for("luggage.list_"))
-
-    lug.status = "blocked"
-    db.session.commit()
-    flash("Luggage blocked.", "success")
-    return redirect(url_for("luggage.detail", lug_id=lug.id))
+    return _single_transition(lug_id, "block", "Luggage blocked.")
 
 
 @bp.post("/<int:lug_id>/unblock")
 @login_required
 @require_plan("premium")
 def unblock(lug_id: int):
-    lug = Luggage.query.get_or_404(lug_id)
-    if not _host_owns_luggage(lug):
-        flash("Unauthorized", "error")
-        return redirect(url_for("luggage.list_"))
+    return _single_transition(lug_id, "unblock", "Luggage status updated.")
 
-    lug.status = "pending" if lug.status != "exited" else "exited"
-    db.session.commit()
-    flash("Luggage status updated.", "success")
-    return redirect(url_for("luggage.detail", lug_id=lug.id))
+
+@bp.post("/status")
+@login_required
+@require_plan("premium")
+def bulk_status():
+    """
+    Batch transition: action=clear|block|unblock|exit for ids=[...] (repeated
+    form field, or JSON list) or a whole booking_id. Bags whose status doesn't
+    allow the action are skipped and reported as such.
+    """
+    body = request.get_json(silent=True)
+    wants_json = body is not None
+    src = body if wants_json else request.form
+    action = src.get("action")
+    raw_ids = src.get("ids") if wants_json else request.form.getlist("ids")
+    booking_id = src.get("booking_id")
+
+    def done(msg, status=200, **extra):
+        if wants_json:
+            return jsonify({"ok": status == 200, ("message" if status == 200 else "error"): msg, **extra}), status
+        flash(msg, "success" if status == 200 else "error")
+        return redirect(request.referrer or url_for("luggage.list_"))
+
+    if not (_is_host() or _is_admin()):
+        return done("Unauthorized", 403)
+    if action not in TRANSITIONS:
+        return done(f"action must be one of {', '.join(TRANSITIONS)}.", 400)
+    try:
+        ids = [int(i) for i in raw_ids] if raw_ids else None
+        booking_id = int(booking_id) if booking_id not in (None, "") else None
+    except (TypeError, ValueError):
+        return done("ids and booking_id must be integers.", 400)
+    if ids is None and booking_id is None:
+        return done("Pick some luggage or a booking.", 400)
+    if ids is not None and len(ids) > BULK_STATUS_MAX:
+        return done(f"At most {BULK_STATUS_MAX} items per request.", 413)
+
+    changed = _transition(action, ids=ids, booking_id=booking_id)
+    requested = len(ids) if ids is not None else None
+    skipped = (requested - len(changed)) if requested is not None else None
+    msg = f"{len(changed)} item(s) set to {TRANSITIONS[action][1]}."
+    if skipped:
+        msg += f" {skipped} skipped (not yours or status doesn't allow it)."
+    return done(msg, changed=changed, skipped=skipped)
 
 
 @bp.post("/<int:lug_id>/delete")
@@ -333,12 +506,241 @@ def delete(lug_id: int):
         flash("Unauthorized", "error")
         return redirect(url_for("luggage.list_"))
 
+    db.session.execute(sa_delete(LuggageStatusLog).where(LuggageStatusLog.luggage_id == lug.id))  # its history goes with it
     db.session.delete(lug)
     db.session.commit()
     flash("Luggage deleted.", "success")
     return redirect(url_for("luggage.list_"))
 
 
+# ---------------- Host: bulk registration & label sheets ----------------
+BULK_LUGGAGE_MAX = int(os.getenv("BULK_LUGGAGE_MAX", "30"))
+LUGGAGE_SIZES = ("small", "medium", "large", "oversize")
+
+
+def _parse_bags():
+    """(booking_id, [{"label", "size"}]) from a JSON body or the repeated label/size form fields."""
+    body = request.get_json(silent=True)
+    if body is not None:
+        bags = body.get("bags") if isinstance(body.get("bags"), list) else []
+        booking_id = body.get("booking_id")
+    else:
+        bags = [{"label": l, "size": s}
+                for l, s in zip(request.form.getlist("label"), request.form.getlist("size"))]
+        booking_id = request.form.get("booking_id")
+    clean = []
+    for bag in bags:
+        if not isinstance(bag, dict):
+            raise ValueError("Each bag must be an object.")
+        label = str(bag.get("label") or "").strip()[:255]
+        if not label:
+            continue  # blank rows in the form
+        size = str(bag.get("size") or "medium").strip().lower()
+        clean.append({"label": label, "size": size if size in LUGGAGE_SIZES else "medium"})
+    try:
+        booking_id = int(booking_id or 0)
+    except (TypeError, ValueError):
+        booking_id = 0
+    return booking_id, clean
+
+
+@bp.get("/bulk")
+@login_required
+@require_plan("premium")
+def bulk_new():
+    if not _is_host():
+        flash("Only hosts can register luggage.", "error")
+        return redirect(url_for("luggage.list_"))
+    selected = None
+    booking_id = request.args.get("booking_id", type=int)
+    if booking_id:
+        row = _picker_query().filter(Booking.id == booking_id).first()
+        selected = _picker_item(row) if row else None
+    return render_template("admin_luggage_bulk.html", selected=selected, max_bags=BULK_LUGGAGE_MAX,
+                           sizes=LUGGAGE_SIZES)
+
+
+@bp.post("/bulk")
+@login_required
+@require_plan("premium")
+def bulk_create():
+    """
+    Register several bags on one booking: one ownership check, one multi-row
+    INSERT, one consolidated guest email (sent in the background). Forms are
+    redirected to the printable label sheet; JSON callers get the new rows.
+    """
+    wants_json = request.is_json
+
+    def fail(msg, status=400):
+        if wants_json:
+            return jsonify({"ok": False, "error": msg}), status
+        flash(msg, "error")
+        return redirect(url_for("luggage.bulk_new", booking_id=request.form.get("booking_id") or None))
+
+    if not _is_host():
+        return fail("Only hosts can register luggage.", 403)
+    try:
+        booking_id, bags = _parse_bags()
+    except ValueError as e:
+        return fail(str(e))
+    if not booking_id:
+        return fail("Booking is required.")
+    if not bags:
+        return fail("Add at least one bag with a label.")
+    if len(bags) > BULK_LUGGAGE_MAX:
+        return fail(f"At most {BULK_LUGGAGE_MAX} bags per request.", 413)
+
+    # one ownership check for the whole batch
+    booking = _picker_query().filter(Booking.id == booking_id).first()
+    if not booking:
+        return fail("Invalid booking selection.", 404)
+
+    now = datetime.utcnow()
+    tokens = [secrets.token_urlsafe(16) for _ in bags]
+    db.session.execute(insert(Luggage.__table__), [
+        {"owner_type": "guest", "booking_id": booking_id, "host_id": current_user.id,
+         "label": bag["label"], "size": bag["size"], "qr_token": tok, "status": "pending", "created_at": now}
+        for bag, tok in zip(bags, tokens)
+    ])
+    # qr_token is unique, so one IN query maps tokens back to ids
+    id_by_token = dict(db.session.query(Luggage.qr_token, Luggage.id).filter(Luggage.qr_token.in_(tokens)).all())
+    db.session.commit()
+
+    ids = [id_by_token[tok] for tok in tokens]
+    publish_event("luggage", {
+        "action": "bulk_created", "count": len(ids), "luggage_ids": ids, "booking_id": booking_id,
+    }, host_id=current_user.id)
+    enqueue(_send_luggage_email, booking_id, ids)
+
+    if wants_json:
+        return jsonify({
+            "ok": True, "created": len(ids),
+            "luggage": [{"id": i, "qr_token": tok, **bag} for i, tok, bag in zip(ids, tokens, bags)],
+            "labels": {fmt: url_for("luggage.labels_sheet", fmt=fmt, ids=",".join(map(str, ids)))
+                       for fmt in ("pdf", "png")},
+        }), 201
+    flash(f"{len(ids)} bags registered.", "success")
+    return redirect(url_for("luggage.labels_page", ids=",".join(map(str, ids))))
+
+
+def _label_rows():
+    """Luggage rows named by ?ids= (or every bag on ?booking_id=) that this user may print."""
+    q = (
+        db.session.query(Luggage.id, Luggage.qr_token, Luggage.label, Luggage.size,
+                         Guest.full_name, Room.name.label("room"), Property.name.label("property"))
+        .outerjoin(Booking, Luggage.booking_id == Booking.id)
+        .outerjoin(Guest, Booking.guest_id == Guest.id)
+        .outerjoin(Room, Booking.room_id == Room.id)
+        .outerjoin(Property, Room.property_id == Property.id)
+    )
+    ids = [int(x) for x in (request.args.get("ids") or "").split(",") if x.strip().isdigit()]
+    booking_id = request.args.get("booking_id", type=int)
+    if ids:
+        q = q.filter(Luggage.id.in_(ids[:LABEL_SHEET_MAX]))
+    elif booking_id:
+        q = q.filter(Luggage.booking_id == booking_id)
+    else:
+        return []
+    if _is_host():
+        q = q.filter(Property.owner_id == current_user.id)
+    return q.order_by(Luggage.id.asc()).limit(LABEL_SHEET_MAX).all()
+
+
+@bp.get("/labels")
+@login_required
+def labels_page():
+    if not _can_view():
+        flash("Unauthorized", "error")
+        return redirect(url_for("home"))
+    rows = _label_rows()
+    if not rows:
+        flash("Nothing to print.", "error")
+        return redirect(url_for("luggage.list_"))
+    return render_template("luggage_labels.html", rows=rows, ids=",".join(str(r.id) for r in rows))
+
+
+@bp.get("/labels.<fmt>")
+@login_required
+def labels_sheet(fmt: str):
+    """Printable QR label sheet (PDF pages or one tall PNG), rendered in memory."""
+    if fmt not in ("pdf", "png"):
+        abort(404)
+    if not _can_view():
+        abort(403)
+    if qrcode is None:
+        return "qrcode library not installed. pip install qrcode[pil]", 500
+    rows = _label_rows()
+    if not rows:
+        abort(404)
+    data = label_sheet([
+        (r.qr_token, [r.label, f"{r.size.capitalize()} · #{r.id}", f"{r.full_name or ''} · {r.room or ''}".strip(" ·")])
+        for r in rows
+    ], fmt)
+    return send_file(io.BytesIO(data), mimetype="application/pdf" if fmt == "pdf" else "image/png",
+                     download_name=f"luggage_labels.{fmt}")
+
+
+def _send_luggage_email(booking_id: int, luggage_ids):
+    """One guest email carrying a QR pass for each bag (inline cid images). Runs in the request or as a job."""
+    booking = Booking.query.get(booking_id)
+    guest = Guest.query.get(booking.guest_id) if booking else None
+    if not (guest and guest.email):
+        return
+    room = Room.query.get(booking.room_id)
+    prop = Property.query.get(room.property_id) if (room and room.property_id) else None
+    bags = Luggage.query.filter(Luggage.id.in_(luggage_ids)).order_by(Luggage.id.asc()).all()
+    if not bags:
+        return
+
+    # Build QR PNG bytes for inline <img cid:...>, on the render pool
+    pngs = qr_pngs([lug.qr_token for lug in bags]) if qrcode is not None else []
+    inline = {f"luggageqr-{lug.id}": png for lug, png in zip(bags, pngs)} or None
+
+    passes = "".join(f"""
+          <div style="height:16px"></div>
+          <div style="font-size:13px;color:#0f172a;margin-bottom:6px"><strong>{escape(lug.label)}</strong> · {escape((lug.size or "").capitalize())}</div>
+          <img src="cid:luggageqr-{lug.id}" alt="Luggage QR"
+               style="display:block;width:180px;height:180px;object-fit:contain;border:1px solid #e5e7eb;border-radius:12px;padding:8px;background:#fff" />""" for lug in bags)
+    title = "Luggage Pass Ready" if len(bags) == 1 else f"{len(bags)} Luggage Passes Ready"
+
+    html = f"""
+<!doctype html>
+<html lang="en">
+  <body style="margin:0;background:#f6f7fb;padding:24px;font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,Helvetica,Arial">
+    <table role="presentation" width="100%" cellspacing="0" cellpadding="0" style="max-width:640px;margin:0 auto;background:#ffffff;border-radius:16px;overflow:hidden;border:1px solid #e5e7eb">
+      <tr>
+        <td style="padding:18px 22px;border-bottom:1px solid #e5e7eb">
+          <div style="font-weight:600;font-size:18px;color:#0f172a">{title}</div>
+          <div style="font-size:13px;color:#475569;margin-top:2px">Show the matching QR at the gate when exiting with each item.</div>
+        </td>
+      </tr>
+      <tr>
+        <td style="padding:18px 22px">
+          <div style="font-size:14px;color:#0f172a;margin-bottom:8px"><strong>Guest</strong>: {escape(guest.full_name)}</div>
+          <div style='font-size:12px;color:#475569'>Property / Room: {escape(prop.name if prop else "—")} · {escape(room.name if room else "—")}</div>
+          {passes}
+          <div style="height:8px"></div>
+          <div style="font-size:12px;color:#64748b">The guard will scan these to authorize your luggage to exit.</div>
+        </td>
+      </tr>
+      <tr>
+        <td style="padding:14px 22px;background:#f8fafc;border-top:1px solid #e5e7eb;font-size:12px;color:#64748b">
+          Luggage {", ".join(f"#{lug.id}" for lug in bags)} · Generated {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}
+        </td>
+      </tr>
+    </table>
+  </body>
+</html>
+""".strip()
+
+    send_email_html(
+        subject="Your Luggage Pass (QR)" if len(bags) == 1 else f"Your Luggage Passes ({len(bags)} items)",
+        to_email=guest.email,
+        html=html,
+        inline=inline
+    )
+
+
 # ================== QR image (PNG) & Download ==================
 
 @bp.get("/qr/<token>.png")
@@ -389,11 +791,35 @@ def qr_download(token: str):
 
 # ================== Serve uploaded luggage photos ==================
 
+def _can_view_photo(fname: str) -> bool:
+    """Guards and admins see every photo; hosts only photos on their own luggage."""
+    if _is_admin() or _is_guard():
+        return True
+    if not _is_host():
+        return False
+    owned = (
+        db.session.query(Luggage.id)
+        .outerjoin(Booking, Booking.id == Luggage.booking_id)
+        .outerjoin(Room, Room.id == Booking.room_id)
+        .outerjoin(Property, Property.id == Room.property_id)
+        .filter(Luggage.photo_path == row_photo_path(fname))
+        .filter(or_(Property.owner_id == current_user.id, Luggage.host_id == current_user.id))
+        .first()
+    )
+    return owned is not None
+
+
 @bp.get("/uploads/luggage/<path:fname>")
 @login_required
 def luggage_uploads(fname: str):
-    folder = os.path.join(current_app.root_path, "uploads", "luggage")
-    return send_from_directory(folder, fname)
+    if not _can_view_photo(fname):
+        abort(404)
+    if not is_hashed(fname):
+        return storage.send("luggage", fname)  # legacy raw uploads
+    if not os.path.exists(os.path.join(luggage_dir(), fname)):
+        ensure_variant(fname)  # background render hasn't landed yet
+    # content-hashed: the bytes behind a name never change
+    return storage.send("luggage", fname, immutable=True)
 
 
 # ================== Guard: scanner page & scan API ==================
@@ -435,17 +861,9 @@ def guard_scan_post():
             "message": "No QR token detected."
         })
 
-    lug_join = (
-        db.session.query(Luggage, Booking, Room, Guest, Property)
-        .join(Booking, Luggage.booking_id == Booking.id)
-        .join(Room, Booking.room_id == Room.id)
-        .join(Guest, Booking.guest_id == Guest.id)
-        .join(Property, Room.property_id == Property.id)
-        .filter(Luggage.qr_token == token)
-        .first()
-    )
+    card = scan_cards.get(token)  # label/guest/room/property without the 5-table join on a hit
 
-    if not lug_join:
+    if not card:
         db.session.add(LuggageScanLog(
             guard_id=current_user.id,
             checkpoint_id=checkpoint_id,
@@ -456,42 +874,53 @@ def guard_scan_post():
         db.session.commit()
         return jsonify({"ok": True, "decision": "deny", "message": "QR not recognized."})
 
-    luggage, booking, room, guest, prop = lug_join
-
-    # Business rules
-    decision = "allow"
-    message = "Authorized to exit."
-    if luggage.status == "exited":
-        decision, message = "deny", "Already exited."
-    elif luggage.status == "blocked":
-        decision, message = "deny", "Blocked item."
+    # Business rules, applied atomically: only a pending/cleared bag can exit, and only once
+    lug_t = Luggage.__table__
+    res = db.session.execute(
+        update(lug_t)
+        .where(lug_t.c.id == card["luggage_id"], lug_t.c.status.in_(_EXITABLE))
+        .values(status="exited")
+        .execution_options(write_hooks=False)
+    )
+    if res.rowcount == 1:
+        decision, status = "allow", "exited"
+        message = "Pre-cleared by host. Authorized to exit." if card["status"] == "cleared" else "Authorized to exit."
+        touch(db.session, Luggage, [card["luggage_id"]])
+    else:
+        status = card["status"]
+        if status in _EXITABLE:
+            # the card says exitable but the UPDATE disagreed: lost a race, so read the one column we need
+            status = db.session.query(Luggage.status).filter(Luggage.id == card["luggage_id"]).scalar()
+        decision = "deny"
+        message = "Already exited." if status == "exited" else "Blocked item." if status == "blocked" else "Not authorized to exit."
 
     # Log the scan
     db.session.add(LuggageScanLog(
         guard_id=current_user.id,
         checkpoint_id=checkpoint_id,
-        luggage_id=luggage.id,
+        luggage_id=card["luggage_id"],
         decision=decision,
         note=message
     ))
-
-    if decision == "allow":
-        luggage.status = "exited"
-        db.session.add(luggage)
-
     db.session.commit()
 
+    publish_event("luggage", {
+        "action": "exited" if decision == "allow" else "exit_denied", "luggage_id": card["luggage_id"],
+        "label": card["label"], "status": status, "booking_id": card["booking_id"],
+    }, host_id=card["host_id"], property_id=card["property_id"], checkpoint_id=checkpoint_id)
+
     info = {
-        "luggage_id": luggage.id,
-        "label": luggage.label,
-        "size": luggage.size,
-        "photo": luggage.photo_path,
-        "status": luggage.status,
-        "booking_id": booking.id,
-        "guest_name": guest.full_name,
-        "room": room.name,
-        "property": prop.name,
-        "check_in": booking.check_in.isoformat(),
-        "check_out": booking.check_out.isoformat(),
+        "luggage_id": card["luggage_id"],
+        "label": card["label"],
+        "size": card["size"],
+        "photo": photo_url(card["photo_path"], "thumb", "webp"),
+        "photo_jpeg": photo_url(card["photo_path"], "thumb", "jpg"),
+        "status": status,
+        "booking_id": card["booking_id"],
+        "guest_name": card["guest_name"],
+        "room": card["room"],
+        "property": card["property"],
+        "check_in": card["check_in"].isoformat(),
+        "check_out": card["check_out"].isoformat(),
     }
-    return jsonify({"ok": True, "decision": decision, "info": info})
+    return jsonify({"ok": True, "decision": decision, "message": message, "info": info})
@@ -1,45 +1,15 @@
-import base64
-import datetime as dt
+import hmac
 import os
-import requests
 
-from zoneinfo import ZoneInfo
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, abort
+from flask_login import current_user
 from urllib.parse import urlparse
 
-bp = Blueprint("mpesa", __name__, url_prefix="/mpesa")
-
-# ---------- Shared helpers ----------
-def _mpesa_base_url() -> str:
-    env = (os.getenv("MPESA_ENV") or "sandbox").strip().lower()
-    return "https://api.safaricom.co.ke" if env == "live" else "https://sandbox.safaricom.co.ke"
-
-def _get_access_token():
-    key = os.getenv("MPESA_CONSUMER_KEY")
-    sec = os.getenv("MPESA_CONSUMER_SECRET")
-    if not key or not sec:
-        raise RuntimeError("Missing MPESA_CONSUMER_KEY / MPESA_CONSUMER_SECRET")
-    resp = requests.get(
-        f"{_mpesa_base_url()}/oauth/v1/generate?grant_type=client_credentials",
-        auth=(key, sec), timeout=15
-    )
-    resp.raise_for_status()
-    return resp.json()["access_token"]
+from models import ROLE_ADMIN
+from utils import payments
+from utils.mpesa import client as mpesa, MpesaError, CALLBACK_TOKEN, normalize_msisdn as _normalize_msisdn, valid_msisdn
 
-def _timestamp_ke():
-    try:
-        tz = ZoneInfo("Africa/Nairobi")
-    except Exception:
-        tz = None
-    now = dt.datetime.now(tz) if tz else dt.datetime.utcnow()
-    return now.strftime("%Y%m%d%H%M%S")
-
-def _stk_password(shortcode, passkey, timestamp):
-    raw = f"{shortcode}{passkey}{timestamp}".encode("utf-8")
-    return base64.b64encode(raw).decode("utf-8")
-
-def _normalize_msisdn(msisdn: str) -> str:
-    return (msisdn or "").strip().replace(" ", "").replace("+", "")
+bp = Blueprint("mpesa", __name__, url_prefix="/mpesa")
 
 # ---------- Testable STK endpoint (optional) ----------
 @bp.post("/stk-push")
@@ -52,72 +22,47 @@ def stk_push():
     phone  = _normalize_msisdn(str(data.get("phone", "")))
     amount = int(data.get("amount", 1) or 1)
 
-    if not (phone.startswith("2547") and len(phone) == 12 and phone.isdigit()):
+    if not valid_msisdn(phone):
         return jsonify({"ok": False, "error": "Use MSISDN like 2547XXXXXXXX"}), 400
 
-    shortcode = (os.getenv("MPESA_SHORTCODE") or "174379").strip()
-    passkey   = (os.getenv("MPESA_PASSKEY") or
-                 "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b37e92f6e314b2c4f7f0d9")
-    cb_url    = os.getenv("MPESA_CALLBACK_URL")
-
+    cb_url = os.getenv("MPESA_CALLBACK_URL")
     if not cb_url or not urlparse(cb_url).scheme.startswith("http"):
         return jsonify({"ok": False, "error": "Set MPESA_CALLBACK_URL (public https)"}), 400
 
-    ts = _timestamp_ke()
-    password = _stk_password(shortcode, passkey, ts)
-    token = _get_access_token()
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-
-    payload = {
-        "BusinessShortCode": int(shortcode),
-        "Password": password,
-        "Timestamp": ts,
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": amount,
-        "PartyA": phone,
-        "PartyB": int(shortcode),
-        "PhoneNumber": phone,
-        "CallBackURL": cb_url,
-        "AccountReference": "AIRBNB-GATE",
-        "TransactionDesc": "SaaS subscription"
-    }
-
-    r = requests.post(f"{_mpesa_base_url()}/mpesa/stkpush/v1/processrequest",
-                      json=payload, headers=headers, timeout=30)
-    text = r.text
     try:
-        data = r.json()
-    except Exception:
-        data = {"_raw": text}
-
-    if r.status_code != 200:
-        return jsonify({"ok": False, "status": r.status_code, "data": data}), 502
+        data = mpesa.stk_push(phone, amount, "AIRBNB-GATE", "SaaS subscription", callback_url=cb_url)
+    except MpesaError as e:
+        return jsonify({"ok": False, "status": e.status, "data": e.data, "error": str(e)}), 502
 
     return jsonify({"ok": True, "resp": data})
 
+
+@bp.get("/metrics")
+def metrics():
+    """Daraja call counts, errors and latency percentiles for this worker (admins only)."""
+    if not (current_user.is_authenticated and current_user.role == ROLE_ADMIN):
+        abort(403)
+    return jsonify({"ok": True, "calls": mpesa.metrics.snapshot()})
+
 # ---------- Callback ----------
 @bp.post("/callback")
 def stk_callback():
     """
-    Safaricom hits this URL with the payment result.
-    Persist to DB, mark invoice/plan as paid, etc.
+    Safaricom hits this URL with the payment result. The payload is stored
+    on its Payment and acknowledged straight away; a worker confirms it with
+    the STK query API before settling.
     """
+    if CALLBACK_TOKEN and not hmac.compare_digest(request.args.get("token", ""), CALLBACK_TOKEN):
+        current_app.logger.warning("[MPESA CALLBACK] bad token from %s", request.remote_addr)
+        abort(403)
     payload = request.get_json(force=True, silent=True) or {}
-    current_app.logger.info("[MPESA CALLBACK] %s", payload)
-
     try:
-        cb = payload["Body"]["stkCallback"]
-        result_code = cb.get("ResultCode")
-        result_desc = cb.get("ResultDesc", "")
-        items = {it["Name"]: it.get("Value") for it in cb.get("CallbackMetadata", {}).get("Item", [])}
-
-        # Example of what you'd do:
-        # - find pending payment by CheckoutRequestID = cb["CheckoutRequestID"]
-        # - if result_code == 0: mark as paid, upgrade plan for that user
-        # - store MpesaReceiptNumber, Amount, PhoneNumber, TransactionDate, etc.
-        current_app.logger.info("[MPESA RESULT] code=%s desc=%s items=%s", result_code, result_desc, items)
-    except Exception as e:
-        current_app.logger.exception("Bad callback payload: %s", e)
+        outcome = payments.record_callback(payload)
+    except Exception:
+        current_app.logger.exception("Storing M-Pesa callback failed")
+        return jsonify({"ResultCode": 1, "ResultDesc": "Retry"}), 500  # Daraja retries non-2xx
+    if outcome == "unknown":
+        current_app.logger.info("[MPESA CALLBACK] unknown reference, matching on phone and amount: %s", payload)
 
     # Daraja expects 200 OK
-    return jsonify({"ok": True})
+    return jsonify({"ResultCode": 0, "ResultDesc": "Accepted"})
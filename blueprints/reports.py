@@ -0,0 +1,89 @@
+# blueprints/reports.py
+from datetime import date, datetime, timedelta
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required, current_user
+
+from models import Checkpoint, Property, ROLE_ADMIN, ROLE_HOST
+from utils.dashboard import owned_property_ids
+from utils.occupancy_report import occupancy_report
+from utils.rollups import gate_load, schedule_catch_up
+
+bp = Blueprint("reports", __name__, url_prefix="/reports")
+
+
+def _can_view():
+    return current_user.is_authenticated and current_user.role in (ROLE_ADMIN, ROLE_HOST)
+
+
+def _checkpoints():
+    q = Checkpoint.query.order_by(Checkpoint.name.asc())
+    if current_user.role == ROLE_HOST:
+        q = q.filter(Checkpoint.property_id.in_(owned_property_ids(current_user.id)))
+    return q.all()
+
+
+# ---------- Gate load ----------
+@bp.get("/gates")
+@login_required
+def gates():
+    """Day-of-week/hour gate load from the hourly rollups (?months=3&checkpoint_id=)."""
+    if not _can_view():
+        flash("Unauthorized", "error")
+        return redirect(url_for("home"))
+
+    months = max(1, min(request.args.get("months", 3, type=int), 24))
+    end = datetime.utcnow()
+    start = end - timedelta(days=30 * months)
+
+    checkpoints = _checkpoints()
+    scope = [c.id for c in checkpoints] if current_user.role == ROLE_HOST else None
+    checkpoint_id = request.args.get("checkpoint_id", type=int)
+    if checkpoint_id and (scope is None or checkpoint_id in scope):
+        scope = [checkpoint_id]
+
+    schedule_catch_up()  # in the background; this view reads whatever is rolled up so far
+    report = gate_load(scope, start, end)
+
+    if request.args.get("format") == "json":
+        return jsonify({"ok": True, "start": start.isoformat(), "end": end.isoformat(), **report})
+    return render_template("reports_gates.html", report=report, checkpoints=checkpoints,
+                           checkpoint_id=checkpoint_id, months=months)
+
+
+# ---------- Occupancy ----------
+def _parse_day(raw, default):
+    try:
+        return datetime.strptime((raw or "").strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return default
+
+
+@bp.get("/occupancy")
+@login_required
+def occupancy():
+    """Nightly occupancy for one property over ?from=&to= (default: this calendar year)."""
+    if not _can_view():
+        flash("Unauthorized", "error")
+        return redirect(url_for("home"))
+
+    props = Property.query.order_by(Property.name.asc())
+    if current_user.role == ROLE_HOST:
+        props = props.filter(Property.owner_id == current_user.id)
+    props = props.all()
+    prop_id = request.args.get("property_id", type=int) or (props[0].id if props else None)
+    if prop_id not in {p.id for p in props}:
+        prop_id = props[0].id if props else None
+
+    today = date.today()
+    start = _parse_day(request.args.get("from"), date(today.year, 1, 1))
+    end = _parse_day(request.args.get("to"), date(today.year + 1, 1, 1))
+    if end <= start or (end - start).days > 3 * 366:
+        end = min(max(end, start + timedelta(days=1)), start + timedelta(days=3 * 366))
+
+    report = occupancy_report(prop_id, start, end) if prop_id else None
+    if request.args.get("format") == "json":
+        return jsonify({"ok": True, "property_id": prop_id, "from": start.isoformat(),
+                        "to": end.isoformat(), **(report or {})})
+    return render_template("reports_occupancy.html", report=report, props=props, prop_id=prop_id,
+                           start=start, end=end)
@@ -0,0 +1,64 @@
+# blueprints/search.py
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort
+from flask_login import login_required, current_user
+
+from models import ROLE_ADMIN, ROLE_HOST
+from utils.search import index as search_index, KINDS
+
+bp = Blueprint("search", __name__, url_prefix="/search")
+
+
+def _scope():
+    """None = everything (admin); hosts see documents tied to their properties or to property-less rooms."""
+    return None if current_user.role == ROLE_ADMIN else {current_user.id}
+
+
+def _url(doc):
+    if doc.kind == "booking":
+        return url_for("bookings.detail", booking_id=doc.id)
+    if doc.kind == "luggage":
+        return url_for("luggage.detail", lug_id=doc.id)
+    booking_id = doc.data.get("booking_id")
+    return url_for("bookings.detail", booking_id=booking_id) if booking_id else None
+
+
+def _kinds(raw):
+    picked = [k for k in (raw or "").split(",") if k in KINDS]
+    return tuple(picked) or KINDS
+
+
+# ---------- Global search ----------
+@bp.get("/")
+@login_required
+def index():
+    """Search page grouped by kind; HTMX gets just the results block."""
+    if current_user.role not in (ROLE_ADMIN, ROLE_HOST):
+        flash("Unauthorized", "error")
+        return redirect(url_for("home"))
+
+    q = (request.args.get("q") or "").strip()
+    groups = {}
+    if q:
+        for kind in _kinds(request.args.get("kind")):
+            groups[kind] = [(d, _url(d)) for d in search_index.search(q, _scope(), kinds=(kind,), limit=20)]
+
+    template = "search_results.html" if request.headers.get("HX-Request") else "search.html"
+    return render_template(template, q=q, groups=groups)
+
+
+# ---------- Typeahead ----------
+@bp.get("/typeahead")
+@login_required
+def typeahead():
+    """?q=&kind=guest,booking,luggage&limit= — JSON, or a suggestion list for HTMX."""
+    if current_user.role not in (ROLE_ADMIN, ROLE_HOST):
+        abort(403)
+
+    q = (request.args.get("q") or "").strip()
+    limit = max(1, min(request.args.get("limit", 8, type=int), 50))
+    # one character matches a large share of everything; wait for a second
+    docs = search_index.search(q, _scope(), kinds=_kinds(request.args.get("kind")), limit=limit) if len(q) >= 2 else []
+
+    if request.headers.get("HX-Request"):
+        return render_template("search_suggest.html", q=q, results=[(d, _url(d)) for d in docs])
+    return jsonify({"ok": True, "q": q, "results": [{**d.as_dict(), "url": _url(d)} for d in docs]})
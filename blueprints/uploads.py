@@ -0,0 +1,80 @@
+# blueprints/uploads.py
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+
+from models import ROLE_ADMIN, ROLE_HOST, ROLE_GUARD
+from utils import resumable
+from utils.resumable import UploadError
+
+bp = Blueprint("uploads", __name__, url_prefix="/upload")
+
+# who may start an upload of each kind (the consuming form re-checks on claim)
+KIND_ROLES = {"luggage": (ROLE_HOST, ROLE_ADMIN), "plate": (ROLE_GUARD,)}
+
+
+def _error(e: UploadError):
+    return jsonify({"ok": False, "error": str(e), **e.extra}), e.status
+
+
+# ---------- Resumable upload protocol ----------
+# POST /upload/                        {kind, filename, size, sha256?} -> {id, chunk_size, received: 0}
+# PUT  /upload/<id>?offset=N           raw chunk body, X-Chunk-Sha256 header -> {received}
+# GET  /upload/<id>                    -> {received} (where to resume after a reconnect)
+# POST /upload/<id>/complete           -> {done: true}; the form then posts the id instead of the file
+@bp.post("/")
+@login_required
+def create():
+    data = request.get_json(silent=True) or request.form
+    kind = data.get("kind")
+    if current_user.role not in KIND_ROLES.get(kind, ()):
+        return jsonify({"ok": False, "error": "Unauthorized"}), 403
+    try:
+        meta = resumable.create_session(current_user.id, data.get("filename"), data.get("size"),
+                                        kind, data.get("sha256"))
+    except UploadError as e:
+        return _error(e)
+    return jsonify({"ok": True, **meta}), 201
+
+
+@bp.get("/<upload_id>")
+@login_required
+def status(upload_id):
+    try:
+        return jsonify({"ok": True, **resumable.status(upload_id, current_user.id)})
+    except UploadError as e:
+        return _error(e)
+
+
+@bp.put("/<upload_id>")
+@login_required
+def chunk(upload_id):
+    offset = request.args.get("offset", type=int)
+    if offset is None:
+        return jsonify({"ok": False, "error": "offset is required."}), 400
+    try:
+        # read from the raw stream so the chunk goes straight to disk, never into a buffered form
+        meta = resumable.write_chunk(upload_id, current_user.id, offset, request.stream,
+                                     request.content_length, request.headers.get("X-Chunk-Sha256"))
+    except UploadError as e:
+        return _error(e)
+    return jsonify({"ok": True, **meta})
+
+
+@bp.post("/<upload_id>/complete")
+@login_required
+def complete(upload_id):
+    try:
+        return jsonify({"ok": True, **resumable.complete(upload_id, current_user.id)})
+    except UploadError as e:
+        return _error(e)
+
+
+@bp.delete("/<upload_id>")
+@login_required
+def cancel(upload_id):
+    try:
+        resumable.load(upload_id, current_user.id)
+    except UploadError as e:
+        return _error(e)
+    resumable.discard(upload_id)
+    return jsonify({"ok": True})
@@ -8,6 +8,8 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     TESSERACT_CMD = os.getenv("TESSERACT_CMD")
     TIMEZONE = os.getenv("TZ", "Africa/Nairobi")
+    # hard cap on any request body; large photos should use the resumable /upload endpoints
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", str(16 * 1024 * 1024)))
 
 
 
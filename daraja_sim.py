@@ -0,0 +1,171 @@
+# daraja_sim.py
+"""
+Local Daraja stand-in for exercising billing without Safaricom.
+
+    python daraja_sim.py --port 8099 --latency 0.3 --fail-rate 0.02 --callback-delay 3
+
+then start the app against it:
+
+    MPESA_BASE_URL=http://127.0.0.1:8099 MPESA_CONSUMER_KEY=x MPESA_CONSUMER_SECRET=x \
+    MPESA_CALLBACK_URL=http://127.0.0.1:5000/mpesa/callback flask run
+
+Implements OAuth, STK push, STK query and fires the result callback to the
+CallBackURL in each push, like Daraja does. GET /_sim/stats returns counters.
+"""
+import argparse
+import base64
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+import requests
+from flask import Flask, request, jsonify
+
+SANDBOX_PASSKEY = "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b37e92f6e314b2c4f7f0d9"
+
+
+def create_sim(latency=0.2, jitter=0.1, fail_rate=0.0, cancel_rate=0.1, callback_delay=2.0,
+               dup_rate=0.0, token_ttl=3599, callback_retries=3, passkey=SANDBOX_PASSKEY):
+    app = Flask("daraja_sim")
+    lock = threading.Lock()
+    tokens: dict[str, float] = {}  # token -> expiry (monotonic)
+    txs: dict[str, dict] = {}      # CheckoutRequestID -> transaction
+    stats = Counter()
+
+    def _sleep():
+        if latency or jitter:
+            time.sleep(max(0.0, random.gauss(latency, jitter)))
+
+    def _authorised() -> bool:
+        token = (request.headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+        with lock:
+            return tokens.get(token, 0) > time.monotonic()
+
+    def _fire_callback(checkout_id: str):
+        with lock:
+            tx = txs[checkout_id]
+            tx["state"] = "done"
+            ok = tx["result_code"] == 0
+        body = {"Body": {"stkCallback": {
+            "MerchantRequestID": tx["merchant_id"],
+            "CheckoutRequestID": checkout_id,
+            "ResultCode": tx["result_code"],
+            "ResultDesc": "The service request is processed successfully." if ok else "Request cancelled by user",
+        }}}
+        if ok:
+            body["Body"]["stkCallback"]["CallbackMetadata"] = {"Item": [
+                {"Name": "Amount", "Value": tx["amount"]},
+                {"Name": "MpesaReceiptNumber", "Value": uuid.uuid4().hex[:10].upper()},
+                {"Name": "TransactionDate", "Value": int(time.strftime("%Y%m%d%H%M%S"))},
+                {"Name": "PhoneNumber", "Value": int(tx["phone"])},
+            ]}
+        copies = 2 if random.random() < dup_rate else 1  # Daraja does resend callbacks
+        for _ in range(copies):
+            for attempt in range(callback_retries):
+                try:
+                    resp = requests.post(tx["callback_url"], json=body, timeout=10)
+                    stats[f"callback_{resp.status_code}"] += 1
+                    if resp.status_code < 300:
+                        break
+                except requests.RequestException:
+                    stats["callback_error"] += 1
+                time.sleep(0.5 * 2 ** attempt)
+
+    @app.get("/oauth/v1/generate")
+    def oauth():
+        stats["oauth"] += 1
+        if not request.authorization or request.args.get("grant_type") != "client_credentials":
+            return jsonify({"errorCode": "400.008.01", "errorMessage": "Invalid Authentication passed"}), 400
+        _sleep()
+        token = uuid.uuid4().hex
+        with lock:
+            tokens[token] = time.monotonic() + token_ttl
+        return jsonify({"access_token": token, "expires_in": str(token_ttl)})
+
+    @app.post("/mpesa/stkpush/v1/processrequest")
+    def stk_push():
+        stats["stk_push"] += 1
+        if not _authorised():
+            stats["stk_push_401"] += 1
+            return jsonify({"errorCode": "404.001.03", "errorMessage": "Invalid Access Token"}), 401
+        data = request.get_json(silent=True) or {}
+        missing = [k for k in ("BusinessShortCode", "Password", "Timestamp", "Amount", "PhoneNumber", "CallBackURL")
+                   if not data.get(k)]
+        if missing:
+            return jsonify({"errorCode": "400.002.02", "errorMessage": f"Bad Request - Invalid {missing[0]}"}), 400
+        expected = base64.b64encode(f"{data['BusinessShortCode']}{passkey}{data['Timestamp']}".encode()).decode()
+        if data["Password"] != expected:
+            return jsonify({"errorCode": "500.001.1001", "errorMessage": "Wrong credentials"}), 500
+        _sleep()
+        if random.random() < fail_rate:
+            stats["stk_push_failed"] += 1
+            return jsonify({"errorCode": "500.003.02", "errorMessage": "System is busy. Please try again in few minutes."}), 503
+
+        checkout_id = f"ws_CO_{time.strftime('%d%m%Y%H%M%S')}{uuid.uuid4().hex[:12]}"
+        merchant_id = uuid.uuid4().hex[:20]
+        with lock:
+            txs[checkout_id] = {
+                "merchant_id": merchant_id, "amount": int(data["Amount"]), "phone": str(data["PhoneNumber"]),
+                "callback_url": data["CallBackURL"], "state": "waiting",
+                "result_code": 1032 if random.random() < cancel_rate else 0,
+            }
+        threading.Timer(max(0.0, random.gauss(callback_delay, callback_delay / 4)), _fire_callback,
+                        args=(checkout_id,)).start()
+        return jsonify({
+            "MerchantRequestID": merchant_id,
+            "CheckoutRequestID": checkout_id,
+            "ResponseCode": "0",
+            "ResponseDescription": "Success. Request accepted for processing",
+            "CustomerMessage": "Success. Request accepted for processing",
+        })
+
+    @app.post("/mpesa/stkpushquery/v1/query")
+    def stk_query():
+        stats["stk_query"] += 1
+        if not _authorised():
+            return jsonify({"errorCode": "404.001.03", "errorMessage": "Invalid Access Token"}), 401
+        checkout_id = (request.get_json(silent=True) or {}).get("CheckoutRequestID")
+        _sleep()
+        with lock:
+            tx = txs.get(checkout_id)
+        if tx is None:
+            return jsonify({"errorCode": "400.002.02", "errorMessage": "Bad Request - Invalid CheckoutRequestID"}), 400
+        if tx["state"] != "done":
+            return jsonify({"errorCode": "500.001.1001", "errorMessage": "The transaction is being processed"}), 500
+        return jsonify({
+            "ResponseCode": "0",
+            "ResponseDescription": "The service request has been accepted successsfully",
+            "MerchantRequestID": tx["merchant_id"],
+            "CheckoutRequestID": checkout_id,
+            "ResultCode": str(tx["result_code"]),
+            "ResultDesc": "The service request is processed successfully." if tx["result_code"] == 0
+            else "Request cancelled by user",
+        })
+
+    @app.get("/_sim/stats")
+    def sim_stats():
+        with lock:
+            states = Counter(tx["state"] for tx in txs.values())
+        return jsonify({"requests": dict(stats), "transactions": dict(states)})
+
+    return app
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--latency", type=float, default=0.2, help="mean seconds per Daraja call")
+    ap.add_argument("--jitter", type=float, default=0.1, help="std-dev of that latency")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="share of STK pushes answered 503")
+    ap.add_argument("--cancel-rate", type=float, default=0.1, help="share of customers who cancel the prompt")
+    ap.add_argument("--callback-delay", type=float, default=2.0, help="mean seconds until the result callback")
+    ap.add_argument("--dup-rate", type=float, default=0.0, help="share of callbacks delivered twice")
+    ap.add_argument("--token-ttl", type=int, default=3599)
+    args = ap.parse_args()
+    sim = create_sim(latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate,
+                     cancel_rate=args.cancel_rate, callback_delay=args.callback_delay,
+                     dup_rate=args.dup_rate, token_ttl=args.token_ttl)
+    sim.run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,119 @@
+# loadtest_billing.py
+"""
+Drive billing checkout end to end against a running app wired to daraja_sim.py.
+
+    python daraja_sim.py --callback-delay 2 &
+    MPESA_BASE_URL=http://127.0.0.1:8099 MPESA_CONSUMER_KEY=x MPESA_CONSUMER_SECRET=x \
+    MPESA_CALLBACK_URL=http://127.0.0.1:5000/mpesa/callback flask run --with-threads &
+    python loadtest_billing.py --users 20 --checkouts 5 --concurrency 20
+
+Each virtual user logs in, posts /billing/checkout and polls the payment's
+status until the callback (or reconciliation) settles it. Reports checkout
+throughput and latency, and how long payments took to settle.
+Load-test users (loadtest+N@example.com) are created in the app's database
+unless --no-seed is given, so run it with the same DATABASE_URI as the app.
+"""
+import argparse
+import json
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PASSWORD = "loadtest123"
+
+
+def seed_users(n: int) -> list[str]:
+    from app import app
+    from models import db, User, ROLE_HOST
+
+    emails = [f"loadtest+{i}@example.com" for i in range(n)]
+    with app.app_context():
+        known = {e for (e,) in db.session.query(User.email).filter(User.email.in_(emails))}
+        for e in emails:
+            if e not in known:
+                u = User(email=e, name=f"Load Test {e.split('+')[1].split('@')[0]}", role=ROLE_HOST)
+                u.set_password(PASSWORD)
+                db.session.add(u)
+        db.session.commit()
+    return emails
+
+
+def pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+
+
+def run_user(args, email: str) -> list[dict]:
+    s = requests.Session()
+    r = s.post(f"{args.app_url}/login", data={"email": email, "password": PASSWORD}, allow_redirects=False)
+    if r.status_code != 302:
+        return [{"error": f"login {r.status_code}"}]
+    out = []
+    for _ in range(args.checkouts):
+        t0 = time.perf_counter()
+        r = s.post(f"{args.app_url}/billing/checkout", data={"plan": args.plan, "phone": args.phone},
+                   allow_redirects=False)
+        checkout_s = time.perf_counter() - t0
+        loc = r.headers.get("Location", "")
+        if r.status_code != 302 or "/billing/payments/" not in loc:
+            out.append({"checkout_s": checkout_s, "status": f"checkout {r.status_code}"})
+            continue
+        status_url = requests.compat.urljoin(args.app_url + "/", loc) + "/status"
+        status, deadline = "pending", time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            j = s.get(status_url).json()
+            status = j["status"]
+            if j["done"]:
+                break
+            time.sleep(args.poll)
+        out.append({"checkout_s": checkout_s, "settle_s": time.perf_counter() - t0, "status": status})
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load-test billing checkout and the M-Pesa callback pipeline.")
+    ap.add_argument("--app-url", default="http://127.0.0.1:5000")
+    ap.add_argument("--sim-url", default="http://127.0.0.1:8099")
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--checkouts", type=int, default=5, help="checkouts per user, run back to back")
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--plan", default="premium")
+    ap.add_argument("--phone", default="254708374149")
+    ap.add_argument("--poll", type=float, default=0.5, help="seconds between status polls")
+    ap.add_argument("--timeout", type=float, default=120, help="give up waiting on one payment after this")
+    ap.add_argument("--no-seed", action="store_true", help="users already exist")
+    args = ap.parse_args()
+    args.app_url = args.app_url.rstrip("/")
+
+    emails = [f"loadtest+{i}@example.com" for i in range(args.users)] if args.no_seed else seed_users(args.users)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as ex:
+        results = [r for batch in ex.map(lambda e: run_user(args, e), emails) for r in batch]
+    wall = time.perf_counter() - t0
+
+    checkout = [r["checkout_s"] for r in results if "checkout_s" in r]
+    settled = [r["settle_s"] for r in results if r.get("status") in ("success", "failed")]
+    report = {
+        "checkouts": len(checkout),
+        "wall_s": round(wall, 2),
+        "checkouts_per_s": round(len(checkout) / wall, 1) if wall else None,
+        "checkout_ms": {"p50": pct(checkout, 0.5), "p95": pct(checkout, 0.95), "max": pct(checkout, 1.0),
+                        "mean": round(statistics.mean(checkout) * 1000, 1) if checkout else None},
+        "settle_ms": {"p50": pct(settled, 0.5), "p95": pct(settled, 0.95), "max": pct(settled, 1.0)},
+        "outcomes": dict(Counter(r.get("status") or r.get("error") for r in results)),
+    }
+    try:
+        report["simulator"] = requests.get(f"{args.sim_url}/_sim/stats", timeout=5).json()
+    except requests.RequestException:
+        pass
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
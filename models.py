@@ -4,6 +4,9 @@ from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from enum import Enum
 from sqlalchemy import text
+from sqlalchemy.orm import validates
+
+from utils.plates import normalize_plate
 
 
 db = SQLAlchemy()
@@ -11,6 +14,10 @@ db = SQLAlchemy()
 ROLE_ADMIN = "admin"
 ROLE_HOST = "host"
 ROLE_GUARD = "guard"
+
+# Luggage statuses: a bag is on site until it exits; blocked bags may not leave
+LUGGAGE_EXITABLE = ("pending", "cleared")
+LUGGAGE_ON_SITE = LUGGAGE_EXITABLE + ("blocked",)
 class Plan(str, Enum):
     BASIC = "basic"
     PREMIUM = "premium"
@@ -18,7 +25,7 @@ class Plan(str, Enum):
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), unique=True, nullable=False)
-    name = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), nullable=False, index=True)
     role = db.Column(db.String(20), nullable=False, default=ROLE_HOST)
     password_hash = db.Column(db.String(255), nullable=False)
     plan = db.Column(
@@ -46,15 +53,24 @@ class Payment(db.Model):
     amount = db.Column(db.Integer, nullable=False)       # KES in cents or integer shillings
     currency = db.Column(db.String(5), nullable=False, default="KES")
     provider = db.Column(db.String(20), nullable=False, default="mpesa")
-    reference = db.Column(db.String(64), nullable=True)  # CheckoutRequestID
-    status = db.Column(db.String(20), nullable=False, default="initiated")  # initiated|success|failed
+    reference = db.Column(db.String(64), nullable=True, unique=True)  # CheckoutRequestID
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending|initiated|success|failed
+    plan = db.Column(db.String(20), nullable=True)        # plan being paid for
+    phone = db.Column(db.String(20), nullable=True)       # MSISDN the STK prompt goes to
+    result_desc = db.Column(db.String(255), nullable=True)  # Daraja's last word on it
     raw_callback = db.Column(db.Text, nullable=True)      # store full JSON
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)    
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # reconciliation sweep: payments stuck in one status, oldest first
+        db.Index("ix_payment_status_updated", "status", "updated_at"),
+    )
 
 class Property(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     owner_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    name = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), nullable=False, index=True)
     address = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     owner = db.relationship("User")
@@ -62,7 +78,7 @@ class Property(db.Model):
 class Room(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     property_id = db.Column(db.Integer, db.ForeignKey("property.id"), nullable=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     desc = db.Column(db.Text)
     property = db.relationship("Property")
 
@@ -82,19 +98,32 @@ class Booking(db.Model):
     check_out = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(30), default="booked")  # booked|checked_in|checked_out|cancelled
     guests_count = db.Column(db.Integer, default=1)
+    inside_count = db.Column(db.Integer, nullable=False, default=0, server_default=text("0"))  # group entry counter
     owns_vehicle = db.Column(db.Boolean, default=False)
     vehicle_plate = db.Column(db.String(50))
+    plate_key = db.Column(db.String(20))  # normalize_plate(vehicle_plate), for gate lookups
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     guest = db.relationship("Guest")
     room = db.relationship("Room")
     qr_token = db.Column(db.String(64), unique=True)   # NEW
-    qr_path  = db.Column(db.String(255))
+    qr_path  = db.Column(db.String(255), index=True)  # looked up when serving the QR image
+
+    __table_args__ = (
+        # plate gate: equality on the folded plate, range on check_out
+        db.Index("ix_booking_plate_key_check_out", "plate_key", "check_out"),
+    )
+
+    @validates("vehicle_plate")
+    def _sync_plate_key(self, key, value):
+        self.plate_key = normalize_plate(value)
+        return value
 
 class Checkpoint(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     property_id = db.Column(db.Integer, db.ForeignKey("property.id"), nullable=False)
+    direction_mode = db.Column(db.String(5), nullable=False, default="both", server_default=text("'both'"))  # both|in|out
     property = db.relationship("Property")
 
 class AccessLog(db.Model):
@@ -106,6 +135,9 @@ class AccessLog(db.Model):
     booking_id = db.Column(db.Integer, db.ForeignKey("booking.id"))
     national_id_number = db.Column(db.String(100))  # from OCR or manual
     decision = db.Column(db.String(20))            # allow|deny
+    direction = db.Column(db.String(3))            # in|out
+    flag = db.Column(db.String(30))                # e.g. passback
+    latency_ms = db.Column(db.Integer)             # request start -> decision logged
     image_path = db.Column(db.String(255))
     ocr_text = db.Column(db.Text)
 
@@ -114,6 +146,36 @@ class AccessLog(db.Model):
     guest = db.relationship("Guest")
     booking = db.relationship("Booking")
 
+    # keyset pagination on (timestamp, id), optionally narrowed by one equality filter
+    __table_args__ = (
+        db.Index("ix_access_log_ts_id", "timestamp", "id"),
+        db.Index("ix_access_log_checkpoint_ts_id", "checkpoint_id", "timestamp", "id"),
+        db.Index("ix_access_log_guard_ts_id", "guard_id", "timestamp", "id"),
+        db.Index("ix_access_log_decision_ts_id", "decision", "timestamp", "id"),
+    )
+
+
+class AccessRollup(db.Model):
+    """Per checkpoint, per hour gate traffic, recomputed from AccessLog (utils/rollups.py)."""
+    checkpoint_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 = no checkpoint
+    hour = db.Column(db.DateTime, primary_key=True)                              # UTC, truncated
+    allow_count = db.Column(db.Integer, nullable=False, default=0)
+    deny_count = db.Column(db.Integer, nullable=False, default=0)
+    unique_guests = db.Column(db.Integer, nullable=False, default=0)
+    p50_ms = db.Column(db.Integer)
+    p95_ms = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index("ix_access_rollup_hour", "hour"),)
+
+
+class PassbackState(db.Model):
+    """Last gate direction per credential for anti-passback (utils/passback.py)."""
+    credential = db.Column(db.String(120), primary_key=True)  # e.g. nid:12345678
+    state = db.Column(db.String(3), nullable=False)           # in|out
+    checkpoint_id = db.Column(db.Integer, db.ForeignKey("checkpoint.id"), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 
 class Luggage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -122,9 +184,9 @@ class Luggage(db.Model):
     host_id    = db.Column(db.Integer, db.ForeignKey("user.id"))            # nullable for guest-owned
     label = db.Column(db.String(255), nullable=False)
     size = db.Column(db.String(50), default="medium")
-    photo_path = db.Column(db.String(255))
+    photo_path = db.Column(db.String(255), index=True)  # looked up when serving the photo
     qr_token = db.Column(db.String(100), unique=True, nullable=False, index=True)
-    status = db.Column(db.String(20), default="pending")  # pending|exited|blocked
+    status = db.Column(db.String(20), default="pending")  # pending|cleared|blocked|exited
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # optional relationships
@@ -138,4 +200,44 @@ class LuggageScanLog(db.Model):
     checkpoint_id = db.Column(db.Integer, db.ForeignKey("checkpoint.id"), nullable=True)
     luggage_id = db.Column(db.Integer, db.ForeignKey("luggage.id"))
     decision = db.Column(db.String(20))  # allow|deny
-    note = db.Column(db.String(255))  
+    note = db.Column(db.String(255))
+
+    __table_args__ = (
+        db.Index("ix_luggage_scan_log_ts_id", "created_at", "id"),
+        db.Index("ix_luggage_scan_log_checkpoint_ts_id", "checkpoint_id", "created_at", "id"),
+        db.Index("ix_luggage_scan_log_guard_ts_id", "guard_id", "created_at", "id"),
+        db.Index("ix_luggage_scan_log_decision_ts_id", "decision", "created_at", "id"),
+    )
+
+
+class LuggageStatusLog(db.Model):
+    """A host/admin status change (clear|block|unblock|exit); guard scans stay in LuggageScanLog."""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    luggage_id = db.Column(db.Integer, db.ForeignKey("luggage.id"), nullable=False)
+    actor_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    action = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # resulting Luggage.status
+
+    __table_args__ = (db.Index("ix_luggage_status_log_luggage_id", "luggage_id", "id"),)
+
+
+class StoredFile(db.Model):
+    """Metadata for a content-addressed upload (utils/storage.py); one row per distinct file per bucket."""
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.String(30), nullable=False)        # bookings|luggage
+    sha256 = db.Column(db.String(64), nullable=False)
+    path = db.Column(db.String(255), nullable=False)         # relative to uploads/<bucket>/
+    size = db.Column(db.Integer, nullable=False)
+    content_type = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint("bucket", "sha256", name="uq_stored_file_bucket_sha256"),
+    )
+
+
+class SchemaStep(db.Model):
+    """One-off data upgrades already applied to this database (utils/schema.py)."""
+    name = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -51,3 +51,14 @@ def extract_id_text(img_path: str) -> Tuple[str, Optional[str]]:
         pass
 
     return raw, found
+
+
+def extract_plate_text(img_path: str) -> Tuple[str, Optional[str]]:
+    """OCR a plate crop: single text line, alphanumerics only. Returns (raw, plate)."""
+    from utils.plates import pick_plate
+
+    raw = pytesseract.image_to_string(
+        Image.open(img_path),
+        config="--oem 3 --psm 7 -l eng -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789",
+    )
+    return raw, pick_plate(raw)
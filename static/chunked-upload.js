@@ -0,0 +1,169 @@
+// static/chunked-upload.js
+// Resumable uploads for <input type="file" data-chunked-upload="<kind>" data-upload-field="<name>">.
+// The file is sent to /upload/ in checksummed chunks as soon as it is picked; a dropped
+// connection resumes from the server's offset (also across page reloads, via localStorage).
+// When done, the input loses its name and a hidden <name>=<upload id> field is posted instead.
+// Forms whose own submit handler calls preventDefault() must `await ChunkedUpload.settle(form)`.
+(function () {
+  const BASE = "/upload/";
+  const MAX_TRIES = 6;
+  const pending = new Map(); // input -> Promise
+
+  const supported = !!(window.crypto && crypto.subtle && window.fetch && Blob.prototype.arrayBuffer);
+
+  function sleep(ms) { return new Promise((r) => setTimeout(r, ms)); }
+
+  async function sha256(buf) {
+    const digest = await crypto.subtle.digest("SHA-256", buf);
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+  }
+
+  async function call(url, opts) {
+    const resp = await fetch(url, Object.assign({ credentials: "same-origin" }, opts));
+    let json = {};
+    try { json = await resp.json(); } catch (_) { /* proxy error page */ }
+    return { status: resp.status, json };
+  }
+
+  function resumeKey(file, kind) {
+    return `upload:${kind}:${file.name}:${file.size}:${file.lastModified}`;
+  }
+
+  async function openSession(file, kind) {
+    const key = resumeKey(file, kind);
+    const saved = localStorage.getItem(key);
+    if (saved) {
+      const r = await call(BASE + encodeURIComponent(saved));
+      if (r.status === 200) return r.json;
+      localStorage.removeItem(key);
+    }
+    const r = await call(BASE, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ kind, filename: file.name, size: file.size }),
+    });
+    if (r.status !== 201) throw new Error(r.json.error || `upload refused (${r.status})`);
+    localStorage.setItem(key, r.json.id);
+    return r.json;
+  }
+
+  async function upload(file, { kind, onProgress } = {}) {
+    let meta = await openSession(file, kind);
+    const url = BASE + encodeURIComponent(meta.id);
+    let offset = meta.received;
+    let tries = 0;
+
+    while (!meta.done && offset < file.size) {
+      onProgress && onProgress(offset / file.size);
+      const buf = await file.slice(offset, offset + meta.chunk_size).arrayBuffer();
+      let r;
+      try {
+        r = await call(`${url}?offset=${offset}`, {
+          method: "PUT",
+          headers: { "Content-Type": "application/octet-stream", "X-Chunk-Sha256": await sha256(buf) },
+          body: buf,
+        });
+      } catch (_) {
+        r = { status: 0, json: {} }; // offline / connection reset
+      }
+      if (r.status === 200) {
+        offset = r.json.received;
+        tries = 0;
+        continue;
+      }
+      if (r.status === 409 && typeof r.json.received === "number") {
+        offset = r.json.received; // server already has more (or less) than we thought
+        meta.done = r.json.done;
+        continue;
+      }
+      if (r.status && r.status < 500 && r.status !== 422 && r.status !== 429) {
+        localStorage.removeItem(resumeKey(file, kind));
+        throw new Error(r.json.error || `upload failed (${r.status})`);
+      }
+      if (++tries > MAX_TRIES) throw new Error("Upload keeps failing; check the connection.");
+      await sleep(Math.min(1000 * 2 ** (tries - 1), 15000));
+      if (r.status === 0) {
+        const s = await call(url).catch(() => null); // resync after a reconnect
+        if (s && s.status === 200) offset = s.json.received;
+      }
+    }
+
+    const done = await call(`${url}/complete`, { method: "POST" });
+    localStorage.removeItem(resumeKey(file, kind));
+    if (done.status !== 200) throw new Error(done.json.error || "upload could not be finalised");
+    onProgress && onProgress(1);
+    return meta.id;
+  }
+
+  function statusEl(input) {
+    let el = input.parentElement.querySelector("[data-upload-status]");
+    if (!el) {
+      el = document.createElement("p");
+      el.dataset.uploadStatus = "";
+      el.className = "text-xs text-slate-500 mt-1";
+      input.insertAdjacentElement("afterend", el);
+    }
+    return el;
+  }
+
+  function hiddenEl(input) {
+    const name = input.dataset.uploadField;
+    let el = input.form.querySelector(`input[type=hidden][name="${name}"]`);
+    if (!el) {
+      el = document.createElement("input");
+      el.type = "hidden";
+      el.name = name;
+      input.form.appendChild(el);
+    }
+    return el;
+  }
+
+  function reset(input) {
+    pending.delete(input);
+    if (input.dataset.fileName) input.name = input.dataset.fileName;
+    hiddenEl(input).value = "";
+    statusEl(input).textContent = "";
+  }
+
+  function start(input) {
+    reset(input);
+    const file = input.files && input.files[0];
+    if (!file) return;
+    const status = statusEl(input);
+    const job = upload(file, {
+      kind: input.dataset.chunkedUpload,
+      onProgress: (p) => { status.textContent = `Uploading… ${Math.round(p * 100)}%`; },
+    }).then((id) => {
+      hiddenEl(input).value = id;
+      input.dataset.fileName = input.name;
+      input.removeAttribute("name"); // the form posts the upload id, not the bytes
+      status.textContent = "Uploaded ✓";
+    }, (err) => {
+      status.textContent = `${err.message} The photo will be sent with the form instead.`;
+    }).finally(() => pending.delete(input));
+    pending.set(input, job);
+  }
+
+  function settle(form) {
+    return Promise.all([...pending].filter(([input]) => input.form === form).map(([, job]) => job));
+  }
+
+  window.ChunkedUpload = { upload, settle, reset, supported };
+  if (!supported) return; // plain multipart keeps working (subject to MAX_CONTENT_LENGTH)
+
+  document.querySelectorAll("input[type=file][data-chunked-upload]").forEach((input) => {
+    input.addEventListener("change", () => start(input));
+    if (input.form.dataset.chunkedBound) return;
+    input.form.dataset.chunkedBound = "1";
+    input.form.addEventListener("submit", async (e) => {
+      if (e.defaultPrevented) return; // the page's own handler is in charge (and awaits settle)
+      const form = e.currentTarget;
+      if (![...pending.keys()].some((i) => i.form === form)) return;
+      e.preventDefault();
+      const btns = form.querySelectorAll("button[type=submit], button:not([type])");
+      btns.forEach((b) => { b.disabled = true; });
+      await settle(form);
+      form.submit();
+    });
+  });
+})();
@@ -0,0 +1,49 @@
+// static/live-events.js
+// Opens the SSE stream named by [data-live-stream], re-dispatches every event
+// as a DOM "live:<kind>" / "live:any" event and keeps a short feed in #liveFeed.
+(function () {
+  const root = document.querySelector("[data-live-stream]");
+  if (!root || !window.EventSource) return;
+
+  const feed = document.getElementById("liveFeed");
+  const src = new EventSource(root.dataset.liveStream);
+
+  function describe(ev) {
+    const d = ev.data || {};
+    if (ev.kind === "booking") {
+      return d.count ? `${d.count} bookings added` : `Booking #${d.booking_id} ${d.action || ""} · ${d.guest || ""} · ${d.room || ""}`;
+    }
+    if (ev.kind === "scan") {
+      const who = d.guest_name || "Unknown";
+      return `${(d.decision || "").toUpperCase()} ${d.direction === "out" ? "exit" : "entry"} · ${who}${d.property ? " · " + d.property : ""}${d.flag ? " · " + d.flag : ""}`;
+    }
+    if (ev.kind === "luggage") {
+      if (d.count && !d.luggage_id) return `${d.count} bags → ${d.status || d.action}`;
+      return `Luggage #${d.luggage_id} ${d.label || ""} → ${d.status || d.action}`;
+    }
+    return ev.kind;
+  }
+
+  function addLine(ev) {
+    if (!feed) return;
+    const empty = feed.querySelector("[data-empty]");
+    if (empty) empty.remove();
+    const li = document.createElement("li");
+    li.className = "flex items-center justify-between gap-2 py-1.5 border-b border-slate-100 text-sm";
+    const time = new Date((ev.ts || Date.now() / 1000) * 1000).toLocaleTimeString();
+    li.innerHTML = `<span></span><span class="text-xs text-slate-400 shrink-0">${time}</span>`;
+    li.firstChild.textContent = describe(ev);
+    feed.prepend(li);
+    while (feed.children.length > 20) feed.lastChild.remove();
+  }
+
+  ["booking", "luggage", "scan"].forEach(function (kind) {
+    src.addEventListener(kind, function (e) {
+      let ev;
+      try { ev = JSON.parse(e.data); } catch (_) { return; }
+      addLine(ev);
+      document.dispatchEvent(new CustomEvent("live:" + kind, { detail: ev }));
+      document.dispatchEvent(new CustomEvent("live:any", { detail: ev }));
+    });
+  });
+})();
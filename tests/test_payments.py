@@ -0,0 +1,124 @@
+# tests/test_payments.py
+import copy
+import json
+import secrets
+from datetime import datetime, timedelta
+
+import requests
+
+from conftest import wait_for
+from models import db, Payment, Subscription, User, ROLE_HOST
+from utils import payments
+from utils.mpesa import client as mpesa
+
+PHONE = "254708374149"
+
+
+def _host() -> User:
+    u = User(email=f"host-{secrets.token_hex(4)}@example.com", name="Test Host", role=ROLE_HOST)
+    u.set_password("secret")
+    db.session.add(u)
+    db.session.commit()
+    return u
+
+
+def _payment(user: User, amount: int, status=payments.PENDING, reference=None) -> int:
+    p = Payment(user_id=user.id, amount=amount, plan="BASIC", phone=PHONE, status=status, reference=reference)
+    db.session.add(p)
+    db.session.commit()
+    return p.id
+
+
+def _fresh(payment_id: int) -> Payment:
+    """Re-read a payment other threads are updating (and end the read so sqlite isn't held)."""
+    db.session.rollback()
+    p = db.session.get(Payment, payment_id, populate_existing=True)
+    db.session.expunge(p)
+    db.session.rollback()
+    return p
+
+
+def _sim_stats(server) -> dict:
+    return requests.get(f"{server.url}/_sim/stats", timeout=5).json()
+
+
+def _active_subscriptions(user_id: int) -> list[Subscription]:
+    db.session.rollback()
+    return Subscription.query.filter_by(user_id=user_id, status="active").all()
+
+
+def test_duplicate_callbacks_activate_once(ctx, sim):
+    server = sim(dup_rate=1.0)  # Daraja delivers every callback twice
+    user = _host()
+    pid = _payment(user, amount=3)
+
+    payments.send_stk(pid)
+    assert _fresh(pid).status == payments.INITIATED
+    wait_for(lambda: _active_subscriptions(user.id))
+    wait_for(lambda: _sim_stats(server)["requests"].get("callback_200", 0) >= 2)
+
+    p = _fresh(pid)
+    assert p.status == payments.SUCCESS
+    subs = _active_subscriptions(user.id)
+    assert len(subs) == 1
+    assert subs[0].expires_at - subs[0].started_at == timedelta(days=payments.SUBSCRIPTION_DAYS)
+    assert db.session.get(User, user.id, populate_existing=True).plan == "BASIC"
+
+    # a late or forged copy of a settled payment changes nothing
+    stored = p.raw_callback
+    forged = copy.deepcopy(json.loads(stored))
+    forged["Body"]["stkCallback"]["CallbackMetadata"]["Item"][1]["Value"] = "FORGED0001"
+    assert payments.record_callback(forged) == "duplicate"
+    assert _fresh(pid).raw_callback == stored
+
+
+def test_retry_keeps_first_callback(ctx, sim):
+    sim()  # the queued checks ask it about a CheckoutRequestID it never issued, and settle nothing
+    user = _host()
+    ref = f"ws_CO_test{secrets.token_hex(6)}"
+    pid = _payment(user, amount=4, status=payments.INITIATED, reference=ref)
+    first = {"Body": {"stkCallback": {"CheckoutRequestID": ref, "ResultCode": 0, "ResultDesc": "ok",
+                                      "CallbackMetadata": {"Item": [{"Name": "Amount", "Value": 4}]}}}}
+    second = copy.deepcopy(first)
+    second["Body"]["stkCallback"]["CallbackMetadata"]["Item"][0]["Value"] = 4000
+
+    assert payments.record_callback(first) == "queued"
+    payments.record_callback(second)  # may queue another check, but must not replace the stored body
+    assert json.loads(_fresh(pid).raw_callback) == first
+    wait_for(lambda: not payments._callbacks.get(ref))
+    assert _fresh(pid).status == payments.INITIATED
+
+
+def test_timed_out_push_is_adopted_from_its_callback(ctx, sim):
+    sim()
+    user = _host()
+    # send_stk timed out: the prompt may have gone out, but we never learned its CheckoutRequestID
+    pid = _payment(user, amount=5, status=payments.INITIATED)
+    resp = mpesa.stk_push(PHONE, 5, "BASIC-plan", "BASIC subscription")
+
+    wait_for(lambda: _active_subscriptions(user.id))
+    p = _fresh(pid)
+    assert p.status == payments.SUCCESS
+    assert p.reference == resp["CheckoutRequestID"]
+    assert json.loads(p.raw_callback)["Body"]["stkCallback"]["CheckoutRequestID"] == p.reference
+    assert len(_active_subscriptions(user.id)) == 1
+
+
+def test_reconcile_settles_payment_whose_callback_was_lost(ctx, sim):
+    server = sim(callback_path="/mpesa/not-here", callback_delay=0.5)  # every callback 404s
+    user = _host()
+    pid = _payment(user, amount=6)
+    payments.send_stk(pid)
+    assert _fresh(pid).status == payments.INITIATED
+
+    # customer still on the PIN prompt: Daraja answers "being processed", nothing is settled
+    later = lambda: datetime.utcnow() + timedelta(seconds=payments.RECONCILE_AFTER + 1)  # noqa: E731
+    payments.reconcile(now=later())
+    assert _fresh(pid).status == payments.INITIATED
+
+    wait_for(lambda: _sim_stats(server)["transactions"].get("done"))
+    counts = payments.reconcile(now=later())
+    assert counts[payments.SUCCESS] >= 1
+    assert _fresh(pid).status == payments.SUCCESS
+    assert len(_active_subscriptions(user.id)) == 1
+    assert _fresh(pid).raw_callback is None  # settled from the STK query alone
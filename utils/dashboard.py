@@ -0,0 +1,93 @@
+# utils/dashboard.py
+import os
+from datetime import datetime, time as dt_time
+
+from sqlalchemy import and_, case, func, or_, select
+
+from models import db, Booking, Room, Property, Luggage, ROLE_HOST, LUGGAGE_EXITABLE
+from utils.cache import TTLCache
+from utils.write_hooks import on_write
+
+# (role, owner_id) -> {"active_stays": .., "todays_checkins": .., "luggage_pending": ..}
+_counts = TTLCache(ttl=float(os.getenv("DASHBOARD_CACHE_TTL", "5")), maxsize=4096)
+# owner_id -> [property ids]
+_owned = TTLCache(ttl=300, maxsize=4096)
+
+
+@on_write(Booking, Luggage)
+def _invalidate_counts(model, ids):
+    _counts.clear()
+
+
+@on_write(Property, Room)
+def _invalidate_scope(model, ids):
+    _owned.clear()
+    _counts.clear()
+
+
+def owned_property_ids(owner_id) -> list[int]:
+    ids = _owned.get(owner_id)
+    if ids is None:
+        ids = [pid for (pid,) in db.session.query(Property.id).filter(Property.owner_id == owner_id)]
+        _owned.set(owner_id, ids)
+    return ids
+
+
+def dashboard_counts(user, now_naive: datetime) -> dict:
+    """
+    Booking/luggage tiles for the dashboard in one aggregated query,
+    cached for a few seconds per scope (admin = everything, host = own rooms).
+    """
+    owner_id = user.id if user.role == ROLE_HOST else None
+    key = (user.role, owner_id)
+    hit = _counts.get(key)
+    if hit is not None:
+        return hit
+
+    day_start = datetime.combine(now_naive.date(), dt_time.min)
+    day_end = datetime.combine(now_naive.date(), dt_time.max)
+
+    is_active = and_(Booking.check_in <= now_naive, Booking.check_out >= now_naive)
+    is_today = and_(Booking.check_in >= day_start, Booking.check_in <= day_end)
+
+    bookings = (
+        select(
+            func.coalesce(func.sum(case((is_active, 1), else_=0)), 0).label("active_stays"),
+            func.coalesce(func.sum(case((is_today, 1), else_=0)), 0).label("todays_checkins"),
+        )
+        .select_from(Booking)
+        # rows that can match either tile: started by end of today and not yet over, or starting today
+        .where(
+            Booking.status != "cancelled",
+            Booking.check_in <= day_end,
+            or_(Booking.check_out >= now_naive, Booking.check_in >= day_start),
+        )
+    )
+    luggage = select(func.count(Luggage.id)).where(Luggage.status.in_(LUGGAGE_EXITABLE))  # pre-cleared still waits
+
+    if owner_id is not None:
+        scope = or_(Property.owner_id == owner_id, Room.property_id.is_(None))
+        bookings = (
+            bookings.join(Room, Room.id == Booking.room_id)
+                    .outerjoin(Property, Property.id == Room.property_id)
+                    .where(scope)
+        )
+        luggage = (
+            luggage.join(Booking, Booking.id == Luggage.booking_id)
+                   .join(Room, Room.id == Booking.room_id)
+                   .outerjoin(Property, Property.id == Room.property_id)
+                   .where(scope)
+        )
+
+    # luggage rides along as a scalar subquery -> a single round trip
+    row = db.session.execute(
+        bookings.add_columns(luggage.correlate(None).scalar_subquery().label("luggage_pending"))
+    ).one()
+
+    counts = {
+        "active_stays": int(row.active_stays or 0),
+        "todays_checkins": int(row.todays_checkins or 0),
+        "luggage_pending": int(row.luggage_pending or 0),
+    }
+    _counts.set(key, counts)
+    return counts
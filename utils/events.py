@@ -0,0 +1,174 @@
+# utils/events.py
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from flask import current_app
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+# Longest a single SSE response stays open; the browser's EventSource then
+# reconnects on its own (after the `retry:` delay sent just before closing).
+SSE_MAX_AGE = float(os.getenv("SSE_MAX_AGE", "300"))
+REDIS_EVENTS_CHANNEL = os.getenv("REDIS_EVENTS_CHANNEL", "gate-events")
+
+
+class Subscription:
+    def __init__(self, channels, maxsize=256):
+        self.channels = set(channels)
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    """Pub/sub behind the SSE stream; only reaches subscribers in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: dict[str, set[Subscription]] = {}
+
+    def publish(self, channels, event):
+        with self._lock:
+            targets = set()
+            for ch in channels:
+                targets |= self._subs.get(ch, set())
+        for sub in targets:
+            try:
+                sub.queue.put_nowait(event)
+            except queue.Full:
+                pass  # slow consumer: drop rather than block the writer
+
+    def subscribe(self, channels):
+        sub = Subscription(channels)
+        with self._lock:
+            for ch in sub.channels:
+                self._subs.setdefault(ch, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for ch in sub.channels:
+                subs = self._subs.get(ch)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[ch]
+
+
+class RedisBroker(LocalBroker):
+    """
+    EVENT_BROKER=redis (needs the `redis` package and REDIS_URL): publishes go
+    through one Redis pub/sub channel, and a listener thread per process hands
+    them to that process's own subscribers, so every worker's streams see every event.
+    """
+
+    def __init__(self):
+        super().__init__()
+        if redis is None:
+            raise RuntimeError("EVENT_BROKER=redis needs the redis package (pip install redis)")
+        self._redis = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, channels, event):
+        try:
+            self._redis.publish(REDIS_EVENTS_CHANNEL,
+                                json.dumps({"channels": list(channels), "event": event}, default=str))
+        except redis.RedisError as e:
+            current_app.logger.warning("Publishing live event failed: %s", e)  # events are best effort
+
+    def subscribe(self, channels):
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, args=(current_app.logger,),
+                                                  name="events-redis", daemon=True)
+                self._listener.start()
+        return super().subscribe(channels)
+
+    def _listen(self, logger):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(REDIS_EVENTS_CHANNEL)
+                for msg in pubsub.listen():
+                    try:
+                        body = json.loads(msg["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    super().publish(body["channels"], body["event"])
+            except redis.RedisError as e:
+                logger.warning("Live event listener lost Redis, reconnecting: %s", e)
+                time.sleep(1)
+
+
+_BROKERS = {"local": LocalBroker, "redis": RedisBroker}
+_broker = None
+
+
+def broker() -> LocalBroker:
+    global _broker
+    if _broker is None:
+        kind = (os.getenv("EVENT_BROKER") or "local").strip().lower()
+        _broker = _BROKERS.get(kind, LocalBroker)()
+    return _broker
+
+
+# ---------- Channels ----------
+CH_ALL = "all"
+
+
+def host_channel(host_id):
+    return f"host:{host_id}"
+
+
+def property_channel(property_id):
+    return f"property:{property_id}"
+
+
+def checkpoint_channel(checkpoint_id):
+    return f"checkpoint:{checkpoint_id}"
+
+
+def publish_event(kind: str, data: dict, *, host_id=None, property_id=None, checkpoint_id=None):
+    """Fan an event out to the admin/guard firehose plus any host/property/checkpoint scope."""
+    channels = [CH_ALL]
+    if host_id:
+        channels.append(host_channel(host_id))
+    if property_id:
+        channels.append(property_channel(property_id))
+    if checkpoint_id:
+        channels.append(checkpoint_channel(checkpoint_id))
+    broker().publish(channels, {"kind": kind, "data": data, "ts": time.time()})
+
+
+def sse_stream(channels, heartbeat: float = 15.0, max_age: float = SSE_MAX_AGE):
+    """
+    Generator of text/event-stream frames for the given channels. Ends after
+    about `max_age` seconds so a stream can't hold a worker thread forever;
+    EventSource reconnects by itself, so clients only see a short gap.
+    """
+    b = broker()
+    sub = b.subscribe(channels)
+    deadline = time.monotonic() + max_age * random.uniform(0.9, 1.0)  # spread out reconnects
+    try:
+        yield "retry: 5000\n\n"
+        while (left := deadline - time.monotonic()) > 0:
+            event = sub.get(timeout=min(heartbeat, left))
+            if event is None:
+                yield ": ping\n\n"  # keeps proxies from closing idle streams
+                continue
+            yield f"event: {event['kind']}\ndata: {json.dumps(event, default=str)}\n\n"
+        yield "retry: 500\n\n"  # planned close: come back quickly
+    finally:
+        b.unsubscribe(sub)
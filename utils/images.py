@@ -0,0 +1,206 @@
+# utils/images.py
+import hashlib
+import io
+import os
+import re
+import shutil
+import threading
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps
+
+from utils import storage
+
+# variant -> longest edge in px
+VARIANTS = {"thumb": 240, "display": 1280}
+# ext -> (Pillow format, save options); WebP first, JPEG for old browsers/email
+FORMATS = {
+    "webp": ("WEBP", {"quality": 72, "method": 4}),
+    "jpg": ("JPEG", {"quality": 80, "optimize": True, "progressive": True}),
+}
+MAX_PIXELS = 60_000_000  # refuse decompression bombs well before Pillow's own limit
+
+
+class ImageTooLarge(ValueError):
+    """The upload decodes to more than MAX_PIXELS."""
+
+_HASHED = re.compile(r"(?:^|/)(?P<key>[0-9a-f]{32})_(?P<variant>thumb|display)\.(?P<ext>webp|jpg)$")
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def luggage_dir() -> str:
+    return storage.bucket_dir("luggage")
+
+
+def _incoming(key: str) -> str:
+    return os.path.join(luggage_dir(), "incoming", key)
+
+
+def _check_size(probe: Image.Image):
+    """Header dimensions only, so a decompression bomb is refused before anything decodes it."""
+    if probe.width * probe.height > MAX_PIXELS:
+        raise ImageTooLarge(f"image too large: {probe.width}x{probe.height}")
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def variant_relpath(key: str, variant: str, ext: str) -> str:
+    return f"{key[:2]}/{key}_{variant}.{ext}"
+
+
+def photo_url(photo_path, variant="display", ext="jpg"):
+    """
+    URL of one variant for a stored photo_path. Content-hashed paths
+    ('/uploads/luggage/ab/<key>_display.jpg') map to their siblings; legacy
+    raw uploads only have themselves.
+    """
+    if not photo_path:
+        return None
+    path = photo_path.replace("\\", "/")
+    m = _HASHED.search(path)
+    if not m:
+        return path
+    return url_for("luggage.luggage_uploads", fname=variant_relpath(m["key"], variant, ext))
+
+
+def is_hashed(fname: str) -> bool:
+    return bool(_HASHED.search(fname))
+
+
+def row_photo_path(fname: str) -> str:
+    """The photo_path saved on the Luggage row for any served file (all variants map to the display jpg)."""
+    m = _HASHED.search(fname)
+    return "/uploads/luggage/" + (variant_relpath(m["key"], "display", "jpg") if m else fname)
+
+
+# ---------- pipeline ----------
+def store_upload(data: bytes) -> str:
+    """
+    Park the raw bytes under their content hash and return the display path
+    to save on the row. Variants are rendered later by render_variants();
+    identical re-uploads are a no-op.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            probe.verify()  # header/structure only; cheap enough to do in the request
+    except Exception as e:
+        raise ValueError("not an image") from e
+    _check_size(probe)
+    sha = hashlib.sha256(data).hexdigest()
+    key = sha[:32]
+    if not os.path.exists(os.path.join(luggage_dir(), variant_relpath(key, "display", "jpg"))):
+        path = _incoming(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+    return _register(sha, len(data))
+
+
+def store_upload_file(path: str) -> tuple[str, str]:
+    """
+    store_upload() for a file already on disk (a finished resumable upload):
+    hashed in 1 MB reads and moved into place rather than loaded into memory.
+    Returns (photo_path, key); `path` is consumed either way.
+    """
+    try:
+        with Image.open(path) as probe:
+            probe.verify()
+        _check_size(probe)
+    except ImageTooLarge:
+        os.remove(path)
+        raise
+    except Exception as e:
+        os.remove(path)
+        raise ValueError("not an image") from e
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for buf in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(buf)
+    sha, size = digest.hexdigest(), os.path.getsize(path)
+    key = sha[:32]
+    dest = _incoming(key)
+    if os.path.exists(os.path.join(luggage_dir(), variant_relpath(key, "display", "jpg"))) or os.path.exists(dest):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.move(path, dest)
+    return _register(sha, size), key
+
+
+def _register(sha: str, size: int) -> str:
+    """StoredFile row for the upload (keyed by its full hash); returns the display path for the row."""
+    rel = variant_relpath(sha[:32], "display", "jpg")
+    storage.register("luggage", [storage.Blob(sha, rel, size)], "image/jpeg")
+    return "/uploads/luggage/" + rel
+
+
+def _key_lock(key: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _load(path: str) -> Image.Image:
+    with Image.open(path) as src:
+        if src.width * src.height > MAX_PIXELS:
+            raise ValueError(f"image too large: {src.width}x{src.height}")
+        # JPEG: let libjpeg decode at a reduced scale when the source is far larger than we need
+        largest = max(VARIANTS.values())
+        src.draft("RGB", (largest, largest))
+        img = ImageOps.exif_transpose(src)  # apply the orientation tag; EXIF itself is never written back
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        flat = Image.new("RGB", img.size, (255, 255, 255))
+        flat.paste(img, mask=img.getchannel("A"))
+        return flat
+    return img.convert("RGB")
+
+
+def render_variants(key: str) -> bool:
+    """
+    Decode the parked upload once, write every variant/format (no metadata is
+    copied, so EXIF/GPS never reach the output) and drop the raw file.
+    Returns False when there is nothing to render. Safe to call twice.
+    An upload that can't be decoded is set aside as incoming/<key>.failed,
+    so later calls (ensure_variant on every view) don't decode it again.
+    """
+    root = luggage_dir()
+    with _key_lock(key):
+        src = _incoming(key)
+        if not os.path.exists(src):
+            return os.path.exists(os.path.join(root, variant_relpath(key, "display", "jpg")))
+        try:
+            img = _load(src)
+        except Exception:
+            os.replace(src, f"{src}.failed")
+            raise
+        os.makedirs(os.path.join(root, key[:2]), exist_ok=True)
+        # largest first, so each step resizes from the previous (smaller) image
+        for variant, edge in sorted(VARIANTS.items(), key=lambda v: -v[1]):
+            img.thumbnail((edge, edge), Image.LANCZOS)
+            for ext, (fmt, opts) in FORMATS.items():
+                out = os.path.join(root, variant_relpath(key, variant, ext))
+                tmp = f"{out}.tmp"
+                img.save(tmp, fmt, **opts)
+                os.replace(tmp, out)
+        os.remove(src)
+    with _locks_guard:
+        _locks.pop(key, None)
+    return True
+
+
+def ensure_variant(fname: str) -> bool:
+    """Serve-time fallback: render a hashed photo whose background job hasn't run yet."""
+    m = _HASHED.search(fname)
+    if not m:
+        return False
+    try:
+        return render_variants(m["key"])
+    except (OSError, ValueError, Image.DecompressionBombError):
+        current_app.logger.exception("Rendering luggage photo %s failed", m["key"])
+        return False
@@ -0,0 +1,101 @@
+# utils/listing.py
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _encode(value, row_id, before=False) -> str:
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    raw = json.dumps([value, row_id, int(before)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor):
+    """(sort value, id, before?) or None for a missing/garbled cursor."""
+    if not cursor:
+        return None
+    try:
+        value, row_id, before = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["dt"])
+        return value, int(row_id), bool(before)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class ListPage:
+    def __init__(self, rows, sort, direction, next_cursor, prev_cursor, q):
+        self.rows = rows
+        self.sort = sort
+        self.direction = direction
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.q = q
+
+
+class Listing:
+    """
+    Keyset-paginated, sortable, prefix-searchable list over a projection query
+    (which must include the id column labelled "id").
+    `sorts` maps a URL key to a non-null column; rows are ordered by (column, id)
+    so every page is an index seek however deep you go. Search is a LIKE 'term%'
+    on `search_cols`, which stays index-friendly (no leading wildcard).
+    """
+
+    def __init__(self, id_col, sorts: dict, default_sort: str, search_cols=(), default_dir="asc"):
+        self.id_col = id_col
+        self.sorts = sorts
+        self.default_sort = default_sort
+        self.default_dir = default_dir
+        self.search_cols = search_cols
+
+    def page(self, query, args) -> ListPage:
+        sort = args.get("sort") if args.get("sort") in self.sorts else self.default_sort
+        direction = args.get("dir") if args.get("dir") in ("asc", "desc") else self.default_dir
+        try:
+            limit = max(1, min(int(args.get("limit") or PAGE_SIZE), MAX_PAGE_SIZE))
+        except ValueError:
+            limit = PAGE_SIZE
+        col = self.sorts[sort]
+        query = query.add_columns(col.label("sort_key"))
+
+        term = (args.get("q") or "").strip()
+        if term and self.search_cols:
+            pattern = escape_like(term) + "%"
+            query = query.filter(or_(*[c.like(pattern, escape="\\") for c in self.search_cols]))
+
+        cursor = _decode(args.get("cursor"))
+        before = bool(cursor and cursor[2])
+        # walking backwards = the same seek with the order flipped, then reversed
+        forward = (direction == "asc") != before
+        if cursor:
+            value, row_id, _ = cursor
+            if forward:
+                query = query.filter(or_(col > value, and_(col == value, self.id_col > row_id)))
+            else:
+                query = query.filter(or_(col < value, and_(col == value, self.id_col < row_id)))
+        order = (col.asc(), self.id_col.asc()) if forward else (col.desc(), self.id_col.desc())
+        rows = query.order_by(*order).limit(limit + 1).all()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if before:
+            rows.reverse()
+
+        next_cursor = prev_cursor = None
+        if rows:
+            if more or before:
+                next_cursor = _encode(rows[-1].sort_key, rows[-1].id)
+            if cursor and (more or not before):
+                prev_cursor = _encode(rows[0].sort_key, rows[0].id, before=True)
+        return ListPage(rows, sort, direction, next_cursor, prev_cursor, term)
@@ -0,0 +1,209 @@
+# utils/logs.py
+import base64
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import aliased
+
+from models import db, AccessLog, LuggageScanLog, Checkpoint, User, Guest, Luggage
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_BATCH = 1000
+
+
+class LogSource:
+    """
+    One browsable log table: its model, the (timestamp, id) keyset columns
+    and a flat projection for the explorer and exports.
+    """
+
+    def __init__(self, key, model, ts_col, columns, joins):
+        self.key = key
+        self.model = model
+        self.ts = ts_col
+        self.columns = columns  # [(name, column expression)]
+        self.joins = joins      # [(target, onclause)] — all outer joins
+
+    @property
+    def field_names(self):
+        return [name for name, _ in self.columns]
+
+    def query(self, filters):
+        q = db.session.query(*[col.label(name) for name, col in self.columns])
+        for target, on in self.joins:
+            q = q.outerjoin(target, on)
+        return q.filter(*self.criteria(filters))
+
+    def criteria(self, f):
+        m = self.model
+        out = []
+        if f.get("checkpoint_ids") is not None:
+            out.append(m.checkpoint_id.in_(f["checkpoint_ids"]))
+        if f.get("checkpoint_id"):
+            out.append(m.checkpoint_id == f["checkpoint_id"])
+        if f.get("guard_id"):
+            out.append(m.guard_id == f["guard_id"])
+        if f.get("decision"):
+            out.append(m.decision == f["decision"])
+        if f.get("date_from"):
+            out.append(self.ts >= f["date_from"])
+        if f.get("date_to"):
+            out.append(self.ts < f["date_to"])
+        return out
+
+
+_Guard = aliased(User)
+_CP = aliased(Checkpoint)
+
+SOURCES = {
+    "access": LogSource(
+        "access", AccessLog, AccessLog.timestamp,
+        [
+            ("id", AccessLog.id),
+            ("timestamp", AccessLog.timestamp),
+            ("checkpoint", _CP.name),
+            ("guard", _Guard.name),
+            ("decision", AccessLog.decision),
+            ("direction", AccessLog.direction),
+            ("flag", AccessLog.flag),
+            ("national_id", AccessLog.national_id_number),
+            ("guest", Guest.full_name),
+            ("booking_id", AccessLog.booking_id),
+        ],
+        [
+            (_CP, _CP.id == AccessLog.checkpoint_id),
+            (_Guard, _Guard.id == AccessLog.guard_id),
+            (Guest, Guest.id == AccessLog.guest_id),
+        ],
+    ),
+    "luggage": LogSource(
+        "luggage", LuggageScanLog, LuggageScanLog.created_at,
+        [
+            ("id", LuggageScanLog.id),
+            ("timestamp", LuggageScanLog.created_at),
+            ("checkpoint", _CP.name),
+            ("guard", _Guard.name),
+            ("decision", LuggageScanLog.decision),
+            ("luggage_id", LuggageScanLog.luggage_id),
+            ("label", Luggage.label),
+            ("note", LuggageScanLog.note),
+        ],
+        [
+            (_CP, _CP.id == LuggageScanLog.checkpoint_id),
+            (_Guard, _Guard.id == LuggageScanLog.guard_id),
+            (Luggage, Luggage.id == LuggageScanLog.luggage_id),
+        ],
+    ),
+}
+
+
+# ---------- request parsing ----------
+def _int(raw):
+    try:
+        return int(raw) or None
+    except (TypeError, ValueError):
+        return None
+
+
+def _date(raw):
+    try:
+        return datetime.strptime((raw or "").strip(), "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def parse_filters(args) -> dict:
+    """Explorer filters from a query string; date_to is inclusive of that day."""
+    date_to = _date(args.get("to"))
+    decision = (args.get("decision") or "").strip().lower()
+    return {
+        "checkpoint_id": _int(args.get("checkpoint_id")),
+        "guard_id": _int(args.get("guard_id")),
+        "decision": decision if decision in ("allow", "deny") else None,
+        "date_from": _date(args.get("from")),
+        "date_to": date_to + timedelta(days=1) if date_to else None,
+    }
+
+
+# ---------- keyset cursor ----------
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) or None for a missing/garbled cursor (which just means page one)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def page(source: LogSource, filters, cursor=None, limit=PAGE_SIZE):
+    """
+    Newest-first page after `cursor`. Seeks on (ts, id) instead of OFFSET, so
+    page 1000 costs the same as page 1 with the (…, ts, id) indexes.
+    Returns (rows, next_cursor or None).
+    """
+    limit = max(1, min(int(limit or PAGE_SIZE), MAX_PAGE_SIZE))
+    q = source.query(filters)
+    after = decode_cursor(cursor)
+    if after:
+        ts, row_id = after
+        q = q.filter(or_(source.ts < ts, and_(source.ts == ts, source.model.id < row_id)))
+    rows = q.order_by(source.ts.desc(), source.model.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return rows, next_cursor
+
+
+# ---------- streaming export ----------
+def _stream(source: LogSource, filters):
+    """Rows oldest-first from a server-side cursor, EXPORT_BATCH at a time."""
+    q = (
+        source.query(filters)
+        .order_by(source.ts.asc(), source.model.id.asc())
+        .execution_options(stream_results=True, yield_per=EXPORT_BATCH)
+    )
+    yield from q
+
+
+def _cell(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def export_csv(source: LogSource, filters):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(source.field_names)
+    n = 0
+    for row in _stream(source, filters):
+        writer.writerow([_cell(v) for v in row])
+        n += 1
+        if n % 200 == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def export_jsonl(source: LogSource, filters):
+    names = source.field_names
+    chunk = []
+    for row in _stream(source, filters):
+        chunk.append(json.dumps(dict(zip(names, map(_cell, row))), separators=(",", ":")))
+        if len(chunk) == 200:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
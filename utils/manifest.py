@@ -0,0 +1,278 @@
+# utils/manifest.py
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime, time as dt_time
+
+import pytz
+
+from config import Config
+from models import db, Booking, Guest, Room, Property, Checkpoint, Luggage, LUGGAGE_ON_SITE
+from utils.cache import TTLCache
+from utils.write_hooks import on_write
+
+OPEN_LUGGAGE = LUGGAGE_ON_SITE  # cleared bags still need their exit scan
+_versions = itertools.count(1)  # process-wide, so a rebuilt manifest never reuses an ETag
+
+
+def local_now() -> datetime:
+    """Naive local time, matching how booking times are stored."""
+    return datetime.now(pytz.timezone(Config.TIMEZONE)).replace(tzinfo=None)
+
+
+class GateManifest:
+    """
+    Everything a gate at one property needs for one day: bookings that touch
+    the day (arrivals, departures, in-stay), their plates, and open luggage.
+    Indexed by QR token and national ID so scans resolve without joins.
+    """
+
+    def __init__(self, property_id, day):
+        self.property_id = property_id
+        self.day = day
+        self.day_start = datetime.combine(day, dt_time.min)
+        self.day_end = datetime.combine(day, dt_time.max)
+        self.built_at = time.monotonic()
+        self.version = next(_versions)
+        self.bookings: dict[int, dict] = {}
+        self.luggage: dict[int, dict] = {}
+        self._by_token: dict[str, int] = {}
+        self._by_nid: dict[str, set[int]] = {}
+        self._by_plate: dict[str, set[int]] = {}
+        self._payload = None
+
+    # ----- membership -----
+    def covers(self, row) -> bool:
+        return (row["property_id"] == self.property_id
+                and row["status"] != "cancelled"
+                and row["check_in"] <= self.day_end
+                and row["check_out"] >= self.day_start)
+
+    def put_booking(self, row):
+        self.drop_booking(row["booking_id"])
+        if not self.covers(row):
+            return
+        self.bookings[row["booking_id"]] = row
+        if row.get("qr_token"):
+            self._by_token[row["qr_token"]] = row["booking_id"]
+        if row.get("national_id"):
+            self._by_nid.setdefault(row["national_id"], set()).add(row["booking_id"])
+        if row["owns_vehicle"] and row["plate_key"]:
+            self._by_plate.setdefault(row["plate_key"], set()).add(row["booking_id"])
+        self._touch()
+
+    def drop_booking(self, booking_id):
+        row = self.bookings.pop(booking_id, None)
+        if not row:
+            return
+        self._by_token.pop(row.get("qr_token"), None)
+        for index, key in ((self._by_nid, row.get("national_id")), (self._by_plate, row.get("plate_key"))):
+            ids = index.get(key)
+            if ids:
+                ids.discard(booking_id)
+                if not ids:
+                    del index[key]
+        for lug_id in [lid for lid, l in self.luggage.items() if l["booking_id"] == booking_id]:
+            del self.luggage[lug_id]
+        self._touch()
+
+    def put_luggage(self, row):
+        self.luggage.pop(row["luggage_id"], None)
+        if row["status"] in OPEN_LUGGAGE and row["booking_id"] in self.bookings:
+            self.luggage[row["luggage_id"]] = row
+        self._touch()
+
+    def _touch(self):
+        self.version = next(_versions)
+        self._payload = None
+
+    # ----- lookups -----
+    def by_token(self, token):
+        bid = self._by_token.get(token)
+        return self.bookings.get(bid) if bid else None
+
+    def active_for_nid(self, national_id, at):
+        """Latest-ending booking for this ID that is active at `at` (same rule as the ID scan)."""
+        return self._active(self._by_nid.get(national_id, ()), at)
+
+    def active_for_plate(self, plate_key, at):
+        return self._active(self._by_plate.get(plate_key, ()), at)
+
+    def _active(self, booking_ids, at):
+        rows = [self.bookings[b] for b in booking_ids]
+        rows = [r for r in rows if r["check_in"] <= at <= r["check_out"]]
+        return max(rows, key=lambda r: r["check_out"]) if rows else None
+
+    # ----- payload -----
+    def payload(self) -> str:
+        """Compact JSON for guard stations, serialized once per version."""
+        if self._payload is None:
+            def brief(r):
+                return {
+                    "booking_id": r["booking_id"], "guest": r["guest_name"],
+                    "national_id": r["national_id"], "room": r["room"],
+                    "check_in": r["check_in"].isoformat(), "check_out": r["check_out"].isoformat(),
+                    "guests": r["guests_count"], "plate": r["vehicle_plate"],
+                }
+            rows = sorted(self.bookings.values(), key=lambda r: r["check_in"])
+            self._payload = json.dumps({
+                "property_id": self.property_id,
+                "day": self.day.isoformat(),
+                "version": self.version,
+                "arrivals": [brief(r) for r in rows if r["check_in"] >= self.day_start],
+                "departures": [brief(r) for r in rows if r["check_out"] <= self.day_end],
+                "in_stay": [brief(r) for r in rows
+                            if r["check_in"] < self.day_start and r["check_out"] > self.day_end],
+                "vehicles": sorted({r["vehicle_plate"] for r in rows if r["owns_vehicle"] and r["vehicle_plate"]}),
+                "luggage": [
+                    {"luggage_id": l["luggage_id"], "label": l["label"], "status": l["status"],
+                     "booking_id": l["booking_id"]}
+                    for l in self.luggage.values()
+                ],
+            }, separators=(",", ":"))
+        return self._payload
+
+
+# ---------- queries ----------
+def booking_rows(*criteria):
+    """Flat booking + guest + room + property rows, the shape manifest entries use."""
+    q = (
+        db.session.query(
+            Booking.id, Booking.qr_token, Booking.status, Booking.check_in, Booking.check_out,
+            Booking.guests_count, Booking.owns_vehicle, Booking.vehicle_plate, Booking.plate_key,
+            Guest.id, Guest.full_name, Guest.national_id_number,
+            Room.name, Room.property_id, Property.name, Property.owner_id,
+        )
+        .join(Guest, Guest.id == Booking.guest_id)
+        .join(Room, Room.id == Booking.room_id)
+        .outerjoin(Property, Property.id == Room.property_id)  # rooms may have no property
+        .filter(*criteria)
+    )
+    keys = ("booking_id", "qr_token", "status", "check_in", "check_out", "guests_count",
+            "owns_vehicle", "vehicle_plate", "plate_key", "guest_id", "guest_name", "national_id",
+            "room", "property_id", "property", "owner_id")
+    return [dict(zip(keys, r)) for r in q]
+
+
+def _luggage_rows(*criteria):
+    q = db.session.query(
+        Luggage.id, Luggage.booking_id, Luggage.label, Luggage.status, Luggage.qr_token
+    ).filter(*criteria)
+    return [dict(zip(("luggage_id", "booking_id", "label", "status", "qr_token"), r)) for r in q]
+
+
+def _build(property_id, day) -> GateManifest:
+    m = GateManifest(property_id, day)
+    for row in booking_rows(
+        Room.property_id == property_id,
+        Booking.status != "cancelled",
+        Booking.check_in <= m.day_end,
+        Booking.check_out >= m.day_start,
+    ):
+        m.put_booking(row)
+    if m.bookings:
+        for row in _luggage_rows(Luggage.booking_id.in_(list(m.bookings)), Luggage.status.in_(OPEN_LUGGAGE)):
+            m.put_luggage(row)
+    return m
+
+
+# ---------- store ----------
+class ManifestStore:
+    """
+    Per-process cache of manifests keyed by (property_id, day). A manifest is
+    built on first use each day; booking/luggage commits only queue ids, which
+    are applied as patches on the next read. Bulk writes (unknown ids) and
+    MANIFEST_MAX_AGE force a rebuild, bounding staleness from other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._manifests: dict[tuple, GateManifest] = {}
+        self._dirty_bookings: set[int] = set()
+        self._dirty_luggage: set[int] = set()
+        self._checkpoint_property = TTLCache(ttl=None, maxsize=10000)
+        self.max_age = float(os.getenv("MANIFEST_MAX_AGE", "300"))
+
+    def mark(self, model, ids):
+        with self._lock:
+            if model is Checkpoint:
+                self._checkpoint_property.clear()
+            elif ids is None:
+                self._manifests.clear()
+                self._dirty_bookings.clear()
+                self._dirty_luggage.clear()
+            elif model is Booking:
+                self._dirty_bookings |= ids
+            elif model is Luggage:
+                self._dirty_luggage |= ids
+
+    def property_for_checkpoint(self, checkpoint_id):
+        pid = self._checkpoint_property.get(checkpoint_id)
+        if pid is None:
+            pid = db.session.query(Checkpoint.property_id).filter(Checkpoint.id == checkpoint_id).scalar()
+            if pid is not None:
+                self._checkpoint_property.set(checkpoint_id, pid)
+        return pid
+
+    def for_checkpoint(self, checkpoint_id, day=None):
+        if not checkpoint_id:
+            return None
+        pid = self.property_for_checkpoint(checkpoint_id)
+        return self.for_property(pid, day) if pid else None
+
+    def for_property(self, property_id, day=None):
+        day = day or local_now().date()
+        with self._lock:
+            # drop other days' manifests once the day rolls over
+            for key in [k for k in self._manifests if k[1] != day]:
+                del self._manifests[key]
+            self._apply_dirty()
+            m = self._manifests.get((property_id, day))
+            if m is None or time.monotonic() - m.built_at > self.max_age:
+                m = _build(property_id, day)
+                self._manifests[(property_id, day)] = m
+            return m
+
+    def _apply_dirty(self):
+        if not (self._dirty_bookings or self._dirty_luggage) or not self._manifests:
+            self._dirty_bookings.clear()
+            self._dirty_luggage.clear()
+            return
+        if self._dirty_bookings:
+            ids = list(self._dirty_bookings)
+            rows = {r["booking_id"]: r for r in booking_rows(Booking.id.in_(ids))}
+            bags: dict[int, list] = {}  # one luggage query for the whole batch, grouped per booking
+            if rows:
+                for lug in _luggage_rows(Luggage.booking_id.in_(list(rows)), Luggage.status.in_(OPEN_LUGGAGE)):
+                    bags.setdefault(lug["booking_id"], []).append(lug)
+            for m in self._manifests.values():
+                for bid in ids:
+                    if bid in rows:
+                        m.put_booking(rows[bid])
+                        if bid in m.bookings:
+                            for lug in bags.get(bid, ()):
+                                m.put_luggage(lug)
+                    else:
+                        m.drop_booking(bid)  # deleted, or moved to a property-less room
+        if self._dirty_luggage:
+            ids = list(self._dirty_luggage)
+            rows = {r["luggage_id"]: r for r in _luggage_rows(Luggage.id.in_(ids))}
+            for m in self._manifests.values():
+                for lid in ids:
+                    if lid in rows:
+                        m.put_luggage(rows[lid])
+                    elif lid in m.luggage:
+                        del m.luggage[lid]
+                        m._touch()
+        self._dirty_bookings.clear()
+        self._dirty_luggage.clear()
+
+
+manifests = ManifestStore()
+
+
+@on_write(Booking, Luggage, Checkpoint)
+def _queue_patch(model, ids):
+    manifests.mark(model, ids)
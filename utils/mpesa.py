@@ -0,0 +1,257 @@
+# utils/mpesa.py
+import base64
+import datetime as dt
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlencode
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.retry import Retry
+
+# Point MPESA_BASE_URL at a local Daraja stand-in for tests; otherwise MPESA_ENV picks sandbox/live.
+MPESA_TIMEOUT = (float(os.getenv("MPESA_CONNECT_TIMEOUT", "5")), float(os.getenv("MPESA_READ_TIMEOUT", "30")))
+MPESA_RETRIES = int(os.getenv("MPESA_RETRIES", "3"))
+MPESA_POOL_SIZE = int(os.getenv("MPESA_POOL_SIZE", "10"))
+TOKEN_SKEW = float(os.getenv("MPESA_TOKEN_SKEW", "60"))  # refresh this many seconds before expiry
+# Shared secret appended to CallBackURL as ?token=; /mpesa/callback refuses requests without it
+CALLBACK_TOKEN = os.getenv("MPESA_CALLBACK_TOKEN", "")
+
+SANDBOX_SHORTCODE = "174379"
+# Public sandbox LNMO passkey for 174379 (from Daraja docs)
+SANDBOX_PASSKEY = "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b37e92f6e314b2c4f7f0d9"
+
+
+class MpesaError(RuntimeError):
+    """
+    A Daraja call failed; `status` is the HTTP status (None for network errors), `data` the parsed body.
+    `uncertain` means the request may still have reached Daraja (timeout, dropped connection).
+    """
+
+    def __init__(self, message, status=None, data=None, uncertain=False):
+        super().__init__(message)
+        self.status = status
+        self.data = data
+        self.uncertain = uncertain
+
+
+# ---------- helpers ----------
+def base_url() -> str:
+    override = os.getenv("MPESA_BASE_URL")
+    if override:
+        return override.rstrip("/")
+    env = (os.getenv("MPESA_ENV") or "sandbox").strip().lower()
+    return "https://api.safaricom.co.ke" if env == "live" else "https://sandbox.safaricom.co.ke"
+
+
+def timestamp_ke() -> str:
+    """YYYYMMDDHHMMSS in Africa/Nairobi, as Daraja expects."""
+    try:
+        tz = ZoneInfo("Africa/Nairobi")
+    except Exception:
+        tz = None
+    now = dt.datetime.now(tz) if tz else dt.datetime.utcnow()
+    return now.strftime("%Y%m%d%H%M%S")
+
+
+def stk_password(shortcode: str, passkey: str, timestamp: str) -> str:
+    raw = f"{shortcode}{passkey}{timestamp}".encode("utf-8")
+    return base64.b64encode(raw).decode("utf-8")
+
+
+def normalize_msisdn(msisdn: str) -> str:
+    return (msisdn or "").strip().replace(" ", "").replace("+", "")
+
+
+def valid_msisdn(msisdn: str) -> bool:
+    return msisdn.startswith("2547") and len(msisdn) == 12 and msisdn.isdigit()
+
+
+def _never_sent(exc: requests.RequestException) -> bool:
+    """True only when the connection itself failed, i.e. Daraja cannot have seen the request."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(exc, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+# ---------- metrics ----------
+class _Metrics:
+    """Per-operation call counts, errors and recent latencies (ms)."""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._ops: dict[str, dict] = {}
+        self._window = window
+
+    def record(self, op: str, ms: float, ok: bool, status=None):
+        with self._lock:
+            m = self._ops.setdefault(op, {"calls": 0, "errors": 0, "last_status": None,
+                                          "recent": deque(maxlen=self._window)})
+            m["calls"] += 1
+            m["errors"] += 0 if ok else 1
+            m["last_status"] = status
+            m["recent"].append(ms)
+
+    def snapshot(self) -> dict:
+        out = {}
+        with self._lock:
+            for op, m in self._ops.items():
+                lat = sorted(m["recent"])
+                pick = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))], 1) if lat else None
+                out[op] = {"calls": m["calls"], "errors": m["errors"], "last_status": m["last_status"],
+                           "p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": round(lat[-1], 1) if lat else None}
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._ops.clear()
+
+
+# ---------- client ----------
+class MpesaClient:
+    """
+    Daraja client shared by the whole process: one keep-alive Session
+    (connection pool + bounded retries), an OAuth token cached until shortly
+    before `expires_in`, and timing metrics per operation.
+    Only connection failures are retried for POSTs, so an STK push can't
+    reach the customer's phone twice because of a retry.
+    """
+
+    def __init__(self):
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = threading.Lock()
+        self.metrics = _Metrics()
+
+    # --- plumbing ---
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    retry = Retry(
+                        total=MPESA_RETRIES, connect=MPESA_RETRIES, read=MPESA_RETRIES, status=MPESA_RETRIES,
+                        backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=frozenset({"GET"}),  # read/status retries only for idempotent calls
+                        raise_on_status=False, respect_retry_after_header=True,
+                    )
+                    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=MPESA_POOL_SIZE, max_retries=retry)
+                    s = requests.Session()
+                    s.mount("https://", adapter)
+                    s.mount("http://", adapter)
+                    self._session = s
+        return self._session
+
+    def _call(self, op: str, method: str, path: str, **kw) -> requests.Response:
+        start = time.perf_counter()
+        try:
+            resp = self.session().request(method, f"{base_url()}{path}", timeout=MPESA_TIMEOUT, **kw)
+        except requests.RequestException as e:
+            self.metrics.record(op, (time.perf_counter() - start) * 1000, False)
+            raise MpesaError(f"Daraja {op} failed: {e}", uncertain=not _never_sent(e)) from e
+        self.metrics.record(op, (time.perf_counter() - start) * 1000, resp.status_code < 400, resp.status_code)
+        return resp
+
+    @staticmethod
+    def _json(resp) -> dict:
+        try:
+            return resp.json()
+        except ValueError:
+            return {"_raw": resp.text}
+
+    # --- OAuth ---
+    def access_token(self) -> str:
+        """Cached token; at most one refresh in flight however many threads ask."""
+        if self._token and time.monotonic() < self._token_expires:
+            return self._token
+        with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires:
+                return self._token  # another thread refreshed while we waited
+            key = os.getenv("MPESA_CONSUMER_KEY")
+            sec = os.getenv("MPESA_CONSUMER_SECRET")
+            if not key or not sec:
+                raise MpesaError("Missing MPESA_CONSUMER_KEY / MPESA_CONSUMER_SECRET")
+            resp = self._call("oauth", "GET", "/oauth/v1/generate", params={"grant_type": "client_credentials"},
+                              auth=(key, sec))
+            data = self._json(resp)
+            if resp.status_code != 200 or not data.get("access_token"):
+                raise MpesaError(f"Daraja OAuth HTTP {resp.status_code}: {data}", resp.status_code, data)
+            try:
+                ttl = float(data.get("expires_in") or 3599)
+            except (TypeError, ValueError):
+                ttl = 3599.0
+            self._token = data["access_token"]
+            self._token_expires = time.monotonic() + max(0.0, ttl - TOKEN_SKEW)
+            return self._token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._token_expires = 0.0
+
+    def post(self, op: str, path: str, payload: dict) -> dict:
+        """Authorised JSON POST; a 401 (token revoked early) refreshes the token and retries once."""
+        for attempt in (1, 2):
+            try:
+                token = self.access_token()
+            except MpesaError as e:
+                e.uncertain = False  # nothing was posted yet
+                raise
+            resp = self._call(op, "POST", path, json=payload, headers={"Authorization": f"Bearer {token}"})
+            if resp.status_code == 401 and attempt == 1:
+                self.invalidate_token()
+                continue
+            data = self._json(resp)
+            if resp.status_code != 200:
+                raise MpesaError(f"Daraja HTTP {resp.status_code}: {data}", resp.status_code, data)
+            return data
+
+    # --- API calls ---
+    def stk_push(self, phone: str, amount: int, account_ref: str, trans_desc: str, callback_url=None) -> dict:
+        """Lipa Na M-Pesa Online (STK push). Returns Daraja JSON or raises MpesaError."""
+        shortcode = (os.getenv("MPESA_SHORTCODE") or SANDBOX_SHORTCODE).strip()
+        passkey = os.getenv("MPESA_PASSKEY") or SANDBOX_PASSKEY
+        callback_url = callback_url or os.getenv("MPESA_CALLBACK_URL")
+        if not passkey or not callback_url:
+            raise MpesaError("Missing MPESA_PASSKEY / MPESA_CALLBACK_URL")
+        if CALLBACK_TOKEN:
+            callback_url += ("&" if "?" in callback_url else "?") + urlencode({"token": CALLBACK_TOKEN})
+        phone = normalize_msisdn(phone)
+        if not valid_msisdn(phone):
+            raise MpesaError("Phone must be 2547XXXXXXXX")
+
+        timestamp = timestamp_ke()
+        return self.post("stk_push", "/mpesa/stkpush/v1/processrequest", {
+            "BusinessShortCode": int(shortcode),
+            "Password": stk_password(shortcode, passkey, timestamp),
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": int(amount),
+            "PartyA": phone,             # customer MSISDN
+            "PartyB": int(shortcode),    # your paybill/till
+            "PhoneNumber": phone,        # MSISDN to receive the STK prompt
+            "CallBackURL": callback_url, # must be public HTTPS in sandbox
+            "AccountReference": (account_ref or "AIRBNB-GATE")[:12],
+            "TransactionDesc": (trans_desc or "Subscription")[:20],
+        })
+
+    def stk_query(self, checkout_request_id: str) -> dict:
+        """Status of an STK push by CheckoutRequestID."""
+        shortcode = (os.getenv("MPESA_SHORTCODE") or SANDBOX_SHORTCODE).strip()
+        passkey = os.getenv("MPESA_PASSKEY") or SANDBOX_PASSKEY
+        timestamp = timestamp_ke()
+        return self.post("stk_query", "/mpesa/stkpushquery/v1/query", {
+            "BusinessShortCode": int(shortcode),
+            "Password": stk_password(shortcode, passkey, timestamp),
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id,
+        })
+
+
+client = MpesaClient()
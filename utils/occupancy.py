@@ -0,0 +1,81 @@
+# utils/occupancy.py
+import os
+import threading
+from datetime import datetime, timedelta
+
+
+class OccupancyCounters:
+    """
+    Process-local "who is inside" counters, per property and per booking.
+    Updated on every allowed gate scan and rebuilt from AccessLog at startup,
+    so reads are O(1) dict lookups. Each worker process keeps its own copy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_property: dict[int, int] = {}
+        self._by_booking: dict[int, int] = {}
+
+    def _apply(self, property_id, booking_id, direction):
+        step = 1 if direction == "in" else -1
+        if booking_id is not None:
+            before = self._by_booking.get(booking_id, 0)
+            after = max(0, before + step)
+            self._by_booking[booking_id] = after
+            step = after - before  # exits with nobody inside don't go negative
+        if property_id is not None and step:
+            self._by_property[property_id] = max(0, self._by_property.get(property_id, 0) + step)
+
+    def record(self, property_id, booking_id, direction):
+        with self._lock:
+            self._apply(property_id, booking_id, direction)
+
+    def property_count(self, property_id) -> int:
+        return self._by_property.get(property_id, 0)
+
+    def booking_count(self, booking_id) -> int:
+        return self._by_booking.get(booking_id, 0)
+
+    def properties(self, property_ids=None) -> dict[int, int]:
+        with self._lock:
+            if property_ids is None:
+                return dict(self._by_property)
+            return {pid: self._by_property.get(pid, 0) for pid in property_ids}
+
+    def rebuild(self, rows):
+        """Replace all counters from an iterable of (property_id, booking_id, direction) in log order."""
+        with self._lock:
+            self._by_property.clear()
+            self._by_booking.clear()
+            for property_id, booking_id, direction in rows:
+                self._apply(property_id, booking_id, direction)
+
+
+occupancy = OccupancyCounters()
+
+
+def rebuild_from_log():
+    """
+    One streaming pass over recent allowed, unflagged scans (needs an app context).
+    Only bookings that have not checked out yet contribute.
+    """
+    from models import db, AccessLog, Booking, Room
+
+    lookback = int(os.getenv("OCCUPANCY_LOOKBACK_DAYS", "30"))
+    now = datetime.utcnow()
+    q = (
+        db.session.query(Room.property_id, AccessLog.booking_id, AccessLog.direction)
+        .join(Booking, Booking.id == AccessLog.booking_id)
+        .join(Room, Room.id == Booking.room_id)
+        .filter(
+            AccessLog.decision == "allow",
+            AccessLog.flag.is_(None),  # flagged (soft anti-passback) allows don't move the live counters either
+            AccessLog.direction.isnot(None),
+            AccessLog.timestamp >= now - timedelta(days=lookback),
+            Booking.check_out >= now,
+            Booking.status != "cancelled",
+        )
+        .order_by(AccessLog.id.asc())
+        .execution_options(yield_per=1000)
+    )
+    occupancy.rebuild(q)
@@ -0,0 +1,215 @@
+# utils/occupancy_report.py
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+
+from models import db, Booking, Room
+from utils.cache import TTLCache
+from utils.write_hooks import on_write
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+class MonthGrid:
+    """
+    Rooms x nights occupancy for one property and calendar month.
+    occ[r, d] is True when room r is sold for the night starting on day d
+    (check_in date <= night < check_out date). Immutable once cached.
+    """
+
+    __slots__ = ("room_ids", "start", "occ", "arrivals", "booking_ids")
+
+    def __init__(self, room_ids, start, occ, arrivals, booking_ids):
+        self.room_ids = room_ids        # tuple, row order of occ
+        self.start = start              # first day of the month
+        self.occ = occ                  # bool ndarray (rooms, days)
+        self.arrivals = arrivals        # int ndarray (days,): stays starting that night
+        self.booking_ids = booking_ids  # frozenset, for invalidation
+
+
+# (property_id, first day of month) -> MonthGrid. Write hooks only reach this
+# process, so the TTL bounds how stale another worker's writes can leave a grid.
+_grids = TTLCache(ttl=int(os.getenv("OCC_GRID_TTL", "300")), maxsize=8192)
+_dirty: set[int] = set()
+_dirty_lock = threading.Lock()
+
+
+@on_write(Booking)
+def _mark_bookings(model, ids):
+    if ids is None:
+        _grids.clear()
+        return
+    with _dirty_lock:
+        _dirty.update(ids)
+
+
+@on_write(Room)
+def _rooms_changed(model, ids):
+    _grids.clear()  # room count is the denominator; rare enough to drop everything
+
+
+def _apply_dirty():
+    """Drop grids that contained, or now should contain, a changed booking."""
+    with _dirty_lock:
+        ids = set(_dirty)
+        _dirty.clear()
+    if not ids or not len(_grids):
+        return
+    stale = set()
+    for (pid, start), grid in _grids.items():
+        if ids & grid.booking_ids:
+            stale.add((pid, start))
+    rows = (
+        db.session.query(Room.property_id, Booking.check_in, Booking.check_out)
+        .join(Room, Room.id == Booking.room_id)
+        .filter(Booking.id.in_(ids))
+    )
+    for pid, ci, co in rows:
+        m = month_start(ci.date())
+        while m <= co.date():
+            stale.add((pid, m))
+            m = next_month(m)
+    for key in stale:
+        _grids.pop(key)
+
+
+def _room_ids(property_id) -> tuple:
+    return tuple(
+        rid for (rid,) in db.session.query(Room.id).filter(Room.property_id == property_id).order_by(Room.id)
+    )
+
+
+def _build_months(property_id, months: list[date], room_ids: tuple) -> dict[date, MonthGrid]:
+    """One booking query for the whole span of missing months, then a numpy grid per month."""
+    span_start = datetime.combine(months[0], time.min)
+    span_end = datetime.combine(next_month(months[-1]), time.min)
+    rows = (
+        db.session.query(Booking.id, Booking.room_id, Booking.check_in, Booking.check_out)
+        .join(Room, Room.id == Booking.room_id)
+        .filter(
+            Room.property_id == property_id,
+            Booking.status != "cancelled",
+            Booking.check_in < span_end,
+            Booking.check_out > span_start,
+        )
+        .all()
+    )
+    row_of = {rid: i for i, rid in enumerate(room_ids)}
+    if rows:
+        bid, rid, ci, co = zip(*rows)
+        bid = np.array(bid, dtype=np.int64)
+        room = np.array([row_of[r] for r in rid], dtype=np.int64)
+        ci = np.array([c.date() for c in ci], dtype="datetime64[D]")
+        co = np.array([c.date() for c in co], dtype="datetime64[D]")
+    else:
+        bid = room = np.zeros(0, dtype=np.int64)
+        ci = co = np.zeros(0, dtype="datetime64[D]")
+
+    out = {}
+    for m in months:
+        start, end = np.datetime64(m, "D"), np.datetime64(next_month(m), "D")
+        days = int((end - start).astype(int))
+        hit = (ci < end) & (co > start) & (co > ci)
+        first = np.clip((ci[hit] - start).astype(int), 0, days)
+        last = np.clip((co[hit] - start).astype(int), 0, days)
+
+        # difference array per room: +1 at first night, -1 after the last; cumsum = rooms sold
+        diff = np.zeros((len(room_ids), days + 1), dtype=np.int32)
+        np.add.at(diff, (room[hit], first), 1)
+        np.add.at(diff, (room[hit], last), -1)
+        occ = np.cumsum(diff[:, :days], axis=1) > 0
+
+        starts_here = ci[hit] >= start
+        arrivals = np.bincount(first[starts_here], minlength=days)[:days]
+        out[m] = MonthGrid(room_ids, m, occ, arrivals, frozenset(bid[hit].tolist()))
+    return out
+
+
+def month_grids(property_id, start: date, end: date) -> list[MonthGrid]:
+    """Cached grids for every month touching [start, end)."""
+    _apply_dirty()
+    months, m = [], month_start(start)
+    while m < end:
+        months.append(m)
+        m = next_month(m)
+    # rooms may have changed in another worker: a grid for other rooms can't be stacked with the rest
+    room_ids = _room_ids(property_id)
+    grids = {m: _grids.get((property_id, m)) for m in months}
+    missing = [m for m, g in grids.items() if g is None or g.room_ids != room_ids]
+    if missing:
+        for m, g in _build_months(property_id, missing, room_ids).items():
+            _grids.set((property_id, m), g)
+            grids[m] = g
+    return [grids[m] for m in months]
+
+
+def _gaps(occ: np.ndarray, max_len: int):
+    """Vacant runs bounded by sold nights on both sides (orphan gaps), per room: (row, start, length)."""
+    padded = np.pad(occ, ((0, 0), (1, 1)), constant_values=True).astype(np.int8)
+    edges = np.diff(padded, axis=1)
+    r_start, d_start = np.nonzero(edges == -1)  # sold -> vacant
+    r_end, d_end = np.nonzero(edges == 1)        # vacant -> sold
+    lengths = d_end - d_start                     # nonzero() is row-major, so runs pair up in order
+    inner = (d_start > 0) & (d_end < occ.shape[1]) & (lengths <= max_len)
+    return r_start[inner], d_start[inner], lengths[inner]
+
+
+def occupancy_report(property_id, start: date, end: date, gap_max: int = 3) -> dict:
+    """
+    Occupancy for nights in [start, end): rate overall, per month and per room;
+    room-nights sold (the ADR denominator) and arrivals; short vacant gaps
+    between stays. Works on concatenated cached month grids.
+    """
+    grids = month_grids(property_id, start, end)
+    if not grids or not grids[0].room_ids:
+        return {"rooms": 0, "nights": 0, "available": 0, "sold": 0, "rate": 0.0,
+                "months": [], "by_room": [], "gaps": []}
+
+    room_ids = grids[0].room_ids
+    occ = np.concatenate([g.occ for g in grids], axis=1)
+    arrivals = np.concatenate([g.arrivals for g in grids])
+    origin = np.datetime64(grids[0].start, "D")
+    lo = int((np.datetime64(start, "D") - origin).astype(int))
+    hi = int((np.datetime64(end, "D") - origin).astype(int))
+    occ, arrivals = occ[:, lo:hi], arrivals[lo:hi]
+    nights = occ.shape[1]
+    day_keys = origin + np.arange(lo, hi)
+
+    sold_per_night = occ.sum(axis=0)
+    months = []
+    month_of = day_keys.astype("datetime64[M]")
+    for mk in np.unique(month_of):
+        sel = month_of == mk
+        avail = int(sel.sum()) * len(room_ids)
+        sold = int(sold_per_night[sel].sum())
+        months.append({"month": str(mk), "sold": sold, "available": avail,
+                       "rate": round(sold / avail, 4) if avail else 0.0,
+                       "arrivals": int(arrivals[sel].sum())})
+
+    per_room = occ.sum(axis=1)
+    names = dict(db.session.query(Room.id, Room.name).filter(Room.id.in_(room_ids)))
+    by_room = [{"room_id": rid, "room": names.get(rid, str(rid)), "sold": int(n),
+                "rate": round(int(n) / nights, 4) if nights else 0.0}
+               for rid, n in zip(room_ids, per_room)]
+
+    rows, first, length = _gaps(occ, gap_max)
+    gaps = [{"room": names.get(room_ids[r], str(room_ids[r])), "from": str(day_keys[d]), "nights": int(n)}
+            for r, d, n in zip(rows, first, length)]
+
+    available = nights * len(room_ids)
+    sold = int(per_room.sum())
+    return {
+        "rooms": len(room_ids), "nights": nights, "available": available, "sold": sold,
+        "rate": round(sold / available, 4) if available else 0.0,
+        "arrivals": int(arrivals.sum()),
+        "peak_night": str(day_keys[int(sold_per_night.argmax())]) if nights else None,
+        "months": months, "by_room": by_room, "gaps": gaps,
+    }
@@ -0,0 +1,98 @@
+# utils/passback.py
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from utils.cache import TTLCache
+
+# Checkpoint direction modes
+MODE_BOTH = "both"
+MODE_ENTRY = "in"
+MODE_EXIT = "out"
+CHECKPOINT_MODES = [(MODE_BOTH, "Bidirectional"), (MODE_ENTRY, "Entry only"), (MODE_EXIT, "Exit only")]
+
+
+def enforcement() -> str:
+    """ANTI_PASSBACK=hard (deny violations, default) | soft (allow but flag) | off."""
+    mode = (os.getenv("ANTI_PASSBACK") or "hard").strip().lower()
+    return mode if mode in ("hard", "soft", "off") else "hard"
+
+
+class PassbackTracker:
+    """
+    Anti-passback: last direction per credential ("nid:<national id>", ...)
+    lives in PassbackState and is moved with one conditional UPDATE in the
+    caller's transaction, so every worker sees every other worker's scans.
+    Checkpoint modes are cached per process for PASSBACK_CHECKPOINT_TTL
+    seconds; an edit reaches other workers within that window.
+    """
+
+    def __init__(self):
+        self._checkpoints = TTLCache(ttl=int(os.getenv("PASSBACK_CHECKPOINT_TTL", "30")), maxsize=4096)
+
+    # ----- checkpoints -----
+    def set_checkpoint(self, checkpoint_id, mode):
+        self._checkpoints.set(checkpoint_id, mode or MODE_BOTH)
+
+    def forget_checkpoint(self, checkpoint_id):
+        self._checkpoints.pop(checkpoint_id)
+
+    def checkpoint_mode(self, checkpoint_id):
+        """Mode for a known checkpoint, or None if unknown."""
+        mode = self._checkpoints.get(checkpoint_id)
+        if mode is not None:
+            return mode
+        from models import db, Checkpoint  # cache miss or expired: ask the table
+        mode = db.session.query(Checkpoint.direction_mode).filter(Checkpoint.id == checkpoint_id).first()
+        if mode is None:
+            return None
+        self.set_checkpoint(checkpoint_id, mode[0])
+        return mode[0] or MODE_BOTH
+
+    @staticmethod
+    def resolve_direction(mode, requested):
+        """Entry/exit-only checkpoints fix the direction; bidirectional ones use the guard's choice."""
+        if mode in (MODE_ENTRY, MODE_EXIT):
+            return mode
+        return "out" if (requested or "").strip().lower() in ("out", "exit") else "in"
+
+    # ----- credentials -----
+    def move(self, session, credential, direction, checkpoint_id, force=False) -> bool:
+        """
+        Move the credential to `direction` unless that would be a second entry
+        (or exit) in a row within PASSBACK_RESET_HOURS; False means it was a
+        violation and nothing changed. `force` records the move regardless.
+        Joins the caller's transaction; the caller commits.
+        """
+        from models import PassbackState
+
+        now = datetime.utcnow()
+        reset_after = timedelta(hours=int(os.getenv("PASSBACK_RESET_HOURS", "24")))
+        values = {"state": direction, "checkpoint_id": checkpoint_id, "updated_at": now}
+        stmt = update(PassbackState).where(PassbackState.credential == credential)
+        if not force:
+            stmt = stmt.where(or_(PassbackState.state != direction, PassbackState.updated_at < now - reset_after))
+        res = session.execute(stmt.values(**values).execution_options(synchronize_session=False))
+        if res.rowcount:
+            return True
+        if not force and session.query(PassbackState.credential).filter_by(credential=credential).first():
+            return False  # the row is there and already in this direction
+        try:
+            with session.begin_nested():  # first scan of this credential
+                session.add(PassbackState(credential=credential, **values))
+        except IntegrityError:
+            # another gate inserted it first: decide against its row instead
+            return self.move(session, credential, direction, checkpoint_id, force)
+        return True
+
+    def load(self):
+        """Prime the checkpoint mode cache (needs an app context)."""
+        from models import db, Checkpoint
+
+        for cid, mode in db.session.query(Checkpoint.id, Checkpoint.direction_mode):
+            self.set_checkpoint(cid, mode)
+
+
+passback = PassbackTracker()
@@ -0,0 +1,296 @@
+# utils/payments.py
+import json
+import os
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from models import db, Payment, Subscription, User
+from utils.cache import TTLCache
+from utils.mpesa import client as mpesa, MpesaError
+from utils.tasks import enqueue
+
+PENDING, INITIATED, SUCCESS, FAILED = "pending", "initiated", "success", "failed"
+OPEN = (PENDING, INITIATED)
+
+RECONCILE_AFTER = int(os.getenv("MPESA_RECONCILE_AFTER", "90"))      # seconds "initiated" before we ask Daraja
+PENDING_TIMEOUT = int(os.getenv("MPESA_PENDING_TIMEOUT", "600"))     # a push that was never sent (worker died)
+INITIATED_TIMEOUT = int(os.getenv("MPESA_INITIATED_TIMEOUT", "86400"))  # give up asking after this
+RECONCILE_BATCH = int(os.getenv("MPESA_RECONCILE_BATCH", "100"))
+SUBSCRIPTION_DAYS = int(os.getenv("SUBSCRIPTION_DAYS", "30"))
+FREE_PLAN = "FREE"
+
+# STK query answers HTTP 500 with this code while the customer is still on the PIN prompt
+STILL_PROCESSING = {"500.001.1001"}
+
+_queried = TTLCache(ttl=RECONCILE_AFTER, maxsize=10000)  # payment id -> True, throttles poll-triggered queries
+
+
+def _move(payment_id: int, from_status, to_status: str, **values) -> bool:
+    """Conditional status change; False when another worker already moved the payment on."""
+    from_status = (from_status,) if isinstance(from_status, str) else tuple(from_status)
+    if "result_desc" in values:
+        values["result_desc"] = (values["result_desc"] or "")[:255]
+    res = db.session.execute(
+        update(Payment)
+        .where(Payment.id == payment_id, Payment.status.in_(from_status))
+        .values(status=to_status, updated_at=datetime.utcnow(), **values)
+    )
+    db.session.commit()
+    return res.rowcount == 1
+
+
+# ---------- STK push (background) ----------
+def send_stk(payment_id: int):
+    """Background job: push the STK prompt for a pending payment and record Daraja's answer."""
+    p = db.session.get(Payment, payment_id)
+    if p is None or p.status != PENDING:
+        return
+    try:
+        resp = mpesa.stk_push(
+            phone=p.phone,
+            amount=p.amount,
+            account_ref=f"{p.plan}-plan",
+            trans_desc=f"{p.plan} subscription",
+        )
+    except MpesaError as e:
+        current_app.logger.warning("STK push for payment %s failed: %s", payment_id, e)
+        if e.uncertain:
+            # the prompt may have gone out; without a CheckoutRequestID only its callback
+            # can settle it (matched on phone + amount in adopt_callback), else it expires
+            _move(payment_id, PENDING, INITIATED, result_desc="Waiting for M-Pesa to confirm the request")
+        else:
+            _move(payment_id, PENDING, FAILED, result_desc=f"M-Pesa request failed: {e}")
+        return
+
+    # Daraja success to initiate STK push is ResponseCode == "0"
+    if str(resp.get("ResponseCode", "")) != "0":
+        msg = resp.get("errorMessage") or resp.get("ResponseDescription") or str(resp)
+        _move(payment_id, PENDING, FAILED, result_desc=f"STK not initiated: {msg}")
+        return
+
+    _move(payment_id, PENDING, INITIATED, reference=resp.get("CheckoutRequestID"),
+          result_desc=resp.get("CustomerMessage") or "STK Push initiated.")
+
+
+# ---------- settlement ----------
+def settle(payment_id: int, ok: bool, desc: str) -> bool:
+    """
+    Final answer for a payment, from its callback or an STK query, whichever
+    lands first. Only the call that moves it out of pending/initiated
+    activates the subscription, so retries and races can't apply it twice.
+    """
+    if not _move(payment_id, OPEN, SUCCESS if ok else FAILED, result_desc=desc):
+        return False
+    if ok:
+        activate(db.session.get(Payment, payment_id))
+    return True
+
+
+def activate(payment: Payment, now: datetime | None = None):
+    """Start (or extend) the paid plan's Subscription and move User.plan to it."""
+    now = now or datetime.utcnow()
+    period = timedelta(days=SUBSCRIPTION_DAYS)
+    current = (
+        Subscription.query
+        .filter(Subscription.user_id == payment.user_id, Subscription.status == "active")
+        .order_by(Subscription.expires_at.desc())
+        .all()
+    )
+    same = next((s for s in current if s.plan == payment.plan and (s.expires_at or now) > now), None)
+    if same:
+        same.expires_at = (same.expires_at or now) + period  # renewal before expiry stacks
+    else:
+        for s in current:
+            s.status = "canceled"  # plan change replaces whatever was running
+        db.session.add(Subscription(user_id=payment.user_id, plan=payment.plan, status="active",
+                                    started_at=now, expires_at=now + period))
+    db.session.execute(update(User).where(User.id == payment.user_id).values(plan=payment.plan))
+    db.session.commit()
+
+
+def expire_subscriptions(now: datetime | None = None) -> dict:
+    """Expire lapsed subscriptions and drop users with nothing else active back to FREE."""
+    now = now or datetime.utcnow()
+    lapsed = (
+        Subscription.query
+        .filter(Subscription.status == "active", Subscription.expires_at < now)
+        .all()
+    )
+    user_ids = {s.user_id for s in lapsed}
+    for s in lapsed:
+        s.status = "expired"
+    db.session.flush()
+    still_active = {
+        uid for (uid,) in db.session.query(Subscription.user_id)
+        .filter(Subscription.user_id.in_(user_ids), Subscription.status == "active")
+    } if user_ids else set()
+    downgraded = user_ids - still_active
+    if downgraded:
+        db.session.execute(update(User).where(User.id.in_(downgraded)).values(plan=FREE_PLAN))
+    db.session.commit()
+    return {"expired": len(lapsed), "downgraded": len(downgraded)}
+
+
+# ---------- callbacks ----------
+_callbacks = TTLCache(ttl=30, maxsize=10000)  # reference -> True while a check is queued (absorbs retry bursts)
+
+
+def _callback_items(cb: dict) -> dict:
+    return {it["Name"]: it.get("Value") for it in (cb.get("CallbackMetadata") or {}).get("Item", [])}
+
+
+def record_callback(payload: dict) -> str:
+    """
+    Persist the first Daraja STK callback for an open Payment in one UPDATE and
+    queue a check. Returns 'queued', 'duplicate' or 'unknown'. The callback URL
+    is public, so its body is only a hint: process_callback() settles the
+    payment from the STK query API, and a retry or forged copy never replaces
+    the payload already stored.
+    """
+    ref = ((payload.get("Body") or {}).get("stkCallback") or {}).get("CheckoutRequestID")
+    if not ref:
+        return "unknown"
+    db.session.execute(
+        update(Payment)
+        .where(Payment.reference == ref, Payment.status.in_(OPEN), Payment.raw_callback.is_(None))
+        .values(raw_callback=json.dumps(payload), updated_at=datetime.utcnow())
+    )
+    db.session.commit()
+    status = db.session.query(Payment.status).filter(Payment.reference == ref).scalar()
+    if status is None:
+        enqueue(adopt_callback, payload)
+        return "unknown"
+    if status not in OPEN or _callbacks.get(ref):
+        return "duplicate"  # already settled, or a check is already queued
+    # first copy, or a later one once the last check found nothing (e.g. a forged amount)
+    _callbacks.set(ref, True)
+    enqueue(process_callback, ref, payload)
+    return "queued"
+
+
+def process_callback(reference: str, payload: dict):
+    """Background job: confirm a callback with Daraja and settle the payment from Daraja's answer."""
+    _callbacks.pop(reference)  # a later copy may queue another check
+    p = Payment.query.filter_by(reference=reference).first()
+    if p is None or p.status not in OPEN:
+        return
+    cb = payload["Body"]["stkCallback"]
+    items = _callback_items(cb)
+    if str(cb.get("ResultCode")) == "0":
+        try:
+            paid = int(float(items.get("Amount")))
+        except (TypeError, ValueError):
+            paid = None
+        if paid != p.amount:
+            # leave it to the reconciler's STK query rather than trust this body
+            current_app.logger.warning("M-Pesa callback for payment %s has amount %r, expected %s",
+                                       p.id, items.get("Amount"), p.amount)
+            return
+    receipt = items.get("MpesaReceiptNumber")
+    query(p.id, note=f"receipt {receipt}" if receipt else None)
+
+
+def adopt_callback(payload: dict):
+    """
+    Background job: a success callback for a push whose answer we never got
+    (send_stk timed out). Match it to the open payment with no reference for
+    the same phone and amount, and only once Daraja confirms the CheckoutRequestID.
+    """
+    cb = payload["Body"]["stkCallback"]
+    items = _callback_items(cb)
+    if str(cb.get("ResultCode")) != "0" or not items.get("PhoneNumber") or not items.get("Amount"):
+        return
+    p = (
+        Payment.query
+        .filter(Payment.status == INITIATED, Payment.reference.is_(None),
+                Payment.phone == str(items["PhoneNumber"]), Payment.amount == int(float(items["Amount"])))
+        .order_by(Payment.created_at.desc())
+        .first()
+    )
+    if p is None:
+        current_app.logger.warning("[MPESA CALLBACK] no payment for %s", cb.get("CheckoutRequestID"))
+        return
+    ref = cb["CheckoutRequestID"]
+    try:
+        code = str(mpesa.stk_query(ref).get("ResultCode", ""))
+    except MpesaError:
+        code = ""
+    if code != "0":
+        return
+    if _move(p.id, INITIATED, INITIATED, reference=ref, raw_callback=json.dumps(payload)):
+        settle(p.id, True, cb.get("ResultDesc") or "ResultCode 0")
+
+
+# ---------- reconciliation ----------
+def query(payment_id: int, note: str | None = None) -> str:
+    """
+    Ask Daraja about one initiated payment and settle it if it has an answer; returns the status.
+    This is the only path that marks a payment paid (callbacks go through it too).
+    """
+    p = db.session.get(Payment, payment_id)
+    if p is None or p.status != INITIATED or not p.reference:
+        return p.status if p else "missing"
+    try:
+        data = mpesa.stk_query(p.reference)
+    except MpesaError as e:
+        if (e.data or {}).get("errorCode") not in STILL_PROCESSING:
+            current_app.logger.warning("STK query for payment %s failed: %s", payment_id, e)
+        # either way: try again on a later sweep
+        _move(payment_id, INITIATED, INITIATED)
+        return INITIATED
+
+    code = str(data.get("ResultCode", ""))
+    if code == "":
+        _move(payment_id, INITIATED, INITIATED)
+        return INITIATED
+    desc = data.get("ResultDesc") or f"ResultCode {code}"
+    settle(payment_id, code == "0", f"{desc} ({note})" if note else desc)
+    return SUCCESS if code == "0" else FAILED
+
+
+def maybe_query(payment):
+    """Queue an STK query for a payment a client is polling, at most once per RECONCILE_AFTER."""
+    if payment.status != INITIATED or payment.updated_at > datetime.utcnow() - timedelta(seconds=RECONCILE_AFTER):
+        return
+    if _queried.get(payment.id):
+        return
+    _queried.set(payment.id, True)
+    enqueue(query, payment.id)
+
+
+def reconcile(now: datetime | None = None, limit: int = RECONCILE_BATCH) -> dict:
+    """
+    Sweep payments stuck mid-flight: pushes never sent fail after PENDING_TIMEOUT,
+    initiated ones idle for RECONCILE_AFTER are checked with the STK query API,
+    and those still unresolved after INITIATED_TIMEOUT are failed.
+    """
+    now = now or datetime.utcnow()
+    counts = {"abandoned": 0, "queried": 0, SUCCESS: 0, FAILED: 0, "expired": 0}
+
+    counts["abandoned"] = db.session.execute(
+        update(Payment)
+        .where(Payment.status == PENDING, Payment.updated_at < now - timedelta(seconds=PENDING_TIMEOUT))
+        .values(status=FAILED, result_desc="STK push was never sent", updated_at=now)
+    ).rowcount
+    counts["expired"] = db.session.execute(
+        update(Payment)
+        .where(Payment.status == INITIATED, Payment.created_at < now - timedelta(seconds=INITIATED_TIMEOUT))
+        .values(status=FAILED, result_desc="No result from M-Pesa", updated_at=now)
+    ).rowcount
+    db.session.commit()
+
+    ids = [
+        pid for (pid,) in db.session.query(Payment.id)
+        .filter(Payment.status == INITIATED, Payment.reference.isnot(None),
+                Payment.updated_at < now - timedelta(seconds=RECONCILE_AFTER))
+        .order_by(Payment.updated_at)
+        .limit(limit)
+    ]
+    for pid in ids:
+        status = query(pid)
+        counts["queried"] += 1
+        if status in (SUCCESS, FAILED):
+            counts[status] += 1
+    return counts
@@ -0,0 +1,60 @@
+# utils/plates.py
+import re
+
+# Plates are compared in a folded form: spaces/dashes dropped, uppercased, and
+# only O/0 and I/1 (the pairs OCR mixes up) merged; folding more letters lets
+# different real plates (KDA... vs K0A...) collide. Changing this needs PLATE_FOLD bumped.
+_FOLD = str.maketrans({"O": "0", "I": "1"})
+PLATE_FOLD = "plate_key_fold_v2"
+_NON_ALNUM = re.compile(r"[^0-9A-Z]")
+
+# Kenyan-style plates (KDA 123A, KBZ 001, GK 123A, CD 12K 3) with some slack for OCR
+RX_PLATE = re.compile(r"\b[A-Z]{1,3}\s?\d{1,4}\s?[A-Z]?\b")
+
+
+def normalize_plate(raw) -> str | None:
+    """'kda 123a' / 'KDA-I23A' -> 'KDA123A'; None when nothing plate-like is left."""
+    key = _NON_ALNUM.sub("", str(raw or "").upper()).translate(_FOLD)
+    return key[:20] or None
+
+
+def pick_plate(text: str) -> str | None:
+    """Best plate-looking token in OCR output (first match, else the longest alnum run)."""
+    up = (text or "").upper()
+    m = RX_PLATE.search(up)
+    if m:
+        return m.group(0)
+    runs = [r for r in re.findall(r"[0-9A-Z ]{4,}", up) if any(c.isdigit() for c in r)]
+    return max(runs, key=len).strip() if runs else None
+
+
+def reset_plate_keys():
+    """Forget every stored plate_key so backfill_plate_keys() re-derives them with the current fold."""
+    from models import db, Booking
+
+    db.session.execute(Booking.__table__.update().values(plate_key=None))
+    db.session.commit()
+
+
+def backfill_plate_keys(batch: int = 500) -> int:
+    """Fill plate_key for bookings saved before it existed (needs an app context)."""
+    from models import db, Booking
+
+    done = 0
+    while True:
+        rows = (
+            db.session.query(Booking.id, Booking.vehicle_plate)
+            .filter(Booking.vehicle_plate.isnot(None), Booking.plate_key.is_(None))
+            .limit(batch)
+            .all()
+        )
+        if not rows:
+            break
+        # "" marks plates with nothing usable so they aren't picked up again
+        db.session.execute(
+            Booking.__table__.update().where(Booking.__table__.c.id == db.bindparam("b_id")),
+            [{"b_id": bid, "plate_key": normalize_plate(plate) or ""} for bid, plate in rows],
+        )
+        db.session.commit()
+        done += len(rows)
+    return done
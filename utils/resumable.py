@@ -0,0 +1,243 @@
+# utils/resumable.py
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(512 * 1024)))
+UPLOAD_SESSION_HOURS = float(os.getenv("UPLOAD_SESSION_HOURS", "24"))
+UPLOAD_KINDS = ("luggage", "plate")
+
+_locks: dict[str, threading.Lock] = {}  # per-upload fallback where flock is unavailable
+_locks_guard = threading.Lock()
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def sessions_dir() -> str:
+    path = os.getenv("UPLOAD_TMP_DIR") or os.path.join(current_app.instance_path, "uploads-tmp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _paths(upload_id):
+    base = os.path.join(sessions_dir(), upload_id)
+    return base + ".json", base + ".part"
+
+
+@contextmanager
+def _locked(upload_id):
+    """
+    Exclusive hold on one upload's files while its offset is checked and the
+    chunk is appended — flock on a side file (works across workers), or a
+    per-id thread lock where fcntl does not exist. Other uploads never wait.
+    """
+    if fcntl is None:
+        with _locks_guard:
+            lock = _locks.setdefault(upload_id, threading.Lock())
+        with lock:
+            yield
+        return
+    with open(os.path.join(sessions_dir(), upload_id + ".lock"), "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _save_meta(meta):
+    path, _ = _paths(meta["id"])
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(meta, fh)
+    os.replace(tmp, path)
+
+
+def _public(meta) -> dict:
+    return {k: meta[k] for k in ("id", "size", "received", "done")} | {"chunk_size": UPLOAD_CHUNK_BYTES}
+
+
+# ---------- session lifecycle ----------
+def create_session(owner_id, filename, size, kind, sha256=None) -> dict:
+    if kind not in UPLOAD_KINDS:
+        raise UploadError("Unknown upload kind.")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("size is required.")
+    if size <= 0:
+        raise UploadError("Empty upload.")
+    if size > UPLOAD_MAX_BYTES:
+        raise UploadError(f"File too large (max {UPLOAD_MAX_BYTES // (1024 * 1024)} MB).", 413)
+    if sha256 and (len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256.lower())):
+        raise UploadError("sha256 must be 64 hex characters.")
+
+    meta = {
+        "id": secrets.token_urlsafe(18), "owner_id": owner_id, "kind": kind,
+        "filename": os.path.basename(filename or "upload")[:120], "size": size,
+        "sha256": sha256.lower() if sha256 else None, "received": 0, "done": False,
+        "created_at": time.time(),
+    }
+    _, part = _paths(meta["id"])
+    open(part, "wb").close()
+    _save_meta(meta)
+    return _public(meta)
+
+
+def load(upload_id, owner_id) -> dict:
+    if not upload_id or not all(c.isalnum() or c in "-_" for c in upload_id):
+        raise UploadError("Unknown upload.", 404)
+    path, _ = _paths(upload_id)
+    try:
+        with open(path) as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        raise UploadError("Unknown or expired upload.", 404)
+    if meta["owner_id"] != owner_id:
+        raise UploadError("Unknown or expired upload.", 404)
+    return meta
+
+
+def status(upload_id, owner_id) -> dict:
+    return _public(load(upload_id, owner_id))
+
+
+def write_chunk(upload_id, owner_id, offset, stream, length, checksum) -> dict:
+    """
+    Append one chunk at `offset` (must equal what the server has). The body is
+    spooled and hashed with no lock held, so a slow client stalls only itself;
+    the offset is then re-checked under this upload's lock and the verified
+    bytes appended, which makes `received` a compare-and-set. A checksum
+    mismatch or short body never touches the file, so a retry is always safe.
+    """
+    meta = load(upload_id, owner_id)
+    _check_offset(meta, offset)
+    if length is None or length <= 0 or length > UPLOAD_CHUNK_BYTES:
+        raise UploadError(f"Chunk must be 1..{UPLOAD_CHUNK_BYTES} bytes.", 413)
+    if offset + length > meta["size"]:
+        raise UploadError("Chunk runs past the declared size.", 413)
+    if not checksum or len(checksum) != 64:
+        raise UploadError("X-Chunk-Sha256 header is required.")
+
+    _, part = _paths(upload_id)
+    digest = hashlib.sha256()
+    with tempfile.SpooledTemporaryFile(max_size=256 * 1024, dir=sessions_dir()) as spool:
+        remaining = length
+        while remaining:
+            buf = stream.read(min(65536, remaining))
+            if not buf:
+                break
+            spool.write(buf)
+            digest.update(buf)
+            remaining -= len(buf)
+        if remaining or digest.hexdigest() != checksum.lower():
+            raise UploadError("Chunk incomplete or checksum mismatch; resend it.", 422, **_public(meta))
+
+        with _locked(upload_id):
+            meta = load(upload_id, owner_id)
+            _check_offset(meta, offset)  # another request may have stored this chunk meanwhile
+            spool.seek(0)
+            with open(part, "r+b") as fh:
+                fh.truncate(offset)  # drop bytes from an earlier interrupted attempt
+                fh.seek(offset)
+                shutil.copyfileobj(spool, fh)
+                fh.flush()
+                os.fsync(fh.fileno())
+            meta["received"] = offset + length
+            _save_meta(meta)
+    return _public(meta)
+
+
+def _check_offset(meta, offset):
+    if meta["done"]:
+        raise UploadError("Upload already completed.", 409, **_public(meta))
+    if offset != meta["received"]:
+        # client lost track (e.g. reconnect after the server stored a chunk): tell it where to resume
+        raise UploadError("Offset mismatch.", 409, **_public(meta))
+
+
+def complete(upload_id, owner_id) -> dict:
+    """Check size and whole-file hash; mark ready for a form to claim."""
+    with _locked(upload_id):
+        return _complete(upload_id, owner_id)
+
+
+def _complete(upload_id, owner_id) -> dict:
+    meta = load(upload_id, owner_id)
+    if meta["done"]:
+        return _public(meta)
+    _, part = _paths(upload_id)
+    if meta["received"] != meta["size"] or os.path.getsize(part) != meta["size"]:
+        raise UploadError("Upload is incomplete.", 409, **_public(meta))
+    if meta["sha256"]:
+        digest = hashlib.sha256()
+        with open(part, "rb") as fh:
+            for buf in iter(lambda: fh.read(1024 * 1024), b""):
+                digest.update(buf)
+        if digest.hexdigest() != meta["sha256"]:
+            discard(upload_id)
+            raise UploadError("File checksum mismatch; upload again.", 422)
+    meta["done"] = True
+    _save_meta(meta)
+    return _public(meta)
+
+
+def claim(upload_id, owner_id, kind, dest) -> dict:
+    """Move a completed upload to `dest` and forget the session; returns the meta plus "path"."""
+    meta = load(upload_id, owner_id)
+    if not meta["done"] or meta["kind"] != kind:
+        raise UploadError("Upload is not ready.", 409)
+    _, part = _paths(upload_id)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.move(part, dest)
+    discard(upload_id)
+    return meta | {"path": dest}
+
+
+def discard(upload_id):
+    for path in (*_paths(upload_id), os.path.join(sessions_dir(), upload_id + ".lock")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    _locks.pop(upload_id, None)
+
+
+def purge_stale(now: float | None = None, dry_run: bool = False) -> int:
+    """Drop sessions idle for longer than UPLOAD_SESSION_HOURS."""
+    now = now or time.time()
+    cutoff = now - UPLOAD_SESSION_HOURS * 3600
+    root = sessions_dir()
+    removed = 0
+    for name in os.listdir(root):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(root, name)
+        try:
+            idle_since = max(os.path.getmtime(path), os.path.getmtime(path[:-5] + ".part"))
+        except OSError:
+            idle_since = os.path.getmtime(path) if os.path.exists(path) else 0
+        if idle_since < cutoff:
+            removed += 1
+            if not dry_run:
+                discard(name[:-5])
+    return removed
@@ -0,0 +1,219 @@
+# utils/retention.py
+import fnmatch
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, delete, func
+
+from models import db
+from utils.logs import SOURCES
+from utils.resumable import purge_stale as purge_upload_sessions
+
+# Upload artifacts eligible for ageing: subfolder of uploads/ -> (patterns, env var, default days).
+# QR codes (bookings/) and luggage photos are still referenced by live rows and are never aged.
+UPLOAD_POLICY = {
+    "": (["*_capture.jpg", "*_capture.png", "*.ocr.txt"], "UPLOAD_CAPTURE_DAYS", 30),
+    "plates": (["*"], "UPLOAD_PLATE_DAYS", 90),
+}
+# Folders whose files AccessLog.image_path points at: aged no sooner than the log rows themselves.
+LOGGED_UPLOADS = {"plates"}
+
+_index_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def log_retention_days() -> int:
+    return _env_int("LOG_RETENTION_DAYS", 180)
+
+
+def archive_dir() -> str:
+    return os.getenv("ARCHIVE_DIR") or os.path.join(current_app.instance_path, "archive")
+
+
+def _month_path(source_key, month):
+    return os.path.join(archive_dir(), source_key, f"{month}.jsonl.gz")
+
+
+def _index_path(source_key):
+    return os.path.join(archive_dir(), source_key, "index.json")
+
+
+def load_index(source_key) -> dict:
+    """{"YYYY-MM": {"rows", "min_ts", "max_ts", "min_id", "max_id", "bytes"}} for archived months."""
+    try:
+        with open(_index_path(source_key), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_index(source_key, index):
+    path = _index_path(source_key)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(index, fh, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _jsonable(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+# ---------- logs ----------
+def archive_logs(source_key, cutoff: datetime, chunk: int | None = None) -> int:
+    """
+    Move rows older than `cutoff` into archive/<source>/<YYYY-MM>.jsonl.gz,
+    oldest first, `chunk` rows per transaction. Each chunk is appended (as a
+    new gzip member) and fsync'd before its rows are deleted, so a crash can
+    at worst leave a row both archived and live — never lost.
+    """
+    source = SOURCES[source_key]
+    table = source.model.__table__
+    ts_col = table.c[source.ts.key]
+    chunk = chunk or _env_int("RETENTION_CHUNK", 1000)
+    os.makedirs(os.path.dirname(_month_path(source_key, "x")), exist_ok=True)
+
+    moved = 0
+    while True:
+        rows = db.session.execute(
+            select(table).where(ts_col < cutoff).order_by(ts_col.asc(), table.c.id.asc()).limit(chunk)
+        ).mappings().all()
+        if not rows:
+            break
+
+        by_month: dict[str, list] = {}
+        for r in rows:
+            by_month.setdefault(r[ts_col.key].strftime("%Y-%m"), []).append(r)
+
+        with _index_lock:
+            index = load_index(source_key)
+            for month, month_rows in by_month.items():
+                path = _month_path(source_key, month)
+                with open(path, "ab") as raw:
+                    with gzip.GzipFile(fileobj=raw, mode="ab") as gz:
+                        for r in month_rows:
+                            gz.write((json.dumps({k: _jsonable(v) for k, v in r.items()},
+                                                 separators=(",", ":")) + "\n").encode())
+                    raw.flush()
+                    os.fsync(raw.fileno())
+
+                entry = index.setdefault(month, {"rows": 0, "min_ts": None, "max_ts": None,
+                                                 "min_id": None, "max_id": None})
+                ts_vals = [r[ts_col.key].isoformat() for r in month_rows]
+                ids = [r["id"] for r in month_rows]
+                entry["rows"] += len(month_rows)
+                entry["min_ts"] = min(filter(None, [entry["min_ts"], *ts_vals]))
+                entry["max_ts"] = max(filter(None, [entry["max_ts"], *ts_vals]))
+                entry["min_id"] = min(i for i in [entry["min_id"], *ids] if i is not None)
+                entry["max_id"] = max(i for i in [entry["max_id"], *ids] if i is not None)
+                entry["bytes"] = os.path.getsize(path)
+            _save_index(source_key, index)
+
+        db.session.execute(delete(table).where(table.c.id.in_([r["id"] for r in rows])))
+        db.session.commit()
+        moved += len(rows)
+    return moved
+
+
+def count_archivable(source_key, cutoff: datetime) -> int:
+    """How many rows archive_logs() would move right now (for dry runs)."""
+    source = SOURCES[source_key]
+    table = source.model.__table__
+    return db.session.execute(
+        select(func.count()).select_from(table).where(table.c[source.ts.key] < cutoff)
+    ).scalar()
+
+
+def search_archive(source_key, filters, limit: int | None = None):
+    """
+    Yield archived rows (dicts, oldest first) matching explorer-style filters
+    (see utils.logs.parse_filters). Only months whose index range overlaps the
+    date filter are decompressed, one line at a time.
+    """
+    source = SOURCES[source_key]
+    ts_key = source.ts.key
+    lo = filters.get("date_from")
+    hi = filters.get("date_to")
+    allowed_cps = filters.get("checkpoint_ids")
+    allowed_cps = set(allowed_cps) if allowed_cps is not None else None
+
+    found = 0
+    for month, meta in sorted(load_index(source_key).items()):
+        if lo and meta.get("max_ts") and datetime.fromisoformat(meta["max_ts"]) < lo:
+            continue
+        if hi and meta.get("min_ts") and datetime.fromisoformat(meta["min_ts"]) >= hi:
+            continue
+        path = _month_path(source_key, month)
+        if not os.path.exists(path):
+            continue
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                row = json.loads(line)
+                ts = datetime.fromisoformat(row[ts_key])
+                if (lo and ts < lo) or (hi and ts >= hi):
+                    continue
+                if filters.get("checkpoint_id") and row.get("checkpoint_id") != filters["checkpoint_id"]:
+                    continue
+                if allowed_cps is not None and row.get("checkpoint_id") not in allowed_cps:
+                    continue
+                if filters.get("guard_id") and row.get("guard_id") != filters["guard_id"]:
+                    continue
+                if filters.get("decision") and row.get("decision") != filters["decision"]:
+                    continue
+                yield row
+                found += 1
+                if limit and found >= limit:
+                    return
+
+
+# ---------- uploads ----------
+def age_uploads(now: float | None = None, dry_run: bool = False) -> dict:
+    """Delete upload artifacts past their policy age. Returns {folder: files removed}."""
+    now = now or time.time()
+    root = os.path.join(current_app.root_path, "uploads")
+    removed = {}
+    for sub, (patterns, env, default_days) in UPLOAD_POLICY.items():
+        folder = os.path.join(root, sub)
+        days = _env_int(env, default_days)
+        if sub in LOGGED_UPLOADS:
+            days = max(days, log_retention_days())  # else a live log row's image_path would dangle
+        horizon = now - days * 86400
+        count = 0
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.is_file() or not any(fnmatch.fnmatch(entry.name, p) for p in patterns):
+                continue
+            if entry.stat().st_mtime >= horizon:
+                continue
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+            count += 1
+        removed[sub or "."] = count
+    return removed
+
+
+def run_retention(dry_run: bool = False) -> dict:
+    """Archive logs older than LOG_RETENTION_DAYS (default 180), age uploads and drop abandoned upload sessions."""
+    cutoff = datetime.utcnow() - timedelta(days=log_retention_days())
+    summary = {"cutoff": cutoff.isoformat(), "archived": {}, "uploads": age_uploads(dry_run=dry_run),
+               "upload_sessions": purge_upload_sessions(dry_run=dry_run)}
+    for key in SOURCES:
+        summary["archived"][key] = count_archivable(key, cutoff) if dry_run else archive_logs(key, cutoff)
+    return summary
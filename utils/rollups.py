@@ -0,0 +1,264 @@
+# utils/rollups.py
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+from sqlalchemy import delete, func, insert
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from models import db, AccessLog, AccessRollup
+from utils.cache import TTLCache
+from utils.tasks import enqueue
+from utils.write_hooks import on_write
+
+HOUR = timedelta(hours=1)
+CATCH_UP_WINDOW = timedelta(days=7)
+CATCH_UP_EVERY = int(os.getenv("ROLLUP_CATCH_UP_EVERY", "300"))  # seconds between report-triggered catch-ups
+
+_catch_up_queued = TTLCache(ttl=CATCH_UP_EVERY, maxsize=1)
+
+
+def floor_hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+# ---------- building ----------
+def _aggregate(rows):
+    """
+    rows: (checkpoint_id, timestamp, decision, guest key, latency_ms) tuples.
+    Returns AccessRollup dicts, one per (checkpoint, hour), computed with numpy.
+    """
+    if not rows:
+        return []
+    cp, ts, decision, guest, latency = zip(*rows)
+    cp = np.array([c or 0 for c in cp], dtype=np.int64)
+    hours = np.array(ts, dtype="datetime64[h]")
+    allow = np.array([d == "allow" for d in decision])
+    lat = np.array([np.nan if v is None else v for v in latency], dtype=np.float64)
+
+    # group = (checkpoint, hour)
+    keys = np.rec.fromarrays([cp, hours.astype(np.int64)])
+    groups, inverse = np.unique(keys, return_inverse=True)
+    n = len(groups)
+    allow_n = np.bincount(inverse, weights=allow, minlength=n).astype(int)
+    total_n = np.bincount(inverse, minlength=n)
+
+    # distinct guests per group: unique (group, guest) pairs, then count per group
+    _, guest_code = np.unique(np.array([g or "" for g in guest], dtype=object).astype(str), return_inverse=True)
+    has_guest = np.array([bool(g) for g in guest])
+    pairs = np.unique(inverse[has_guest].astype(np.int64) * (guest_code.max() + 1) + guest_code[has_guest])
+    uniq_n = np.bincount(pairs // (guest_code.max() + 1), minlength=n)
+
+    # latency percentiles: sort by (group, latency), slice per group
+    order = np.lexsort((lat, inverse))
+    bounds = np.searchsorted(inverse[order], np.arange(n + 1))
+    now = datetime.utcnow()
+    out = []
+    for i in range(n):
+        sample = lat[order[bounds[i]:bounds[i + 1]]]
+        sample = sample[~np.isnan(sample)]
+        p50, p95 = (np.percentile(sample, [50, 95]) if sample.size else (None, None))
+        out.append({
+            "checkpoint_id": int(groups[i][0]),
+            "hour": groups[i][1].astype("datetime64[h]").astype(datetime),
+            "allow_count": int(allow_n[i]),
+            "deny_count": int(total_n[i] - allow_n[i]),
+            "unique_guests": int(uniq_n[i]),
+            "p50_ms": None if p50 is None else int(round(p50)),
+            "p95_ms": None if p95 is None else int(round(p95)),
+            "updated_at": now,
+        })
+    return out
+
+
+def recompute(start: datetime, end: datetime, checkpoint_ids=None) -> int:
+    """Rebuild rollup rows for hours in [start, end), optionally for some checkpoints only."""
+    start, end = floor_hour(start), floor_hour(end - timedelta(microseconds=1)) + HOUR
+    q = db.session.query(
+        AccessLog.checkpoint_id, AccessLog.timestamp, AccessLog.decision,
+        AccessLog.guest_id, AccessLog.national_id_number, AccessLog.latency_ms,
+    ).filter(AccessLog.timestamp >= start, AccessLog.timestamp < end)
+    stale = delete(AccessRollup).where(AccessRollup.hour >= start, AccessRollup.hour < end)
+    if checkpoint_ids is not None:
+        cps = list(checkpoint_ids)
+        q = q.filter(func.coalesce(AccessLog.checkpoint_id, 0).in_(cps))
+        stale = stale.where(AccessRollup.checkpoint_id.in_(cps))
+
+    # a guest is their Guest row when known, else the scanned ID number
+    rows = _aggregate([
+        (cp, ts, dec, f"g{gid}" if gid else (f"n{nid}" if nid else None), lat)
+        for cp, ts, dec, gid, nid, lat in q
+    ])
+    try:
+        db.session.execute(stale)
+        if rows:
+            db.session.execute(insert(AccessRollup), rows)
+        db.session.commit()
+    except IntegrityError:
+        # another worker rebuilt the same hours concurrently; its rows are equivalent
+        db.session.rollback()
+    return len(rows)
+
+
+def catch_up(now: datetime | None = None) -> int:
+    """
+    Periodic/lazy catch-up: rebuild from the newest rolled-up hour (always
+    redone, it may have been partial) up to the current hour, a week at a time.
+    """
+    now = now or datetime.utcnow()
+    newest = db.session.query(func.max(AccessRollup.hour)).scalar()
+    if newest is None:
+        newest = db.session.query(func.min(AccessLog.timestamp)).scalar()
+        if newest is None:
+            return 0
+    start, end = floor_hour(newest), floor_hour(now) + HOUR
+    written = 0
+    while start < end:
+        stop = min(start + CATCH_UP_WINDOW, end)
+        written += recompute(start, stop)
+        start = stop
+    return written
+
+
+def schedule_catch_up():
+    """
+    Queue catch_up() on the background pool, at most once per CATCH_UP_EVERY
+    per process. For pages that read rollups; `flask rollups` on a timer is
+    what keeps them current.
+    """
+    if _catch_up_queued.get("catch_up"):
+        return
+    _catch_up_queued.set("catch_up", True)
+    enqueue(catch_up)
+
+
+# ---------- incremental updates ----------
+_pending: set[int] = set()
+_pending_lock = threading.Lock()
+_scheduled = False
+
+
+@on_write(AccessLog)
+def _queue_rollup(model, ids):
+    """New scans mark their (checkpoint, hour) stale; a background job rebuilds just those."""
+    global _scheduled
+    if ids is None:
+        return  # bulk statements are imports/retention deletes; catch_up covers inserts
+    with _pending_lock:
+        _pending.update(i for i in ids if i is not None)
+        if _scheduled or not _pending:
+            return
+        _scheduled = True
+    enqueue(_flush_pending)
+
+
+def _flush_pending():
+    global _scheduled
+    try:
+        while True:
+            with _pending_lock:
+                ids = list(_pending)
+                _pending.clear()
+                if not ids:
+                    _scheduled = False
+                    return
+            touched: dict[int, set] = {}
+            for cp, ts in db.session.query(AccessLog.checkpoint_id, AccessLog.timestamp).filter(AccessLog.id.in_(ids)):
+                if ts is not None:
+                    touched.setdefault(cp or 0, set()).add(floor_hour(ts))
+            for cp, hours in touched.items():
+                recompute(min(hours), max(hours) + HOUR, [cp])
+    except Exception:
+        with _pending_lock:
+            _scheduled = False  # let the next scan reschedule; catch_up fills any gap
+        raise
+
+
+# ---------- analytics ----------
+def _local_offset() -> np.timedelta64:
+    """Rollups are UTC; reports are read in local time (fixed offset, no DST in Nairobi)."""
+    off = datetime.now(pytz.timezone(Config.TIMEZONE)).utcoffset() or timedelta(0)
+    return np.timedelta64(int(off.total_seconds() // 60), "m")
+
+
+def gate_load(checkpoint_ids, start: datetime, end: datetime, spike_sigma: float = 3.0,
+              min_volume: int = 10) -> dict:
+    """
+    Staffing view over rollups in [start, end): 7x24 day-of-week/hour heatmap
+    (mean scans per hour), busiest 3-hour windows, deny-rate spikes and each
+    day's worst hourly p95 latency. All numpy over one column load.
+    """
+    q = db.session.query(
+        AccessRollup.hour, AccessRollup.allow_count, AccessRollup.deny_count, AccessRollup.p95_ms
+    ).filter(AccessRollup.hour >= start, AccessRollup.hour < end)
+    if checkpoint_ids is not None:
+        q = q.filter(AccessRollup.checkpoint_id.in_(list(checkpoint_ids)))
+    rows = q.all()
+    result = {"hours": 0, "total": 0, "heatmap": [[0.0] * 24 for _ in range(7)],
+              "peaks": [], "spikes": [], "latency": []}
+    if not rows:
+        return result
+
+    hour, allow, deny, p95 = zip(*rows)
+    local = np.array(hour, dtype="datetime64[m]") + _local_offset()
+    allow = np.array(allow, dtype=np.int64)
+    deny = np.array(deny, dtype=np.int64)
+    p95 = np.array([np.nan if v is None else v for v in p95], dtype=np.float64)
+
+    # several checkpoints share an hour: merge them into one series per local hour
+    hrs, inv = np.unique(local.astype("datetime64[h]"), return_inverse=True)
+    a = np.bincount(inv, weights=allow)
+    d = np.bincount(inv, weights=deny)
+    total = a + d
+
+    # heatmap: mean per (weekday, hour) over the weeks in range (1970-01-01 was a Thursday)
+    days = hrs.astype("datetime64[D]").astype(np.int64)
+    dow = (days + 3) % 7  # Monday = 0
+    hod = hrs.astype(np.int64) % 24
+    cell = dow * 24 + hod
+    weeks = max(1.0, (np.datetime64(end, "D") - np.datetime64(start, "D")).astype(int) / 7.0)
+    heat = np.bincount(cell, weights=total, minlength=168) / weeks
+
+    # busiest 3-hour windows across the week (wrapping Sunday night into Monday)
+    window = np.convolve(np.concatenate([heat, heat[:2]]), np.ones(3), mode="valid")[:168]
+    names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    peaks = []
+    for idx in np.argsort(window)[::-1]:
+        if any(abs(int(idx) - p) < 3 or abs(int(idx) - p) > 165 for p in [x["cell"] for x in peaks]):
+            continue
+        peaks.append({"cell": int(idx), "day": names[idx // 24], "from_hour": int(idx % 24),
+                      "avg_scans": round(float(window[idx]), 1)})
+        if len(peaks) == 5:
+            break
+
+    # deny-rate spikes: hours with enough volume whose rate is > mean + k*std
+    busy = total >= min_volume
+    spikes = []
+    if busy.sum() >= 2:
+        rate = np.divide(d, total, out=np.zeros_like(d), where=total > 0)
+        mu, sigma = rate[busy].mean(), rate[busy].std()
+        hit = np.flatnonzero(busy & (rate > mu + spike_sigma * max(sigma, 1e-9)))
+        for i in hit[np.argsort(rate[hit])[::-1]][:20]:
+            spikes.append({"hour": hrs[i].astype(datetime).isoformat(), "deny_rate": round(float(rate[i]), 3),
+                           "scans": int(total[i]), "baseline": round(float(mu), 3)})
+
+    # daily worst-case latency: the max of hourly p95s (a true daily p95 needs the raw log)
+    day_keys, day_inv = np.unique(local.astype("datetime64[D]"), return_inverse=True)
+    lat = np.full(len(day_keys), np.nan)
+    valid = ~np.isnan(p95)
+    np.fmax.at(lat, day_inv[valid], p95[valid])
+
+    result.update(
+        hours=int(len(hrs)),
+        total=int(total.sum()),
+        deny_rate=round(float(d.sum() / max(total.sum(), 1)), 3),
+        heatmap=np.round(heat.reshape(7, 24), 1).tolist(),
+        heat_max=float(heat.max()),
+        peaks=peaks,
+        spikes=spikes,
+        latency=[{"day": str(k), "max_hourly_p95_ms": None if np.isnan(v) else int(v)} for k, v in zip(day_keys, lat)],
+    )
+    return result
@@ -0,0 +1,84 @@
+# utils/scan_cards.py
+import os
+
+from models import db, Luggage, Booking, Room, Guest, Property
+from utils.cache import TTLCache
+from utils.write_hooks import on_write
+
+# qr_token -> display card for the luggage exit check; status is as of the last commit
+_cards = TTLCache(ttl=float(os.getenv("SCAN_CARD_TTL", "900")), maxsize=int(os.getenv("SCAN_CARD_MAX", "20000")))
+# luggage id -> qr_token, so row-level invalidation doesn't need the token
+_tokens: dict[int, str] = {}
+
+
+def _query():
+    return (
+        db.session.query(
+            Luggage.id, Luggage.qr_token, Luggage.label, Luggage.size, Luggage.photo_path, Luggage.status,
+            Luggage.host_id,
+            Booking.id.label("booking_id"), Booking.check_in, Booking.check_out, Booking.guest_id,
+            Guest.full_name, Room.name.label("room"), Property.id.label("property_id"),
+            Property.name.label("property"),
+        )
+        .join(Booking, Luggage.booking_id == Booking.id)
+        .join(Room, Booking.room_id == Room.id)
+        .join(Guest, Booking.guest_id == Guest.id)
+        .join(Property, Room.property_id == Property.id)
+    )
+
+
+def get(token: str) -> dict | None:
+    """The card for a luggage QR token: a cache hit, or one projection query on a miss."""
+    card = _cards.get(token)
+    if card is not None:
+        return card
+    r = _query().filter(Luggage.qr_token == token).first()
+    if r is None:
+        return None  # unknown tokens aren't cached; a flood of junk can't evict real cards
+    card = {
+        "luggage_id": r.id, "label": r.label, "size": r.size, "photo_path": r.photo_path, "status": r.status,
+        "host_id": r.host_id,
+        "booking_id": r.booking_id, "guest_id": r.guest_id, "guest_name": r.full_name, "room": r.room,
+        "property_id": r.property_id, "property": r.property,
+        "check_in": r.check_in, "check_out": r.check_out,
+    }
+    _cards.set(token, card)
+    if len(_tokens) > 2 * _cards.maxsize:
+        # drop mappings for cards the LRU has already evicted
+        _tokens.clear()
+        _tokens.update({c["luggage_id"]: t for t, c in _cards.items()})
+    _tokens[r.id] = token
+    return card
+
+
+def stats() -> dict:
+    return {"cards": len(_cards), "tokens": len(_tokens)}
+
+
+# ---------- invalidation ----------
+@on_write(Luggage)
+def _drop_luggage(model, ids):
+    if ids is None:
+        _cards.clear()
+        _tokens.clear()
+        return
+    for lid in ids:
+        token = _tokens.pop(lid, None)
+        if token:
+            _cards.pop(token)
+
+
+@on_write(Booking, Guest)
+def _drop_by_parent(model, ids):
+    if ids is None:
+        _cards.clear()
+        return
+    field = "booking_id" if model is Booking else "guest_id"
+    for token, card in _cards.items():
+        if card[field] in ids:
+            _cards.pop(token)
+
+
+@on_write(Room, Property)
+def _drop_all(model, ids):
+    _cards.clear()
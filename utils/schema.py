@@ -0,0 +1,94 @@
+# utils/schema.py
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import Index, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, SchemaStep
+
+
+def _column_ddl(col, dialect) -> tuple[str, bool]:
+    """ADD COLUMN body for a model column, and whether it needs a NOT NULL backfill afterwards."""
+    ddl = f"{dialect.identifier_preparer.quote(col.name)} {col.type.compile(dialect=dialect)}"
+    if col.server_default is not None:
+        default = col.server_default.arg
+        default = default.text if hasattr(default, "text") else f"'{default}'"
+        return f"{ddl} DEFAULT {default}" + ("" if col.nullable else " NOT NULL"), False
+    scalar = col.default is not None and col.default.is_scalar
+    if not col.nullable and scalar:
+        return f"{ddl} DEFAULT {_literal(col.default.arg)} NOT NULL", False
+    # NOT NULL with a Python-side (callable) default: added nullable, filled below
+    return ddl, not col.nullable
+
+
+def _literal(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def upgrade() -> list[str]:
+    """
+    Bring an existing database up to the models: db.create_all() only creates
+    missing tables, so add missing columns and indexes here. Idempotent, and
+    cheap when nothing is missing (one inspector pass). Returns what it did.
+    """
+    engine = db.engine
+    dialect = engine.dialect
+    quote = dialect.identifier_preparer.quote
+    insp = inspect(engine)
+    existing = set(insp.get_table_names())
+    done = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        have = {c["name"] for c in insp.get_columns(table.name)}
+        with engine.begin() as conn:
+            for col in table.columns:
+                if col.name in have:
+                    continue
+                ddl, backfill = _column_ddl(col, dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {ddl}"))
+                if backfill:
+                    # only callable defaults reach here (timestamps); CURRENT_TIMESTAMP works on sqlite and MySQL
+                    conn.execute(text(
+                        f"UPDATE {quote(table.name)} SET {quote(col.name)} = CURRENT_TIMESTAMP "
+                        f"WHERE {quote(col.name)} IS NULL"
+                    ))
+                done.append(f"column {table.name}.{col.name}")
+
+        names = {ix["name"] for ix in insp.get_indexes(table.name)}
+        names |= {uc["name"] for uc in insp.get_unique_constraints(table.name) if uc.get("name")}
+        unique_cols = {tuple(uc["column_names"]) for uc in insp.get_unique_constraints(table.name)}
+        unique_cols |= {tuple(ix["column_names"]) for ix in insp.get_indexes(table.name) if ix.get("unique")}
+        missing = [ix for ix in table.indexes if ix.name not in names]
+        # column-level unique=True is inline in CREATE TABLE; existing tables get it as a unique index
+        missing += [
+            Index(f"uq_{table.name}_{col.name}", col, unique=True)
+            for col in table.columns if col.unique and (col.name,) not in unique_cols
+        ]
+        for ix in missing:
+            try:
+                with engine.begin() as conn:
+                    ix.create(conn)
+            except SQLAlchemyError as e:
+                # e.g. duplicates already in a column that is now unique: keep booting, say why
+                current_app.logger.warning("Could not create index %s: %s", ix.name, e)
+                continue
+            done.append(f"index {ix.name}")
+    if done:
+        current_app.logger.info("Schema upgraded: %s", ", ".join(done))
+    return done
+
+
+def run_once(name: str, fn) -> bool:
+    """Run a one-off data step (e.g. re-deriving a stored key) unless this database already has."""
+    if db.session.get(SchemaStep, name):
+        return False
+    fn()
+    db.session.add(SchemaStep(name=name, applied_at=datetime.utcnow()))
+    db.session.commit()
+    return True
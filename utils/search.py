@@ -0,0 +1,418 @@
+# utils/search.py
+import heapq
+import os
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import func
+
+from models import db, Booking, Guest, Luggage, Property, Room
+from utils.tasks import enqueue
+from utils.write_hooks import on_write
+
+KINDS = ("guest", "booking", "luggage")
+_KIND_CODE = {k: i for i, k in enumerate(KINDS)}
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+ANY_HOST = "*"  # owner of bookings on rooms with no property, which every host's booking list shows
+
+
+def normalize(text) -> str:
+    """Lowercase, accents folded, punctuation collapsed to single spaces."""
+    if not text:
+        return ""
+    text = str(text)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def _compact(text) -> str:
+    """Identifier form: 'KDA 123A' -> 'kda123a', '+254 712-345' -> '254712345'."""
+    return normalize(text).replace(" ", "")
+
+
+def _phone_variants(phone) -> list[str]:
+    digits = _compact(phone)
+    out = [digits] if digits else []
+    if digits.startswith("254") and len(digits) > 9:
+        out.append("0" + digits[3:])  # people type the local form
+    return out
+
+
+@lru_cache(maxsize=65536)
+def _word_grams(word: str) -> tuple[str, ...]:
+    """Trigrams of a word plus '^a'/'^ab' keys for 1-2 character prefix lookups."""
+    keys = {"^" + word[:1], "^" + word[:2]}
+    keys.update(word[i:i + 3] for i in range(len(word) - 2))
+    return tuple(keys)
+
+
+# ---------- documents ----------
+def _booking_subtitle(r):
+    where = " · ".join(x for x in (r.property, r.room and f"Room {r.room}") if x)
+    return f"{where} · {r.check_in:%d %b} → {r.check_out:%d %b %Y}"
+
+
+# kind -> (title, subtitle, extra data), formatted only for results actually shown
+_FORMAT = {
+    "booking": (
+        lambda r: r.full_name,
+        _booking_subtitle,
+        lambda r: {"status": r.status, "check_in": r.check_in.isoformat(), "check_out": r.check_out.isoformat(),
+                   "room": r.room, "property": r.property, "guest_id": r.guest_id},
+    ),
+    "guest": (
+        lambda r: r.full_name,
+        lambda r: " · ".join(x for x in (r.national_id_number, r.phone, r.email) if x),
+        lambda r: {"booking_id": r.last_booking},
+    ),
+    "luggage": (
+        lambda r: r.label,
+        lambda r: " · ".join(x for x in (r.full_name or "Host item", r.status) if x),
+        lambda r: {"status": r.status, "booking_id": r.booking_id},
+    ),
+}
+
+
+class Doc:
+    """One searchable projection row plus its normalized text and the hosts allowed to see it."""
+
+    __slots__ = ("kind", "id", "owners", "text", "ts", "row")
+
+    def __init__(self, kind, row, owners, fields, ts):
+        self.kind = kind
+        self.id = row.id
+        self.owners = frozenset(o for o in owners if o)
+        self.text = normalize(" ".join(str(f) for f in fields if f))
+        self.ts = ts or datetime.min  # recency tiebreak
+        self.row = row
+
+    @property
+    def key(self) -> int:
+        return self.id * 4 + _KIND_CODE[self.kind]
+
+    @property
+    def title(self):
+        return _FORMAT[self.kind][0](self.row)
+
+    @property
+    def subtitle(self):
+        return _FORMAT[self.kind][1](self.row)
+
+    @property
+    def data(self) -> dict:
+        return _FORMAT[self.kind][2](self.row)
+
+    def as_dict(self) -> dict:
+        return {"kind": self.kind, "id": self.id, "title": self.title, "subtitle": self.subtitle, **self.data}
+
+
+# ---------- loaders (one projection query per kind) ----------
+def _booking_query():
+    return (
+        db.session.query(
+            Booking.id, Booking.status, Booking.check_in, Booking.check_out, Booking.vehicle_plate,
+            Booking.qr_token, Booking.guest_id, Guest.full_name, Guest.phone, Guest.email,
+            Guest.national_id_number, Room.name.label("room"), Property.name.label("property"),
+            Property.owner_id,
+        )
+        .join(Guest, Guest.id == Booking.guest_id)
+        .join(Room, Room.id == Booking.room_id)
+        .outerjoin(Property, Property.id == Room.property_id)
+    )
+
+
+def _booking_doc(r) -> Doc:
+    return Doc("booking", r, (r.owner_id or ANY_HOST,),
+               (r.full_name, r.national_id_number, r.email, r.vehicle_plate, _compact(r.vehicle_plate),
+                r.room, r.qr_token, *_phone_variants(r.phone)),
+               r.check_in)
+
+
+def _guest_query(guest_ids=None):
+    """Guests with their latest booking id (where a guest hit links to)."""
+    last = (db.session.query(Booking.guest_id, func.max(Booking.id).label("last_booking"))
+            .group_by(Booking.guest_id))
+    if guest_ids is not None:
+        last = last.filter(Booking.guest_id.in_(guest_ids))
+    last = last.subquery()
+    q = (db.session.query(Guest.id, Guest.full_name, Guest.phone, Guest.email,
+                          Guest.national_id_number, Guest.created_at, last.c.last_booking)
+         .outerjoin(last, last.c.guest_id == Guest.id))
+    return q if guest_ids is None else q.filter(Guest.id.in_(guest_ids))
+
+
+def _guest_owners(guest_ids=None) -> dict[int, set]:
+    """guest_id -> owner ids of the properties they have stayed at (ANY_HOST for property-less rooms)."""
+    q = (db.session.query(Booking.guest_id, Property.owner_id).distinct()
+         .join(Room, Room.id == Booking.room_id)
+         .outerjoin(Property, Property.id == Room.property_id))
+    if guest_ids is not None:
+        q = q.filter(Booking.guest_id.in_(guest_ids))
+    out: dict[int, set] = {}
+    for gid, owner in q:
+        out.setdefault(gid, set()).add(owner or ANY_HOST)
+    return out
+
+
+def _guest_doc(r, owners) -> Doc:
+    return Doc("guest", r, owners.get(r.id, ()),
+               (r.full_name, r.national_id_number, r.email, *_phone_variants(r.phone)),
+               r.created_at)
+
+
+def _luggage_query():
+    return (
+        db.session.query(Luggage.id, Luggage.label, Luggage.status, Luggage.qr_token, Luggage.created_at,
+                         Luggage.host_id, Luggage.booking_id, Guest.full_name, Property.owner_id)
+        .outerjoin(Booking, Booking.id == Luggage.booking_id)
+        .outerjoin(Guest, Guest.id == Booking.guest_id)
+        .outerjoin(Room, Room.id == Booking.room_id)
+        .outerjoin(Property, Property.id == Room.property_id)
+    )
+
+
+def _luggage_doc(r) -> Doc:
+    return Doc("luggage", r, (r.host_id, r.owner_id), (r.label, r.full_name, r.qr_token), r.created_at)
+
+
+def _load(kind, ids=None):
+    """Docs of one kind: all of them, or just `ids`."""
+    if kind == "booking":
+        q = _booking_query()
+        return map(_booking_doc, q if ids is None else q.filter(Booking.id.in_(ids)))
+    if kind == "luggage":
+        q = _luggage_query()
+        return map(_luggage_doc, q if ids is None else q.filter(Luggage.id.in_(ids)))
+    owners = _guest_owners(ids)
+    return (_guest_doc(r, owners) for r in _guest_query(ids))
+
+
+def _token_score(tok: str, padded: str) -> int:
+    """3 = whole word, 2 = word prefix, 1 = inside a word, 0 = absent. padded is ' text '."""
+    if " " + tok + " " in padded:
+        return 3
+    if " " + tok in padded:
+        return 2
+    return 1 if tok in padded else 0
+
+
+# ---------- the index ----------
+class _Postings:
+    """word -> doc keys, and trigram/prefix key -> words. The vocabulary is far smaller than the docs."""
+
+    def __init__(self):
+        self.docs: dict[int, Doc] = {}
+        self.word_docs: dict[str, set[int]] = {}
+        self.gram_words: dict[str, set[str]] = {}
+
+    def add(self, doc: Doc):
+        self.remove(doc.key)
+        self.docs[doc.key] = doc
+        for w in set(doc.text.split()):
+            keys = self.word_docs.get(w)
+            if keys is None:
+                keys = self.word_docs[w] = set()
+                for g in _word_grams(w):
+                    self.gram_words.setdefault(g, set()).add(w)
+            keys.add(doc.key)
+
+    def remove(self, key):
+        old = self.docs.pop(key, None)
+        if old is None:
+            return
+        for w in set(old.text.split()):
+            keys = self.word_docs.get(w)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.word_docs[w]
+                for g in _word_grams(w):
+                    words = self.gram_words.get(g)
+                    if words is not None:
+                        words.discard(w)
+                        if not words:
+                            del self.gram_words[g]
+
+    def words_for(self, tok: str) -> set[str]:
+        """Vocabulary words containing tok (tokens under 3 characters match word prefixes)."""
+        if len(tok) < 3:
+            return self.gram_words.get("^" + tok, set())
+        grams = sorted({tok[i:i + 3] for i in range(len(tok) - 2)}, key=lambda g: len(self.gram_words.get(g, ())))
+        words = self.gram_words.get(grams[0], set())
+        for g in grams[1:]:
+            if not words:
+                break
+            words = words & self.gram_words.get(g, set())
+        # trigrams only prove the pieces are present; check the whole token
+        return {w for w in words if tok in w} if len(tok) > 3 else words
+
+
+class SearchIndex:
+    """
+    In-process substring index over guests, bookings and luggage.
+
+    A query token of 3+ characters finds vocabulary words containing it via
+    trigram postings; shorter tokens match word prefixes. Matching words map
+    to documents, so a lookup touches the vocabulary rather than the rows.
+    Writes are queued by on_write and patched in before the next query; bulk
+    statements and SEARCH_MAX_AGE trigger a rebuild (in the background once an
+    index exists), which also picks up writes made by other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._p = _Postings()
+        self._dirty = {k: set() for k in KINDS}
+        self._replay = {k: set() for k in KINDS}
+        self._built_at = None
+        self._stale = False
+        self._rebuilding = False
+        self.max_age = float(os.getenv("SEARCH_MAX_AGE", "900"))
+
+    # --- write side ---
+    def mark(self, kind, ids):
+        with self._lock:
+            if ids is None:
+                self._stale = True
+            else:
+                self._dirty[kind] |= ids
+
+    def rebuild(self):
+        started = time.monotonic()
+        with self._lock:
+            self._stale = False  # writes from here on are re-applied on top of the new snapshot
+        fresh = _Postings()
+        for kind in KINDS:
+            for doc in _load(kind):
+                fresh.add(doc)
+        with self._lock:
+            self._p = fresh
+            self._built_at = started
+            # patches applied to the old index while we were loading may predate our snapshot
+            for kind, ids in self._replay.items():
+                self._dirty[kind] |= ids
+                ids.clear()
+
+    def _rebuild_async(self):
+        try:
+            self.rebuild()
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def _apply_dirty(self):
+        guest_ids, booking_ids, luggage_ids = (set(self._dirty[k]) for k in KINDS)
+        for kind in KINDS:
+            if self._rebuilding:
+                self._replay[kind] |= self._dirty[kind]
+            self._dirty[kind].clear()
+        if not (guest_ids or booking_ids or luggage_ids):
+            return
+        # a guest's text lives in their bookings and luggage; a booking moves the guest's owners
+        if guest_ids:
+            booking_ids |= {i for (i,) in db.session.query(Booking.id).filter(Booking.guest_id.in_(guest_ids))}
+        if booking_ids:
+            guest_ids |= {g for (g,) in db.session.query(Booking.guest_id).filter(Booking.id.in_(booking_ids))}
+            luggage_ids |= {i for (i,) in db.session.query(Luggage.id).filter(Luggage.booking_id.in_(booking_ids))}
+
+        for kind, ids in (("booking", booking_ids), ("luggage", luggage_ids), ("guest", guest_ids)):
+            if not ids:
+                continue
+            found = set()
+            for doc in _load(kind, list(ids)):
+                self._p.add(doc)
+                found.add(doc.id)
+            for gone in ids - found:
+                self._p.remove(gone * 4 + _KIND_CODE[kind])
+
+    def _ready(self):
+        if self._built_at is None:
+            # first build: concurrent queries wait for it, writers only queue ids meanwhile
+            with self._build_lock:
+                if self._built_at is None:
+                    self.rebuild()
+        with self._lock:
+            if (self._stale or time.monotonic() - self._built_at > self.max_age) and not self._rebuilding:
+                self._rebuilding = True
+                enqueue(self._rebuild_async)
+            self._apply_dirty()
+
+    def warm(self):
+        """Build now (from a background job) so the first query doesn't pay for it."""
+        self._ready()
+
+    # --- read side ---
+    def search(self, q, owner_ids=None, kinds=KINDS, where=None, limit=10) -> list[Doc]:
+        """
+        Best `limit` docs matching every token of q. owner_ids=None means
+        unscoped (admin), otherwise docs owned by one of them or by ANY_HOST;
+        `where` is an optional predicate on the Doc.
+        Ranked by how well each token hits (whole word > prefix > infix), then recency.
+        """
+        tokens = list(dict.fromkeys(normalize(q).split()))
+        if not tokens:
+            return []
+        self._ready()
+        with self._lock:
+            p = self._p
+            # drive from the most selective token; the rest are checked against the doc text
+            matched = []
+            for tok in tokens:
+                words = p.words_for(tok)
+                if not words:
+                    return []
+                matched.append((sum(len(p.word_docs[w]) for w in words), tok, words))
+            matched.sort(key=lambda m: m[0])
+            docs = []
+            seen = set()
+            for w in matched[0][2]:
+                for k in p.word_docs[w]:
+                    if k in seen:
+                        continue
+                    seen.add(k)
+                    d = p.docs[k]
+                    padded = " " + d.text + " "
+                    score = 0
+                    for _, tok, _ in matched:
+                        hit = _token_score(tok, padded)
+                        if not hit:
+                            break
+                        score += hit
+                    else:
+                        docs.append((d, score))
+
+        kinds = set(kinds)
+        owners = None if owner_ids is None else set(owner_ids) | {ANY_HOST}
+        scored = [
+            (score, d.ts, d.key, d) for d, score in docs
+            if d.kind in kinds
+            and (owners is None or not owners.isdisjoint(d.owners))
+            and (where is None or where(d))
+        ]
+        return [d for _, _, _, d in heapq.nlargest(limit, scored)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"docs": len(self._p.docs), "words": len(self._p.word_docs),
+                    "age_s": None if self._built_at is None else round(time.monotonic() - self._built_at)}
+
+
+index = SearchIndex()
+
+
+@on_write(Guest, Booking, Luggage)
+def _queue_reindex(model, ids):
+    index.mark(model.__tablename__, ids)
+
+
+@on_write(Room, Property)
+def _structure_changed(model, ids):
+    index.mark(None, None)  # renames and ownership moves touch many docs
@@ -0,0 +1,151 @@
+# utils/storage.py
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app, abort, send_from_directory, Response
+from sqlalchemy import insert
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import safe_join
+
+from models import db, StoredFile
+
+# How authorised downloads leave the app:
+#   local    - Flask streams the file (dev / no front proxy)
+#   accel    - nginx: X-Accel-Redirect to an `internal` location, e.g.
+#              location /_protected/uploads/ { internal; alias /srv/app/uploads/; }
+#   sendfile - Apache mod_xsendfile / lighttpd: X-Sendfile with the absolute path
+UPLOAD_SERVE = os.getenv("UPLOAD_SERVE", "local").lower()
+UPLOAD_ACCEL_PREFIX = os.getenv("UPLOAD_ACCEL_PREFIX", "/_protected/uploads/")
+IMMUTABLE_MAX_AGE = 31536000
+
+_BLOB = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]{1,5}$")
+
+Blob = namedtuple("Blob", "sha256 path size")
+
+
+def uploads_root() -> str:
+    return os.path.join(current_app.root_path, "uploads")
+
+
+def bucket_dir(bucket: str) -> str:
+    return os.path.join(uploads_root(), bucket)
+
+
+def blob_relpath(sha256: str, ext: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+
+
+def is_blob(relpath: str) -> bool:
+    return bool(_BLOB.match(relpath))
+
+
+# ---------- writing ----------
+def write_blob(root: str, data: bytes, ext: str) -> Blob:
+    """
+    Store bytes under root/<sha[:2]>/<sha[2:4]>/<sha>.<ext>; identical content
+    is written once. Touches no app or DB state, so it is safe on map_parallel.
+    """
+    sha = hashlib.sha256(data).hexdigest()
+    rel = blob_relpath(sha, ext)
+    path = os.path.join(root, rel)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    return Blob(sha, rel, len(data))
+
+
+def _insert_ignore():
+    """INSERT that skips rows already present for (bucket, sha256), in this database's dialect."""
+    table = StoredFile.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=["bucket", "sha256"])
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing(index_elements=["bucket", "sha256"])
+    if dialect in ("mysql", "mariadb"):
+        return mysql.insert(table).prefix_with("IGNORE")
+    return None
+
+
+def register(bucket: str, blobs, content_type: str | None = None) -> int:
+    """
+    Record metadata for blobs not yet known in `bucket` (one IN query, one
+    multi-row insert). Joins the caller's transaction; the caller commits.
+    Two requests storing the same file at once both succeed: the insert
+    skips rows that appeared after the IN query. Returns how many rows it tried.
+    """
+    blobs = {b.sha256: b for b in blobs}
+    if not blobs:
+        return 0
+    known = {
+        sha for (sha,) in db.session.query(StoredFile.sha256)
+        .filter(StoredFile.bucket == bucket, StoredFile.sha256.in_(list(blobs)))
+    }
+    now = datetime.utcnow()
+    rows = [
+        {"bucket": bucket, "sha256": b.sha256, "path": b.path, "size": b.size,
+         "content_type": content_type or mimetypes.guess_type(b.path)[0], "created_at": now}
+        for sha, b in blobs.items() if sha not in known
+    ]
+    if not rows:
+        return 0
+    stmt = _insert_ignore()
+    if stmt is not None:
+        db.session.execute(stmt, rows)
+        return len(rows)
+    # no insert-ignore here: a savepoint per row, so a lost race doesn't abort the caller's transaction
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(StoredFile.__table__), [row])
+        except IntegrityError:
+            pass  # another request registered the same file first
+    return len(rows)
+
+
+def put(bucket: str, data: bytes, ext: str, content_type: str | None = None) -> Blob:
+    """write_blob() + register() for a single upload."""
+    blob = write_blob(bucket_dir(bucket), data, ext)
+    register(bucket, [blob], content_type)
+    return blob
+
+
+# ---------- serving ----------
+def send(bucket: str, relpath: str, immutable: bool = False, max_age: int = 0):
+    """
+    Hand an already-authorised file to the front proxy (or stream it locally).
+    Content-addressed files are `immutable`; they're still `private` because
+    every route in front of this checks who is asking.
+    """
+    folder = bucket_dir(bucket)
+    full = safe_join(folder, relpath)
+    if full is None or not os.path.isfile(full):
+        abort(404)
+
+    if UPLOAD_SERVE == "accel":
+        resp = Response(mimetype=mimetypes.guess_type(full)[0] or "application/octet-stream")
+        resp.headers["X-Accel-Redirect"] = f"{UPLOAD_ACCEL_PREFIX.rstrip('/')}/{bucket}/{relpath}"
+    elif UPLOAD_SERVE == "sendfile":
+        resp = Response(mimetype=mimetypes.guess_type(full)[0] or "application/octet-stream")
+        resp.headers["X-Sendfile"] = os.path.abspath(full)
+    else:
+        resp = send_from_directory(folder, relpath)
+
+    resp.cache_control.private = True
+    if immutable or max_age:
+        resp.cache_control.no_cache = None  # send_file's default for a file without max_age
+    if immutable:
+        resp.cache_control.max_age = IMMUTABLE_MAX_AGE
+        resp.cache_control.immutable = True
+    elif max_age:
+        resp.cache_control.max_age = max_age
+    return resp
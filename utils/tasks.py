@@ -0,0 +1,55 @@
+# utils/tasks.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_request_context, request
+
+# Two small pools: one for fire-and-forget jobs (emails, etc.) and one for
+# short CPU/IO bursts we wait on inside a request (QR rendering, thumbnails).
+_task_pool = None
+_render_pool = None
+
+
+def _tasks() -> ThreadPoolExecutor:
+    global _task_pool
+    if _task_pool is None:
+        workers = int(os.getenv("TASK_WORKERS", "4"))
+        _task_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="task")
+    return _task_pool
+
+
+def _renderers() -> ThreadPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        workers = int(os.getenv("RENDER_WORKERS", str(min(8, (os.cpu_count() or 2) + 2))))
+        _render_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+    return _render_pool
+
+
+def enqueue(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) on the background pool.
+    The job gets its own app context (and a request context with the caller's
+    host URL, so url_for(..., _external=True) keeps working in emails).
+    Pass ids, not ORM objects — the job runs in a fresh DB session.
+    """
+    app = current_app._get_current_object()
+    base_url = request.host_url if has_request_context() else None
+
+    def _run():
+        ctx = app.test_request_context(base_url=base_url) if base_url else app.app_context()
+        with ctx:
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                app.logger.exception("Background task %s failed", getattr(fn, "__name__", fn))
+
+    return _tasks().submit(_run)
+
+
+def map_parallel(fn, items):
+    """Apply fn to every item on the render pool; returns results in input order."""
+    items = list(items)
+    if len(items) <= 1:
+        return [fn(it) for it in items]
+    return list(_renderers().map(fn, items))
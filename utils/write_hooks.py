@@ -0,0 +1,87 @@
+# utils/write_hooks.py
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# model class -> [fn(model, ids)]
+_listeners: dict[type, list] = {}
+_installed = False
+
+
+def on_write(*models):
+    """
+    Decorator: call fn(model, ids) after a commit that wrote rows of `models`.
+    ids is a set of primary keys for ORM flushes, or None when unknown
+    (bulk INSERT/UPDATE/DELETE statements) — treat None as "anything changed".
+    Statements executed with execution_options(write_hooks=False) are skipped.
+    Callbacks run in the committing process only, inside SQLAlchemy's
+    after_commit hook — keep them cheap and don't emit SQL on that session.
+    """
+    def _wrap(fn):
+        for m in models:
+            _listeners.setdefault(m, []).append(fn)
+        _install()
+        return fn
+    return _wrap
+
+
+def touch(session, model, ids):
+    """
+    Report exactly which rows a write_hooks=False statement changed, so
+    listeners get precise ids at commit instead of a "changed everything".
+    """
+    for pk in ids:
+        _mark(session, model, pk)
+
+
+def _pending(session) -> dict:
+    return session.info.setdefault("_write_hooks", {})
+
+
+def _mark(session, model, pk):
+    pending = _pending(session)
+    if pk is None:
+        pending[model] = None
+    elif pending.get(model, set()) is not None:
+        pending.setdefault(model, set()).add(pk)
+
+
+def _after_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        model = type(obj)
+        if model in _listeners:
+            _mark(session, model, getattr(obj, "id", None))
+
+
+def _do_orm_execute(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    if not state.execution_options.get("write_hooks", True):
+        return  # caller says listeners don't care (e.g. gate counters)
+    name = getattr(getattr(state.statement, "table", None), "name", None)
+    for model in _listeners:
+        if model.__table__.name == name:
+            _mark(state.session, model, None)
+
+
+def _after_commit(session):
+    pending = session.info.pop("_write_hooks", None)
+    if not pending:
+        return
+    for model, ids in pending.items():
+        for fn in _listeners.get(model, []):
+            fn(model, ids)
+
+
+def _after_rollback(session):
+    session.info.pop("_write_hooks", None)
+
+
+def _install():
+    global _installed
+    if _installed:
+        return
+    event.listen(Session, "after_flush", _after_flush)
+    event.listen(Session, "do_orm_execute", _do_orm_execute)
+    event.listen(Session, "after_commit", _after_commit)
+    event.listen(Session, "after_rollback", _after_rollback)
+    _installed = True